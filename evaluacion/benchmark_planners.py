@@ -0,0 +1,151 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Benchmark de los planificadores de path_follower sin lanzar Webots.
+Carga los mapas de generadar_mapas/ (y otros que se indiquen) y, opcionalmente, genera mapas
+nuevos de los tamaños y densidades pedidos. Para cada mapa y planificador mide el tiempo de
+planificación, los nodos expandidos, el pico de memoria y la longitud de la ruta, y escribe
+el resultado en JSON para poder comparar entre versiones.
+
+Ejemplo:
+    python evaluacion/benchmark_planners.py --sizes 500x500,1000x1000 --densities 0.1,0.2 --output bench.json
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(RAIZ, 'proyecto_webots', 'controllers', 'path_follower'))
+sys.path.insert(0, os.path.join(RAIZ, 'generadar_mapas'))
+
+from maze_planning import astar
+from planners import PLANNERS
+from distance_field import FIELD_CACHE
+from hpa import GRAPH_CACHE
+from grid_astar import CLEARANCE_CACHE
+from occupancy_map import load_occupancy
+from generate_wbt_obstacle_density import generate_maze_array
+
+# A* original (diccionarios y tuplas) como referencia, más todos los de planners.py
+BENCHMARK_PLANNERS = {'astar_reference': astar, **PLANNERS}
+
+# Función para calcular el coste de una ruta celda a celda (pasos rectos 1, diagonales √2).
+def path_cost(path):
+    cost = 0.0
+    for (a, b) in zip(path, path[1:]):
+        cost += math.sqrt(2) if a[0] != b[0] and a[1] != b[1] else 1.0
+    return cost
+
+# Función para ejecutar un planificador una vez. Devuelve la ruta (vacía si no hay) y las estadísticas.
+# Las cachés en memoria (campos de distancia, abstracciones HPA*, mapas de holgura) se vacían
+# antes para medir siempre la consulta en frío.
+def run_planner(planner, maze, start, goal):
+    FIELD_CACHE.clear()
+    GRAPH_CACHE.clear()
+    CLEARANCE_CACHE.clear()
+    stats = {}
+    path = planner(maze, start, goal, stats=stats)
+    return path, stats
+
+# Función para medir un planificador sobre un mapa: mejor tiempo de 'repeat' ejecuciones y,
+# en una ejecución aparte (tracemalloc ralentiza), el pico de memoria.
+def benchmark(name, planner, maze, start, goal, repeat=1, memory=True):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        path, stats = run_planner(planner, maze, start, goal)
+        best = min(best, time.perf_counter() - t0)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        run_planner(planner, maze, start, goal)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'planner': name,
+        'wall_time_s': best,
+        'nodes_expanded': stats.get('expanded'),
+        'peak_memory_bytes': peak,
+        'found': bool(path),
+        'path_cells': len(path),
+        'path_cost': path_cost(path),
+    }
+
+# Función para construir la lista de mapas: los ficheros indicados y los generados.
+# Cada mapa es (nombre, rejilla como lista de listas, densidad o None).
+def collect_maps(patterns, sizes, densities, seed):
+    maps = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            maps.append((os.path.relpath(path, RAIZ), load_occupancy(path).tolist(), None))
+    for size in sizes:
+        rows, cols = (int(value) for value in size.lower().split('x'))
+        for density in densities:
+            grid = generate_maze_array(rows, cols, density, seed)
+            # Inicio y meta libres, como los usa path_follower
+            grid[1, 1] = 0
+            grid[rows - 2, cols - 2] = 0
+            maps.append((f"generated_{rows}x{cols}_d{density}_s{seed}", grid.tolist(), density))
+    return maps
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark headless de los planificadores de path_follower")
+    parser.add_argument("--maps", type=str, default=os.path.join(RAIZ, 'generadar_mapas', '*.csv'),
+                        help="Patrones glob de mapas (CSV u .ogm) separados por comas")
+    parser.add_argument("--sizes", type=str, default="", help="Mapas generados: tamaños FILASxCOLUMNAS separados por comas")
+    parser.add_argument("--densities", type=str, default="0.2", help="Mapas generados: densidades separadas por comas")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los mapas generados")
+    parser.add_argument("--planners", type=str, default=",".join(BENCHMARK_PLANNERS),
+                        help="Planificadores a medir separados por comas")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeticiones por medida (se guarda el mejor tiempo)")
+    parser.add_argument("--no-memory", action="store_true", help="No medir el pico de memoria")
+    parser.add_argument("--output", type=str, default=None, help="Fichero JSON de salida (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    names = [name for name in args.planners.split(',') if name]
+    for name in names:
+        if name not in BENCHMARK_PLANNERS:
+            parser.error(f"planificador desconocido: {name} (disponibles: {', '.join(BENCHMARK_PLANNERS)})")
+    patterns = [pattern for pattern in args.maps.split(',') if pattern]
+    sizes = [size for size in args.sizes.split(',') if size]
+    densities = [float(value) for value in args.densities.split(',') if value]
+
+    results = []
+    for (map_name, maze, density) in collect_maps(patterns, sizes, densities, args.seed):
+        start = (1, 1)
+        goal = (len(maze) - 2, len(maze[0]) - 2)
+        for name in names:
+            result = benchmark(name, BENCHMARK_PLANNERS[name], maze, start, goal, args.repeat, not args.no_memory)
+            result.update({'map': map_name, 'rows': len(maze), 'cols': len(maze[0]), 'density': density,
+                           'start': list(start), 'goal': list(goal)})
+            results.append(result)
+            print(f"{map_name} {name}: {result['wall_time_s']:.4f} s, {result['nodes_expanded']} nodos, "
+                  f"{result['path_cells']} celdas", file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Barrido de los parámetros de Bug2 sin Webots. Cada combinación de parámetros (producto
+cartesiano de las listas de la línea de comandos) es un robot, y todos avanzan a la vez sobre
+el mismo mapa:
+
+- la cinemática y las colisiones, con EPuckBatch (headless/epuck_batch.py);
+- los sensores de proximidad, con EPuckSensors (headless/epuck_sensors.py);
+- la máquina de estados de Bug2, con Bug2Batch (libraries/python/bug2_state_machine.py), la
+  misma que usa bug_2_controller.py.
+
+En cada paso se avanzan solo los robots que no han terminado y a los que les queda tiempo
+simulado, igual que haría robot.step() en headless_sim.py. Cada robot usa su propio paso de
+control, así que los de paso más corto dan más pasos en el mismo tiempo simulado.
+
+Las combinaciones se ordenan por éxito (terminar a menos de GOAL_TOLERANCE de la meta), tiempo
+simulado, longitud del recorrido y colisiones. Ejemplo:
+    python evaluacion/bug2_sweep.py --prox-obst 80,100,120 --epsilon-pos 0.05,0.07,0.1 --align 0.98:1.02,0.95:1.05
+"""
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+from headless_sim import RAIZ, DEFAULT_POSE, DEFAULT_MAX_TIME
+from epuck_batch import EPuckBatch
+from epuck_model import CELL_SIZE
+from epuck_sensors import EPuckSensors
+from occupancy_map import load_occupancy
+from bug2_state_machine import DEFAULT_PARAMS, DONE, Bug2Batch, Bug2Params, heading_batch
+
+# Mapa y meta por defecto: los del mundo del proyecto y bug_2_controller.py
+DEFAULT_MAP = os.path.join(RAIZ, 'proyecto_webots', 'world', 'map.csv')
+DEFAULT_GOAL = (11.6, 5.6)
+
+# Distancia a la meta para considerar que el robot ha llegado [m] (la de compare_bug2_astar.py)
+GOAL_TOLERANCE = 0.5 * CELL_SIZE
+
+# Robots que avanzan a la vez (las combinaciones se reparten en lotes de este tamaño)
+BATCH_SIZE = 4096
+
+# Columnas de los resultados
+COLUMNS = Bug2Params._fields + ('success', 'finished', 'goal_distance_m', 'sim_time_s', 'path_length_m',
+                                'steps', 'collisions')
+
+# Función para interpretar una lista de valores separados por comas
+def parse_list(text, kind=float):
+    return [kind(value) for value in text.split(',') if value]
+
+# Función para interpretar una lista de bandas de alineación 'bajo:alto' separadas por comas
+def parse_bands(text):
+    return [tuple(float(value) for value in band.split(':')) for band in text.split(',') if band]
+
+# Función para construir las combinaciones de parámetros (producto cartesiano)
+def build_params(time_steps, velocities, thresholds, goal_tolerances, angle_tolerances, bands):
+    return [Bug2Params(time_step, velocity, threshold, goal_tolerance, angle_tolerance, low, high)
+            for time_step, velocity, threshold, goal_tolerance, angle_tolerance, (low, high)
+            in itertools.product(time_steps, velocities, thresholds, goal_tolerances, angle_tolerances, bands)]
+
+# Función para simular un lote de combinaciones a la vez. Devuelve un diccionario de columnas.
+def run_batch(grid, params, pose, goal, max_time, sensors=None, rng=None):
+    count = len(params)
+    columns = Bug2Params(*(np.array(values) for values in zip(*params)))
+    robots = EPuckBatch(grid, np.full(count, pose[0]), pose[1], pose[2])
+    sensors = sensors or EPuckSensors(grid)
+    bug2 = Bug2Batch(count, goal, columns)
+    time_step = columns.time_step.astype(np.int64)
+    max_time_ms = int(max_time * 1000)
+    steps = np.zeros(count, dtype=np.int64)
+    readings = np.zeros((count, 8))
+    while True:
+        # robot.step() devuelve -1 si el paso supera el tiempo máximo
+        active = (bug2.mode != DONE) & (robots.time_ms + time_step <= max_time_ms)
+        index = np.flatnonzero(active)
+        if not index.size:
+            break
+        robots.advance(time_step, active)
+        steps[index] += 1
+        readings[index] = sensors.readings(robots.x[index], robots.y[index], robots.theta[index], rng)
+        bug2.step(readings, robots.x, robots.y, heading_batch(robots.theta), active)
+        robots.set_velocities(bug2.left, bug2.right)
+
+    finished = bug2.mode == DONE
+    goal_distance = np.hypot(robots.x - goal[0], robots.y - goal[1])
+    results = {name: getattr(columns, name) for name in Bug2Params._fields}
+    results.update({
+        'success': finished & (goal_distance <= GOAL_TOLERANCE),
+        'finished': finished,
+        'goal_distance_m': goal_distance,
+        'sim_time_s': robots.time_ms / 1000.0,
+        'path_length_m': robots.distance,
+        'steps': steps,
+        'collisions': robots.collisions,
+    })
+    return results
+
+# Función para simular todas las combinaciones en lotes de batch_size robots.
+def run_sweep(grid, params, pose, goal, max_time, noise_seed=None, batch_size=BATCH_SIZE):
+    sensors = EPuckSensors(grid)
+    rng = None if noise_seed is None else np.random.default_rng(noise_seed)
+    parts = []
+    for first in range(0, len(params), batch_size):
+        parts.append(run_batch(grid, params[first:first + batch_size], pose, goal, max_time, sensors, rng))
+        print(f"{min(first + batch_size, len(params))}/{len(params)} combinaciones", file=sys.stderr)
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+# Orden de las combinaciones: primero las que llegan, después por tiempo, longitud y colisiones
+def ranking(results):
+    return np.lexsort((results['collisions'], results['path_length_m'], results['sim_time_s'], ~results['success']))
+
+# Función para escribir los resultados ordenados en CSV
+def write_csv(path, results, order):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        for i in order:
+            writer.writerow([results[name][i].item() for name in COLUMNS])
+
+def main():
+    parser = argparse.ArgumentParser(description="Barrido de los parámetros de Bug2 sin Webots")
+    parser.add_argument("--map", type=str, default=DEFAULT_MAP, help="Mapa (CSV u .ogm)")
+    parser.add_argument("--pose", type=str, default=",".join(str(value) for value in DEFAULT_POSE),
+                        help="Pose inicial 'x,y,theta' [m, m, rad]")
+    parser.add_argument("--goal", type=str, default=",".join(str(value) for value in DEFAULT_GOAL), help="Meta 'x,y' [m]")
+    parser.add_argument("--max-time", type=float, default=DEFAULT_MAX_TIME, help="Tiempo simulado máximo por robot [s]")
+    parser.add_argument("--noise-seed", type=int, default=None, help="Semilla del ruido de los sensores (sin ruido por defecto)")
+    parser.add_argument("--time-step", type=str, default=str(DEFAULT_PARAMS.time_step), help="Pasos de control [ms]")
+    parser.add_argument("--max-velocity", type=str, default=str(DEFAULT_PARAMS.max_velocity), help="Velocidades máximas [rad/s]")
+    parser.add_argument("--prox-obst", type=str, default=str(DEFAULT_PARAMS.obstacle_threshold), help="Umbrales de los sensores")
+    parser.add_argument("--epsilon-pos", type=str, default=str(DEFAULT_PARAMS.goal_tolerance), help="Distancias a la meta y a la m-line [m]")
+    parser.add_argument("--epsilon-angle", type=str, default=str(DEFAULT_PARAMS.angle_tolerance), help="Tolerancias del rumbo [grados]")
+    parser.add_argument("--align", type=str, default=f"{DEFAULT_PARAMS.align_low}:{DEFAULT_PARAMS.align_high}",
+                        help="Bandas de alineación inicial 'bajo:alto'")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Robots que avanzan a la vez")
+    parser.add_argument("--top", type=int, default=10, help="Combinaciones que se muestran")
+    parser.add_argument("--output", type=str, default=None, help="Fichero CSV con todas las combinaciones ordenadas")
+    args = parser.parse_args()
+
+    grid = np.array(load_occupancy(args.map), dtype=np.uint8)
+    pose = parse_list(args.pose)
+    goal = parse_list(args.goal)
+    params = build_params(parse_list(args.time_step, int), parse_list(args.max_velocity), parse_list(args.prox_obst),
+                          parse_list(args.epsilon_pos), parse_list(args.epsilon_angle), parse_bands(args.align))
+    if not params:
+        parser.error("no hay combinaciones de parámetros")
+
+    start = time.perf_counter()
+    results = run_sweep(grid, params, pose, goal, args.max_time, args.noise_seed, args.batch_size)
+    elapsed = time.perf_counter() - start
+    order = ranking(results)
+
+    print(f"{len(params)} combinaciones en {elapsed:.1f} s ({len(params) / elapsed:.1f} combinaciones/s, "
+          f"{results['steps'].sum() / elapsed:.0f} pasos de robot/s), {int(results['success'].sum())} llegan a la meta")
+    for rank, i in enumerate(order[:args.top], 1):
+        values = ", ".join(f"{name}={results[name][i].item():g}" for name in Bug2Params._fields)
+        outcome = "llega" if results['success'][i] else ("termina lejos" if results['finished'][i] else "sin terminar")
+        print(f"{rank:3d}. {values}: {outcome}, {results['sim_time_s'][i]:.1f} s, "
+              f"{results['path_length_m'][i]:.2f} m, {results['collisions'][i]} colisiones")
+    if args.output:
+        write_csv(args.output, results, order)
+
+if __name__ == "__main__":
+    main()
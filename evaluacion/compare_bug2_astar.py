@@ -0,0 +1,339 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Comparación por lotes de Bug2 y A* (path_follower) sin Webots, con el simulador de
+headless_sim.py. Cada ejecución es (mapa, semilla, algoritmo): los mapas generados usan la
+semilla para generar el laberinto y los mapas de fichero solo para el ruido de los sensores
+(con --noise). Los dos algoritmos van del centro de la celda (1, 1) al de la celda
+(filas-2, columnas-2).
+
+De cada ejecución se guarda:
+
+- si llegó a la meta (a menos de GOAL_TOLERANCE) antes del tiempo máximo;
+- la longitud del recorrido, el tiempo simulado y los pasos;
+- las colisiones y la distancia mínima a los obstáculos;
+- si el mapa tenía ruta entre inicio y meta.
+
+Las ejecuciones se reparten entre varios procesos y los resultados se van escribiendo en
+fragmentos NPZ por columnas (shard_00000.npz, shard_00001.npz...) en el directorio de salida.
+Cada fragmento se escribe de una vez y se renombra al terminar, así que una interrupción
+pierde como mucho las ejecuciones del fragmento en curso. Al relanzar el mismo comando se
+saltan las ejecuciones que ya están en los fragmentos. Las opciones que cambian el resultado de
+las ejecuciones (planificador, suavizado, ruido, tiempo máximo) se guardan en config.json en el
+directorio de salida y no se reanuda si las del comando son otras.
+
+Al terminar se agrega todo por algoritmo (y densidad): tasa de éxito (total y sobre los mapas
+con ruta), medias de longitud y tiempo de las ejecuciones con éxito, colisiones y la razón
+entre la longitud de Bug2 y la de A* en los casos en que ambos llegan.
+
+Ejemplo:
+    python evaluacion/compare_bug2_astar.py --sizes 48x24 --densities 0.1,0.2 --seeds 0-99 --processes 8 --output-dir comparacion
+    python evaluacion/compare_bug2_astar.py --output-dir comparacion --summary-only
+"""
+import argparse
+import glob
+import json
+import math
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'generadar_mapas'))
+
+from headless_sim import RAIZ, DEFAULT_POSE, DEFAULT_PLAN_TICKS, run_controller
+from epuck_model import CELL_SIZE
+from occupancy_map import load_occupancy
+from connectivity import label_components, connected
+from generate_wbt_obstacle_density import generate_maze_array
+
+# Distancia a la meta para considerar que el robot ha llegado [m] (media celda)
+GOAL_TOLERANCE = 0.5 * CELL_SIZE
+
+# Tiempo simulado máximo por ejecución [s]
+DEFAULT_MAX_TIME = 300.0
+
+# Ejecuciones por fragmento NPZ
+SHARD_SIZE = 64
+
+# Fichero del directorio de salida con las opciones de las ejecuciones guardadas
+CONFIG_FILE = 'config.json'
+
+ALGORITHMS = ('bug2', 'astar')
+
+# Columnas de los fragmentos y su tipo
+COLUMNS = {
+    'key': str,
+    'map': str,
+    'seed': np.int64,
+    'algorithm': str,
+    'rows': np.int32,
+    'cols': np.int32,
+    'density': np.float64,
+    'solvable': bool,
+    'finished': bool,
+    'success': bool,
+    'goal_distance_m': np.float64,
+    'path_length_m': np.float64,
+    'sim_time_s': np.float64,
+    'steps': np.int64,
+    'collisions': np.int64,
+    'min_clearance_m': np.float64,
+    'wall_time_s': np.float64,
+    'error': str,
+}
+
+# Función para interpretar una lista de semillas: '0-99', '1,5,7' o una mezcla ('0-9,20').
+def parse_seeds(text):
+    seeds = []
+    for part in (part for part in text.split(',') if part):
+        if '-' in part:
+            first, last = (int(value) for value in part.split('-'))
+            seeds.extend(range(first, last + 1))
+        else:
+            seeds.append(int(part))
+    return seeds
+
+# Clave única de una ejecución, para saltarla al reanudar
+def task_key(task):
+    return f"{task['map']}|{task['seed']}|{task['algorithm']}"
+
+# Función para construir la lista de ejecuciones: mapas de fichero y generados x semillas x algoritmos.
+def build_tasks(patterns, sizes, densities, seeds, algorithms):
+    maps = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            maps.append({'map': os.path.relpath(path, RAIZ), 'file': os.path.abspath(path), 'density': math.nan})
+    for size in sizes:
+        rows, cols = (int(value) for value in size.lower().split('x'))
+        for density in densities:
+            maps.append({'map': f"generated_{rows}x{cols}_d{density}", 'rows': rows, 'cols': cols, 'density': density})
+    tasks = []
+    for source in maps:
+        for seed in seeds:
+            for algorithm in algorithms:
+                tasks.append({**source, 'seed': seed, 'algorithm': algorithm})
+    return tasks
+
+# Función para obtener la rejilla de una ejecución. En los mapas generados se dejan libres el
+# inicio y la meta, como en benchmark_planners.py.
+def task_grid(task):
+    if 'file' in task:
+        return np.array(load_occupancy(task['file']), dtype=np.uint8)
+    rows, cols = task['rows'], task['cols']
+    grid = generate_maze_array(rows, cols, task['density'], task['seed'])
+    grid[1, 1] = 0
+    grid[rows - 2, cols - 2] = 0
+    return grid
+
+# Función para ejecutar una tarea (en un proceso del pool). Devuelve la fila de resultados.
+def run_task(task):
+    grid = task_grid(task)
+    rows, cols = grid.shape
+    goal_cell = (rows - 2, cols - 2)
+    goal = ((goal_cell[0] + 0.5) * CELL_SIZE, (goal_cell[1] + 0.5) * CELL_SIZE)
+    if task['algorithm'] == 'bug2':
+        spec = f"bug_2_controller:{goal[0]}:{goal[1]}"
+    else:
+        spec = f"path_follower:{task['planner']}:{task['smoothing']}"
+    noise_seed = task['seed'] if task['noise'] else None
+    map_name = f"{os.path.basename(task['map'])}_s{task['seed']}"
+    result = run_controller(grid, spec, DEFAULT_POSE, task['max_time'], noise_seed, map_name=map_name)
+
+    x, y = result['final_pose'][:2]
+    goal_distance = math.hypot(x - goal[0], y - goal[1])
+    return {
+        'key': task_key(task),
+        'map': task['map'],
+        'seed': task['seed'],
+        'algorithm': task['algorithm'],
+        'rows': rows,
+        'cols': cols,
+        'density': task['density'],
+        'solvable': bool(connected(label_components(grid), (1, 1), goal_cell)),
+        'finished': result['finished'],
+        'success': result['finished'] and goal_distance <= GOAL_TOLERANCE,
+        'goal_distance_m': goal_distance,
+        'path_length_m': result['distance_m'],
+        'sim_time_s': result['sim_time_s'],
+        'steps': result['steps'],
+        'collisions': result['collisions'],
+        'min_clearance_m': result['min_clearance_m'],
+        'wall_time_s': result['wall_time_s'],
+        'error': result['error'] or '',
+    }
+
+# Fragmentos ya escritos en el directorio de salida, en orden
+def shard_files(output_dir):
+    return sorted(glob.glob(os.path.join(output_dir, 'shard_*.npz')))
+
+# Función para escribir un fragmento con las filas indicadas. Se escribe en un fichero
+# temporal y se renombra, así que un fragmento existente siempre está completo.
+def write_shard(output_dir, index, rows):
+    path = os.path.join(output_dir, f"shard_{index:05d}.npz")
+    columns = {}
+    for name, dtype in COLUMNS.items():
+        values = [row[name] for row in rows]
+        columns[name] = np.array(values, dtype=np.str_ if dtype is str else dtype)
+    with open(path + '.tmp', 'wb') as file:
+        np.savez(file, **columns)
+    os.replace(path + '.tmp', path)
+    return path
+
+# Función para leer todos los fragmentos como un diccionario de columnas.
+def load_results(output_dir):
+    parts = {name: [] for name in COLUMNS}
+    for path in shard_files(output_dir):
+        with np.load(path) as shard:
+            for name in COLUMNS:
+                parts[name].append(shard[name])
+    results = {name: np.concatenate(values) if values else np.array([], dtype=np.str_ if COLUMNS[name] is str else COLUMNS[name])
+               for name, values in parts.items()}
+    # Las filas llegan en el orden en que terminan los procesos: se ordenan por clave para que
+    # el resumen no dependa de ese orden
+    order = np.argsort(results['key'], kind='stable')
+    return {name: values[order] for name, values in results.items()}
+
+# Función para comprobar que las opciones coinciden con las de las ejecuciones ya guardadas en
+# el directorio de salida, o guardarlas si todavía no hay ninguna. Devuelve un mensaje de error
+# o None si se puede reanudar.
+def check_config(output_dir, config):
+    path = os.path.join(output_dir, CONFIG_FILE)
+    if os.path.exists(path):
+        with open(path) as file:
+            saved = json.load(file)
+        if saved != config:
+            return (f"{output_dir} tiene ejecuciones con otras opciones ({json.dumps(saved)}); "
+                    f"usa otro --output-dir para {json.dumps(config)}")
+        return None
+    if shard_files(output_dir):
+        return f"{output_dir} tiene fragmentos sin {CONFIG_FILE}; usa otro --output-dir"
+    os.makedirs(output_dir, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(config, file, indent=1)
+    return None
+
+# Función para ejecutar las tareas pendientes y guardarlas en fragmentos de shard_size filas.
+def run_pending(tasks, output_dir, processes, shard_size=SHARD_SIZE):
+    os.makedirs(output_dir, exist_ok=True)
+    done = set(load_results(output_dir)['key'].tolist())
+    pending = [task for task in tasks if task_key(task) not in done]
+    print(f"{len(done)} ejecuciones ya guardadas, {len(pending)} pendientes", file=sys.stderr)
+    next_shard = len(shard_files(output_dir))
+    buffer = []
+    completed = 0
+    pool = multiprocessing.Pool(processes, maxtasksperchild=1) if processes > 1 else None
+    try:
+        results = pool.imap_unordered(run_task, pending) if pool else map(run_task, pending)
+        for row in results:
+            buffer.append(row)
+            completed += 1
+            if len(buffer) >= shard_size:
+                write_shard(output_dir, next_shard, buffer)
+                next_shard += 1
+                buffer = []
+                print(f"{completed}/{len(pending)} ejecuciones", file=sys.stderr)
+    finally:
+        # También al interrumpir: lo ya calculado no se pierde
+        if buffer:
+            write_shard(output_dir, next_shard, buffer)
+        if pool:
+            pool.terminate()
+
+# Media que devuelve None si no hay valores
+def mean_or_none(values):
+    return float(np.mean(values)) if len(values) else None
+
+# Función para agregar los resultados por algoritmo y densidad.
+def summarize(results):
+    summary = []
+    densities = np.unique(results['density'][~np.isnan(results['density'])]).tolist()
+    groups = [('all', np.ones(len(results['key']), dtype=bool))]
+    groups += [(density, results['density'] == density) for density in densities]
+    for (density, in_group) in groups:
+        for algorithm in ALGORITHMS:
+            rows = in_group & (results['algorithm'] == algorithm)
+            if not rows.any():
+                continue
+            success = rows & results['success']
+            solvable = rows & results['solvable']
+            summary.append({
+                'density': density,
+                'algorithm': algorithm,
+                'runs': int(rows.sum()),
+                'success_rate': float(success.sum() / rows.sum()),
+                'success_rate_solvable': float((success & solvable).sum() / solvable.sum()) if solvable.any() else None,
+                'mean_path_length_m': mean_or_none(results['path_length_m'][success]),
+                'mean_sim_time_s': mean_or_none(results['sim_time_s'][success]),
+                'mean_collisions': float(results['collisions'][rows].mean()),
+                'timeouts': int((rows & ~results['finished']).sum()),
+                'errors': int((rows & (results['error'] != '')).sum()),
+            })
+
+    # Razón de longitudes Bug2 / A* en los pares (mapa, semilla) en que ambos llegan
+    lengths = {}
+    for key, algorithm, ok, length in zip(results['key'], results['algorithm'], results['success'], results['path_length_m']):
+        if ok:
+            lengths.setdefault(key.rsplit('|', 1)[0], {})[algorithm] = length
+    ratios = [pair['bug2'] / pair['astar'] for pair in lengths.values() if 'bug2' in pair and 'astar' in pair and pair['astar'] > 0]
+    return {
+        'runs': len(results['key']),
+        'groups': summary,
+        'length_ratio_bug2_astar': {'pairs': len(ratios), 'mean': mean_or_none(ratios),
+                                    'median': float(np.median(ratios)) if ratios else None},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparación por lotes de Bug2 y A* sin Webots")
+    parser.add_argument("--maps", type=str, default="", help="Patrones glob de mapas (CSV u .ogm) separados por comas")
+    parser.add_argument("--sizes", type=str, default="48x24", help="Mapas generados: tamaños FILASxCOLUMNAS separados por comas")
+    parser.add_argument("--densities", type=str, default="0.1,0.2", help="Mapas generados: densidades separadas por comas")
+    parser.add_argument("--seeds", type=str, default="0-9", help="Semillas: rangos 'a-b' o valores separados por comas")
+    parser.add_argument("--algorithms", type=str, default=",".join(ALGORITHMS), help="Algoritmos separados por comas")
+    parser.add_argument("--planner", type=str, default="astar", help="Planificador de path_follower")
+    parser.add_argument("--smoothing", type=str, default="none", help="Suavizado de path_follower (none, compress o shortcut)")
+    parser.add_argument("--noise", action="store_true", help="Ruido de los sensores con la semilla de cada ejecución")
+    parser.add_argument("--max-time", type=float, default=DEFAULT_MAX_TIME, help="Tiempo simulado máximo por ejecución [s]")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Número de procesos")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Ejecuciones por fragmento NPZ")
+    parser.add_argument("--output-dir", type=str, required=True, help="Directorio de los fragmentos NPZ")
+    parser.add_argument("--summary-only", action="store_true", help="Solo agregar los fragmentos existentes")
+    parser.add_argument("--summary-output", type=str, default=None, help="Fichero JSON del resumen (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    algorithms = [name for name in args.algorithms.split(',') if name]
+    for name in algorithms:
+        if name not in ALGORITHMS:
+            parser.error(f"algoritmo desconocido: {name} (disponibles: {', '.join(ALGORITHMS)})")
+
+    if not args.summary_only:
+        patterns = [pattern for pattern in args.maps.split(',') if pattern]
+        sizes = [size for size in args.sizes.split(',') if size]
+        densities = [float(value) for value in args.densities.split(',') if value]
+        tasks = build_tasks(patterns, sizes, densities, parse_seeds(args.seeds), algorithms)
+        options = {'planner': args.planner, 'smoothing': args.smoothing, 'noise': args.noise,
+                   'max_time': args.max_time}
+        error = check_config(args.output_dir, {**options, 'plan_ticks': DEFAULT_PLAN_TICKS})
+        if error:
+            parser.error(error)
+        for task in tasks:
+            task.update(options)
+        run_pending(tasks, args.output_dir, args.processes, args.shard_size)
+
+    summary = summarize(load_results(args.output_dir))
+    for group in summary['groups']:
+        print(f"{group['algorithm']} (densidad {group['density']}): {group['runs']} ejecuciones, "
+              f"éxito {group['success_rate']:.0%}, {group['timeouts']} sin terminar", file=sys.stderr)
+    if args.summary_output:
+        with open(args.summary_output, 'w') as file:
+            json.dump(summary, file, indent=1)
+    else:
+        json.dump(summary, sys.stdout, indent=1)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Sustituto del módulo 'controller' de Webots para ejecutar bug_2_controller.py y
+path_follower.py sin el simulador. Implementa la parte de la API que usan los controladores
+(Robot, Motor, DistanceSensor, GPS, Compass, InertialUnit) sobre el modelo cinemático de
+epuck_model.py, así que robot.step() solo integra el movimiento y no espera al tiempo real.
+
+Antes de crear el Robot hay que indicar el modelo con configure(); headless_sim.py lo hace
+antes de lanzar cada controlador. robot.step() devuelve -1 cuando se alcanza el tiempo
+máximo de simulación, igual que cuando Webots termina la simulación.
+"""
+import math
+
+from epuck_model import MAX_VELOCITY
+
+# Modelo del robot y tiempo máximo de simulación [ms] de la próxima ejecución
+SIMULATION = None
+MAX_TIME_MS = None
+
+# Función para indicar el modelo (EPuckModel) al que se conectan los Robot() que se creen.
+# Con max_time [s] robot.step() devuelve -1 al llegar a ese tiempo simulado.
+def configure(model, max_time=None):
+    global SIMULATION, MAX_TIME_MS
+    SIMULATION = model
+    MAX_TIME_MS = None if max_time is None else int(max_time * 1000)
+
+class Device:
+    def __init__(self, robot, name):
+        self.robot = robot
+        self.name = name
+        self.sampling_period = 0
+
+    def getName(self):
+        return self.name
+
+    def enable(self, sampling_period):
+        self.sampling_period = sampling_period
+
+    def disable(self):
+        self.sampling_period = 0
+
+    def getSamplingPeriod(self):
+        return self.sampling_period
+
+class Motor(Device):
+    def __init__(self, robot, name):
+        super().__init__(robot, name)
+        self.position = float('inf')
+        self.velocity = 0.0
+
+    # Solo se admite el control en velocidad (posición infinita), que es el que usan los controladores
+    def setPosition(self, position):
+        if position != float('inf'):
+            raise NotImplementedError("El simulador sin Webots solo admite motores en modo velocidad")
+        self.position = position
+
+    def setVelocity(self, velocity):
+        self.velocity = min(max(velocity, -MAX_VELOCITY), MAX_VELOCITY)
+        self.robot.update_wheels()
+
+    def getVelocity(self):
+        return self.velocity
+
+    def getMaxVelocity(self):
+        return MAX_VELOCITY
+
+class DistanceSensor(Device):
+    def __init__(self, robot, name, index):
+        super().__init__(robot, name)
+        self.index = index
+
+    def getValue(self):
+        return self.robot.model.sensor_readings()[self.index]
+
+class GPS(Device):
+    def getValues(self):
+        model = self.robot.model
+        return [model.x, model.y, 0.0]
+
+class Compass(Device):
+    # Dirección del norte (+y) en el sistema del robot (x hacia delante, y a la izquierda)
+    def getValues(self):
+        theta = self.robot.model.theta
+        return [math.sin(theta), math.cos(theta), 0.0]
+
+class InertialUnit(Device):
+    def getRollPitchYaw(self):
+        theta = self.robot.model.theta
+        return [0.0, 0.0, theta if theta <= math.pi else theta - 2 * math.pi]
+
+class Robot:
+    def __init__(self):
+        if SIMULATION is None:
+            raise RuntimeError("No hay simulación configurada: usa controller.configure() o headless_sim.py")
+        self.model = SIMULATION
+        self.max_time_ms = MAX_TIME_MS
+        self.left_motor = Motor(self, 'left wheel motor')
+        self.right_motor = Motor(self, 'right wheel motor')
+        devices = [self.left_motor, self.right_motor, GPS(self, 'gps'), Compass(self, 'compass'),
+                   InertialUnit(self, 'inertial unit')]
+        devices += [DistanceSensor(self, f'ps{i}', i) for i in range(8)]
+        self.devices = {device.name: device for device in devices}
+
+    # Como en Webots, un nombre desconocido devuelve None
+    def getDevice(self, name):
+        return self.devices.get(name)
+
+    def getBasicTimeStep(self):
+        return float(self.model.basic_time_step)
+
+    def getTime(self):
+        return self.model.time
+
+    def getName(self):
+        return 'e-puck'
+
+    def update_wheels(self):
+        self.model.set_velocities(self.left_motor.velocity, self.right_motor.velocity)
+
+    def step(self, duration=None):
+        if duration is None:
+            duration = self.model.basic_time_step
+        if self.max_time_ms is not None and self.model.time_ms + duration > self.max_time_ms:
+            self.model.terminated = True
+            return -1
+        self.model.advance(duration)
+        return 0
@@ -0,0 +1,148 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Modelo cinemático del e-puck para N robots a la vez sobre el mismo mapa: la misma
+integración de la tracción diferencial, las mismas colisiones con deslizamiento y las mismas
+unidades que EPuckModel (epuck_model.py), con las poses y velocidades de todos los robots en
+arrays de NumPy. Cada robot puede avanzar con su propio paso de control; los que tienen menos
+subpasos simplemente dejan de moverse en los últimos.
+"""
+import numpy as np
+
+from epuck_model import AXLE_LENGTH, BASIC_TIME_STEP, CELL_SIZE, MAX_VELOCITY, ROBOT_RADIUS, WHEEL_RADIUS, padded_grid
+
+# Celdas vecinas que se comprueban en las colisiones, en el orden de EPuckModel
+NEIGHBOR_CELLS = tuple((dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+
+class EPuckBatch:
+    def __init__(self, grid, x, y, theta=0.0, basic_time_step=BASIC_TIME_STEP):
+        padded = padded_grid(grid)
+        self.height, self.width = padded.shape
+        self.cells = padded.ravel()
+        self.x = np.array(x, dtype=np.float64)
+        self.count = self.x.size
+        self.y = np.broadcast_to(np.asarray(y, dtype=np.float64), (self.count,)).copy()
+        self.theta = np.broadcast_to(np.asarray(theta, dtype=np.float64), (self.count,)).copy()
+        self.basic_time_step = basic_time_step
+        self.left_velocity = np.zeros(self.count)
+        self.right_velocity = np.zeros(self.count)
+        self.time_ms = np.zeros(self.count, dtype=np.int64)
+        self.distance = np.zeros(self.count)
+        self.collisions = np.zeros(self.count, dtype=np.int64)
+
+    # Velocidades de las ruedas [rad/s], limitadas a MAX_VELOCITY como hace Webots
+    def set_velocities(self, left, right):
+        self.left_velocity = np.clip(left, -MAX_VELOCITY, MAX_VELOCITY)
+        self.right_velocity = np.clip(right, -MAX_VELOCITY, MAX_VELOCITY)
+
+    # Ocupación de las celdas (fila, columna); fuera del mapa se considera ocupada
+    def occupied(self, row, col):
+        inside = (row >= -1) & (row < self.height - 1) & (col >= -1) & (col < self.width - 1)
+        index = np.clip(row + 1, 0, self.height - 1) * self.width + np.clip(col + 1, 0, self.width - 1)
+        return ~inside | self.cells[index]
+
+    # Vector desde el punto más cercano de cada celda vecina ocupada hasta (x, y), en el orden
+    # de NEIGHBOR_CELLS. Devuelve listas de (dx, dy, ocupada).
+    def neighbor_vectors(self, x, y):
+        row = np.floor(x / CELL_SIZE).astype(np.int64)
+        col = np.floor(y / CELL_SIZE).astype(np.int64)
+        vectors = []
+        for dr, dc in NEIGHBOR_CELLS:
+            r, c = row + dr, col + dc
+            dx = x - np.minimum(np.maximum(x, r * CELL_SIZE), (r + 1) * CELL_SIZE)
+            dy = y - np.minimum(np.maximum(y, c * CELL_SIZE), (c + 1) * CELL_SIZE)
+            vectors.append((dx, dy, self.occupied(r, c)))
+        return vectors
+
+    # Comprueba si el disco de cada robot centrado en (x, y) toca alguna celda ocupada
+    def collides(self, x, y):
+        hit = np.zeros(x.shape, dtype=bool)
+        for dx, dy, occupied in self.neighbor_vectors(x, y):
+            hit |= occupied & (dx * dx + dy * dy < ROBOT_RADIUS * ROBOT_RADIUS)
+        return hit
+
+    # Normal de contacto en (x, y) (EPuckModel.contact_normal). Devuelve (nx, ny, hay_normal).
+    def contact_normal(self, x, y):
+        best = np.full(x.shape, np.inf)
+        normal_x = np.zeros(x.shape)
+        normal_y = np.zeros(x.shape)
+        for dx, dy, occupied in self.neighbor_vectors(x, y):
+            distance = np.hypot(dx, dy)
+            closer = occupied & (distance > 0) & (distance < best)
+            best = np.where(closer, distance, best)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                normal_x = np.where(closer, dx / distance, normal_x)
+                normal_y = np.where(closer, dy / distance, normal_y)
+        return normal_x, normal_y, best < np.inf
+
+    # Posición a la que llegan los robots cuyo movimiento desde (x0, y0) hasta (x, y) choca
+    # (EPuckModel.slide): deslizamiento tangente al contacto, después solo en x o solo en y y
+    # si nada es posible se quedan donde están.
+    def slide(self, x0, y0, x, y):
+        dx = x - x0
+        dy = y - y0
+        normal_x, normal_y, has_normal = self.contact_normal(x0, y0)
+        inward = dx * normal_x + dy * normal_y
+        tangent_x = x0 + dx - inward * normal_x
+        tangent_y = y0 + dy - inward * normal_y
+        pending = np.ones(x.shape, dtype=bool)
+        result_x = x0.copy()
+        result_y = y0.copy()
+        tangent = has_normal & (inward < 0)
+        tangent &= ~self.collides(np.where(tangent, tangent_x, x0), np.where(tangent, tangent_y, y0))
+        result_x[tangent] = tangent_x[tangent]
+        result_y[tangent] = tangent_y[tangent]
+        pending &= ~tangent
+        only_x = pending & ~self.collides(x, y0)
+        result_x[only_x] = x[only_x]
+        pending &= ~only_x
+        only_y = pending & ~self.collides(x0, y)
+        result_y[only_y] = y[only_y]
+        return result_x, result_y
+
+    # Avanza 'duration' milisegundos (escalar o un valor por robot) los robots de la máscara
+    # 'active' (todos si es None), en subpasos de basic_time_step.
+    def advance(self, duration, active=None):
+        if active is None:
+            active = np.ones(self.count, dtype=bool)
+        index = np.flatnonzero(active)
+        if not index.size:
+            return
+        duration = np.broadcast_to(np.asarray(duration), (self.count,))[index]
+        substeps = np.maximum(1, np.round(duration / self.basic_time_step)).astype(np.int64)
+        dt = self.basic_time_step / 1000.0
+        v = WHEEL_RADIUS * (self.left_velocity[index] + self.right_velocity[index]) / 2.0
+        w = WHEEL_RADIUS * (self.right_velocity[index] - self.left_velocity[index]) / AXLE_LENGTH
+        turning = np.abs(w) > 1e-9
+        x = self.x[index]
+        y = self.y[index]
+        theta = self.theta[index]
+        distance = self.distance[index]
+        collisions = self.collisions[index]
+        for substep in range(int(substeps.max())):
+            running = substep < substeps
+            new_theta = theta + w * dt
+            with np.errstate(divide='ignore', invalid='ignore'):
+                radius = v / w
+                new_x = np.where(turning, x + radius * (np.sin(new_theta) - np.sin(theta)), x + v * dt * np.cos(theta))
+                new_y = np.where(turning, y - radius * (np.cos(new_theta) - np.cos(theta)), y + v * dt * np.sin(theta))
+            theta = np.where(running, np.mod(new_theta, 2 * np.pi), theta)
+            moving = running & ((new_x != x) | (new_y != y))
+            hit = moving & self.collides(new_x, new_y)
+            collisions += hit
+            if hit.any():
+                slide_x, slide_y = self.slide(x[hit], y[hit], new_x[hit], new_y[hit])
+                new_x[hit] = slide_x
+                new_y[hit] = slide_y
+            distance += np.where(moving, np.hypot(new_x - x, new_y - y), 0.0)
+            x = np.where(moving, new_x, x)
+            y = np.where(moving, new_y, y)
+        self.x[index] = x
+        self.y[index] = y
+        self.theta[index] = theta
+        self.distance[index] = distance
+        self.collisions[index] = collisions
+        self.time_ms[index] += substeps * self.basic_time_step
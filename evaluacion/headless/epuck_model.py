@@ -0,0 +1,253 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Modelo cinemático del e-puck sobre un mapa de ocupación, para ejecutar los controladores sin
+Webots (ver controller.py). Incluye:
+
+- Tracción diferencial integrada de forma exacta (arco de circunferencia) en pasos de
+  BASIC_TIME_STEP milisegundos.
+- Colisiones del cuerpo (disco de ROBOT_RADIUS) contra las celdas ocupadas: si el movimiento
+  lleva al robot dentro de un obstáculo se conserva el giro y solo la parte de la traslación
+  tangente al contacto (el robot desliza a lo largo de la pared o rodea la esquina).
+- Los 8 sensores de proximidad ps0..ps7: los 8 rayos se lanzan a la vez con NumPy contra las
+  celdas ocupadas de alrededor del robot (prueba de planos contra cada caja) y la distancia se
+  convierte al valor del sensor con la tabla de consulta del E-puck.proto.
+
+Coordenadas como en los mundos del generador (ENU): la celda (fila, columna) del mapa ocupa
+[fila/4, (fila+1)/4] en x y [columna/4, (columna+1)/4] en y, y el ángulo del robot se mide
+desde el eje x en sentido antihorario. Fuera del mapa todo es obstáculo.
+"""
+import math
+
+import numpy as np
+
+# Paso básico de simulación [ms] (basicTimeStep por defecto de WorldInfo)
+BASIC_TIME_STEP = 32
+
+# Geometría del e-puck [m]
+WHEEL_RADIUS = 0.02
+AXLE_LENGTH = 0.052
+ROBOT_RADIUS = 0.037
+MAX_VELOCITY = 6.28
+
+# Tamaño de celda del mapa [m] (4 celdas por metro, como en el generador)
+CELL_SIZE = 0.25
+
+# Posición (x, y) [m] y orientación [rad] de los sensores ps0..ps7 respecto al centro del robot
+SENSOR_POSES = (
+    (0.030, -0.010, -0.30),
+    (0.022, -0.025, -0.80),
+    (0.000, -0.031, -1.57),
+    (-0.030, -0.015, -2.64),
+    (-0.030, 0.015, 2.64),
+    (0.000, 0.031, 1.57),
+    (0.022, 0.025, 0.80),
+    (0.030, 0.010, 0.30),
+)
+
+# Tabla de consulta de los sensores de proximidad: distancia [m], valor, ruido relativo
+LOOKUP_TABLE = np.array([
+    (0.000, 4095.00, 0.0020),
+    (0.005, 2133.33, 0.0030),
+    (0.010, 1465.73, 0.0070),
+    (0.015, 601.46, 0.0406),
+    (0.020, 383.84, 0.0147),
+    (0.030, 234.93, 0.0241),
+    (0.040, 158.03, 0.0267),
+    (0.050, 120.00, 0.0650),
+    (0.060, 104.09, 0.1054),
+    (0.070, 67.19, 0.1217),
+])
+SENSOR_RANGE = LOOKUP_TABLE[-1, 0]
+
+# Función para cargar la rejilla 0/1 de un mapa con un borde de obstáculos de una celda,
+# de forma que las celdas vecinas de cualquier posición dentro del mapa siempre existen.
+def padded_grid(grid):
+    return np.pad(np.asarray(grid) != 0, 1, constant_values=True)
+
+# Función para convertir distancias [m] en valores del sensor interpolando en la tabla.
+# Con un generador aleatorio se añade el ruido gaussiano relativo de la tabla.
+def sensor_values(distances, rng=None):
+    values = np.interp(distances, LOOKUP_TABLE[:, 0], LOOKUP_TABLE[:, 1])
+    if rng is not None:
+        noise = np.interp(distances, LOOKUP_TABLE[:, 0], LOOKUP_TABLE[:, 2])
+        values = values * (1.0 + noise * rng.standard_normal(values.shape))
+    return values
+
+class EPuckModel:
+    def __init__(self, grid, x, y, theta=0.0, basic_time_step=BASIC_TIME_STEP, noise_seed=None, obstacle_index=None):
+        self.padded = padded_grid(grid)
+        self.rows = self.padded.shape[0] - 2
+        self.cols = self.padded.shape[1] - 2
+        # Bytes de la rejilla con borde, para consultar celdas sueltas sin escalares de NumPy
+        self.cells = self.padded.tobytes()
+        self.width = self.cols + 2
+        self.x = x
+        self.y = y
+        self.theta = theta
+        self.basic_time_step = basic_time_step
+        self.rng = np.random.default_rng(noise_seed) if noise_seed is not None else None
+        self.left_velocity = 0.0
+        self.right_velocity = 0.0
+        self.time_ms = 0
+        self.steps = 0
+        self.distance = 0.0
+        self.collisions = 0
+        # Se activa cuando robot.step() devuelve -1 por llegar al tiempo máximo
+        self.terminated = False
+        # Con un ObstacleIndex (bug_geometry.py) se registra la menor distancia entre el
+        # cuerpo del robot y los obstáculos a lo largo de la ejecución
+        self.obstacle_index = obstacle_index
+        self.min_clearance = math.inf
+        sensors = np.array(SENSOR_POSES)
+        self.sensor_offsets = sensors[:, :2]
+        self.sensor_angles = sensors[:, 2]
+        self.readings_step = -1
+        self.readings = None
+
+    @property
+    def time(self):
+        return self.time_ms / 1000.0
+
+    # Ocupación de la celda (fila, columna); fuera del mapa se considera ocupada
+    def occupied(self, row, col):
+        if row < -1 or col < -1 or row > self.rows or col > self.cols:
+            return True
+        return self.cells[(row + 1) * self.width + col + 1] != 0
+
+    # Comprueba si el disco del robot centrado en (x, y) toca alguna celda ocupada
+    def collides(self, x, y):
+        row = math.floor(x / CELL_SIZE)
+        col = math.floor(y / CELL_SIZE)
+        radius2 = ROBOT_RADIUS * ROBOT_RADIUS
+        for r in (row - 1, row, row + 1):
+            for c in (col - 1, col, col + 1):
+                if not self.occupied(r, c):
+                    continue
+                # Punto de la celda más cercano al centro del robot
+                dx = x - min(max(x, r * CELL_SIZE), (r + 1) * CELL_SIZE)
+                dy = y - min(max(y, c * CELL_SIZE), (c + 1) * CELL_SIZE)
+                if dx * dx + dy * dy < radius2:
+                    return True
+        return False
+
+    # Normal de contacto en (x, y): dirección unitaria desde el punto ocupado más cercano hacia
+    # el centro del robot, o None si no hay ninguna celda ocupada alrededor
+    def contact_normal(self, x, y):
+        row = math.floor(x / CELL_SIZE)
+        col = math.floor(y / CELL_SIZE)
+        best = math.inf
+        normal = None
+        for r in (row - 1, row, row + 1):
+            for c in (col - 1, col, col + 1):
+                if not self.occupied(r, c):
+                    continue
+                dx = x - min(max(x, r * CELL_SIZE), (r + 1) * CELL_SIZE)
+                dy = y - min(max(y, c * CELL_SIZE), (c + 1) * CELL_SIZE)
+                distance = math.hypot(dx, dy)
+                if 0 < distance < best:
+                    best = distance
+                    normal = (dx / distance, dy / distance)
+        return normal
+
+    # Velocidades de las ruedas [rad/s], limitadas a MAX_VELOCITY como hace Webots
+    def set_velocities(self, left, right):
+        self.left_velocity = min(max(left, -MAX_VELOCITY), MAX_VELOCITY)
+        self.right_velocity = min(max(right, -MAX_VELOCITY), MAX_VELOCITY)
+
+    # Posición a la que llega el robot si el movimiento hasta (x, y) choca: se quita la
+    # componente del desplazamiento hacia el obstáculo (el robot desliza a lo largo de la pared
+    # o rodea la esquina) y, si aun así choca, se prueba a conservar solo el movimiento en x o
+    # en y. Si nada es posible el robot se queda donde está.
+    def slide(self, x, y):
+        dx = x - self.x
+        dy = y - self.y
+        normal = self.contact_normal(self.x, self.y)
+        if normal is not None:
+            inward = dx * normal[0] + dy * normal[1]
+            if inward < 0:
+                tangent_x = self.x + dx - inward * normal[0]
+                tangent_y = self.y + dy - inward * normal[1]
+                if not self.collides(tangent_x, tangent_y):
+                    return tangent_x, tangent_y
+        if not self.collides(x, self.y):
+            return x, self.y
+        if not self.collides(self.x, y):
+            return self.x, y
+        return self.x, self.y
+
+    # Avanza la simulación 'duration' milisegundos en pasos de basic_time_step
+    def advance(self, duration):
+        substeps = max(1, round(duration / self.basic_time_step))
+        dt = self.basic_time_step / 1000.0
+        v = WHEEL_RADIUS * (self.left_velocity + self.right_velocity) / 2.0
+        w = WHEEL_RADIUS * (self.right_velocity - self.left_velocity) / AXLE_LENGTH
+        for _ in range(substeps):
+            theta = self.theta + w * dt
+            if abs(w) > 1e-9:
+                x = self.x + v / w * (math.sin(theta) - math.sin(self.theta))
+                y = self.y - v / w * (math.cos(theta) - math.cos(self.theta))
+            else:
+                x = self.x + v * dt * math.cos(self.theta)
+                y = self.y + v * dt * math.sin(self.theta)
+            self.theta = theta % (2 * math.pi)
+            if x == self.x and y == self.y:
+                continue
+            if self.collides(x, y):
+                self.collisions += 1
+                x, y = self.slide(x, y)
+                if x == self.x and y == self.y:
+                    continue
+            self.distance += math.hypot(x - self.x, y - self.y)
+            self.x = x
+            self.y = y
+        self.time_ms += substeps * self.basic_time_step
+        self.steps += 1
+        if self.obstacle_index is not None:
+            # Solo interesa si hay algo más cerca que el mínimo actual: la búsqueda se acota
+            distance, _ = self.obstacle_index.closest(self.x, self.y, self.min_clearance + ROBOT_RADIUS)
+            if distance != math.inf:
+                self.min_clearance = distance - ROBOT_RADIUS
+
+    # Distancias [m] medidas por los 8 sensores (SENSOR_RANGE si no ven nada)
+    def ray_distances(self):
+        cos_t = math.cos(self.theta)
+        sin_t = math.sin(self.theta)
+        offsets = self.sensor_offsets
+        origins = np.empty((8, 2))
+        origins[:, 0] = self.x + offsets[:, 0] * cos_t - offsets[:, 1] * sin_t
+        origins[:, 1] = self.y + offsets[:, 0] * sin_t + offsets[:, 1] * cos_t
+        angles = self.sensor_angles + self.theta
+        directions = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+
+        # Celdas ocupadas alrededor del robot: el alcance de los sensores (7 cm más el radio)
+        # es menor que una celda, así que basta con las 3x3 vecinas (en la rejilla con borde,
+        # las filas row..row+2 y columnas col..col+2)
+        row = min(max(math.floor(self.x / CELL_SIZE), 0), self.rows - 1)
+        col = min(max(math.floor(self.y / CELL_SIZE), 0), self.cols - 1)
+        occupied_rows, occupied_cols = np.nonzero(self.padded[row:row + 3, col:col + 3])
+        if not occupied_rows.size:
+            return np.full(8, SENSOR_RANGE)
+        low = np.stack([occupied_rows + row - 1, occupied_cols + col - 1], axis=1) * CELL_SIZE
+        high = low + CELL_SIZE
+
+        # Prueba de planos de cada rayo contra cada caja: (8, cajas, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1.0 / directions
+            t1 = (low[None, :, :] - origins[:, None, :]) * inverse[:, None, :]
+            t2 = (high[None, :, :] - origins[:, None, :]) * inverse[:, None, :]
+        t_near = np.fmax.reduce(np.fmin(t1, t2), axis=2)
+        t_far = np.fmin.reduce(np.fmax(t1, t2), axis=2)
+        hit = t_far >= np.maximum(t_near, 0.0)
+        distances = np.where(hit, np.maximum(t_near, 0.0), np.inf).min(axis=1)
+        return np.minimum(distances, SENSOR_RANGE)
+
+    # Valores de los sensores en el paso actual (se calculan como mucho una vez por paso)
+    def sensor_readings(self):
+        if self.readings_step != self.steps:
+            self.readings = sensor_values(self.ray_distances(), self.rng).tolist()
+            self.readings_step = self.steps
+        return self.readings
@@ -0,0 +1,100 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Modelo de los sensores de proximidad del e-puck para muchos robots a la vez. Una llamada
+recibe un lote de poses (x, y, ángulo) y devuelve las lecturas de ps0..ps7 de todas ellas
+(array N x 8), con la misma geometría de sensores y la misma tabla de valores del
+E-puck.proto que epuck_model.py.
+
+Cada rayo recorre la rejilla con un DDA (Amanatides y Woo): se avanza de celda en celda
+cruzando siempre la frontera vertical u horizontal más cercana, hasta entrar en una celda
+ocupada o superar el alcance del sensor. Todos los rayos del lote avanzan a la vez con NumPy,
+así que el número de iteraciones es el de fronteras que cruza el rayo más largo (3 o 4 con el
+alcance de 7 cm y celdas de 25 cm) y no depende del número de robots.
+
+Fuera del mapa todo es obstáculo, como en epuck_model.py. Ejemplo:
+
+    sensors = EPuckSensors(load_occupancy('map.csv'))
+    values = sensors.readings(x, y, theta)   # x, y, theta: arrays de N poses
+    obstacle = (values[:, 0] > PROX_OBST) & (values[:, 7] > PROX_OBST)
+"""
+import math
+
+import numpy as np
+
+from epuck_model import CELL_SIZE, SENSOR_POSES, SENSOR_RANGE, padded_grid, sensor_values
+
+class EPuckSensors:
+    def __init__(self, grid, cell_size=CELL_SIZE, max_range=SENSOR_RANGE):
+        # Rejilla con borde de obstáculos, aplanada para consultar muchas celdas con un solo índice
+        padded = padded_grid(grid)
+        self.height, self.width = padded.shape
+        self.cells = padded.ravel()
+        self.cell_size = cell_size
+        self.max_range = max_range
+        poses = np.array(SENSOR_POSES)
+        self.offset_x = poses[:, 0]
+        self.offset_y = poses[:, 1]
+        self.angles = poses[:, 2]
+        # Fronteras que puede cruzar un rayo del alcance del sensor en cada eje, más la inicial
+        self.max_steps = 2 * (math.ceil(max_range / cell_size) + 1)
+
+    # Distancias [m] medidas por los 8 sensores de cada pose (max_range si no ven nada).
+    # x, y, theta: escalares o arrays de la misma longitud. Devuelve un array N x 8.
+    def distances(self, x, y, theta):
+        x, y, theta = (np.atleast_1d(np.asarray(value, dtype=np.float64)) for value in (x, y, theta))
+        cos_t = np.cos(theta)[:, None]
+        sin_t = np.sin(theta)[:, None]
+        origin_x = x[:, None] + self.offset_x * cos_t - self.offset_y * sin_t
+        origin_y = y[:, None] + self.offset_x * sin_t + self.offset_y * cos_t
+        angles = theta[:, None] + self.angles
+        direction_x = np.cos(angles)
+        direction_y = np.sin(angles)
+
+        # Posición en celdas de la rejilla con borde y celda de partida de cada rayo
+        grid_x = origin_x / self.cell_size + 1.0
+        grid_y = origin_y / self.cell_size + 1.0
+        row = np.floor(grid_x).astype(np.int64)
+        col = np.floor(grid_y).astype(np.int64)
+        step_row = np.where(direction_x > 0, 1, -1)
+        step_col = np.where(direction_y > 0, 1, -1)
+
+        # Distancia recorrida hasta la siguiente frontera en cada eje y entre dos fronteras
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta_x = np.abs(self.cell_size / direction_x)
+            delta_y = np.abs(self.cell_size / direction_y)
+            next_x = np.where(direction_x > 0, row + 1 - grid_x, grid_x - row) * delta_x
+            next_y = np.where(direction_y > 0, col + 1 - grid_y, grid_y - col) * delta_y
+        next_x[direction_x == 0] = np.inf
+        next_y[direction_y == 0] = np.inf
+
+        # Distancia a la que el rayo entra en la celda actual
+        entry = np.zeros_like(origin_x)
+        result = np.full(origin_x.shape, self.max_range)
+        active = np.ones(origin_x.shape, dtype=bool)
+        for _ in range(self.max_steps):
+            inside = (row >= 0) & (row < self.height) & (col >= 0) & (col < self.width)
+            index = np.clip(row, 0, self.height - 1) * self.width + np.clip(col, 0, self.width - 1)
+            blocked = active & (~inside | self.cells[index])
+            result[blocked] = entry[blocked]
+            active &= ~blocked
+
+            # Cruzar la frontera más cercana
+            cross_x = next_x <= next_y
+            entry = np.where(cross_x, next_x, next_y)
+            active &= entry < self.max_range
+            if not active.any():
+                break
+            row = row + np.where(cross_x, step_row, 0)
+            col = col + np.where(cross_x, 0, step_col)
+            next_x = np.where(cross_x, next_x + delta_x, next_x)
+            next_y = np.where(cross_x, next_y, next_y + delta_y)
+        return np.minimum(result, self.max_range)
+
+    # Valores de los sensores (curva del E-puck.proto) de cada pose, array N x 8. Con un
+    # generador aleatorio se añade el ruido relativo de la tabla.
+    def readings(self, x, y, theta, rng=None):
+        return sensor_values(self.distances(x, y, theta), rng)
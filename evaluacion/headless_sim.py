@@ -0,0 +1,224 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Ejecución de los controladores sin Webots. Cada controlador (bug_2_controller, path_follower)
+se lanza sin modificar sobre un mapa CSV u .ogm, con el módulo 'controller' sustituido por el
+de evaluacion/headless/ (modelo cinemático del e-puck), así que avanza tan rápido como permite
+Python en lugar de a tiempo real. Las ejecuciones (mapas x controladores) se reparten entre
+varios procesos y el resultado (tiempo simulado, pasos, distancia recorrida, colisiones,
+distancia mínima a los obstáculos, posición final) se escribe en JSON.
+
+Cada ejecución se hace en un directorio temporal con el mapa guardado como map.csv, que es el
+que leen los controladores, así que las cachés que escriben junto al mapa no tocan las del
+proyecto.
+
+path_follower se ejecuta con el planificador determinista (PATH_FOLLOWER_PLAN_TICKS): la ruta
+completa llega siempre DEFAULT_PLAN_TICKS pasos después de la petición, en lugar de cuando
+termina el hilo, así que dos ejecuciones iguales dan el mismo resultado. Con
+--async-planning se usa el hilo como en Webots.
+
+Los controladores se indican por su nombre en proyecto_webots/controllers, con los argumentos
+(controllerArgs) separados por ':'. Ejemplo:
+    python evaluacion/headless_sim.py --controllers bug_2_controller,path_follower:astar:shortcut --processes 4
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import runpy
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONTROLADORES = os.path.join(RAIZ, 'proyecto_webots', 'controllers')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'headless'))
+sys.path.insert(0, os.path.join(RAIZ, 'proyecto_webots', 'libraries', 'python'))
+
+import controller
+import step_profiler
+from epuck_model import EPuckModel, BASIC_TIME_STEP, CELL_SIZE
+from occupancy_map import load_occupancy, write_occupancy_csv
+from bug_geometry import ObstacleIndex
+
+# Pose inicial por defecto: centro de la celda (1, 1), el inicio de path_follower, mirando a +x
+DEFAULT_POSE = (1.5 * CELL_SIZE, 1.5 * CELL_SIZE, 0.0)
+
+# Tiempo simulado máximo por ejecución [s]
+DEFAULT_MAX_TIME = 600.0
+
+# Pasos de control hasta que path_follower recibe la ruta completa (None para usar el hilo del
+# planificador). En el mapa del proyecto la búsqueda tarda menos que un paso de Webots.
+DEFAULT_PLAN_TICKS = 1
+
+# Función para separar 'nombre:arg1:arg2' en el fichero del controlador y sus argumentos.
+def parse_controller(spec):
+    name, *args = spec.split(':')
+    script = os.path.join(CONTROLADORES, name, name + '.py')
+    if not os.path.exists(script):
+        raise ValueError(f"controlador desconocido: {name} (no existe {script})")
+    return name, script, args
+
+# Función para ejecutar un controlador sobre una rejilla en el proceso actual. La rejilla se
+# guarda como map.csv en un directorio temporal, que es el directorio de trabajo del
+# controlador. 'map_name' solo se usa para nombrar los ficheros de instrumentación y
+# 'plan_ticks' se pasa a path_follower en PATH_FOLLOWER_PLAN_TICKS.
+def run_controller(grid, spec, pose, max_time, noise_seed=None, verbose=False, map_name='map',
+                   plan_ticks=DEFAULT_PLAN_TICKS):
+    name, script, args = parse_controller(spec)
+    model = EPuckModel(grid, *pose, basic_time_step=BASIC_TIME_STEP, noise_seed=noise_seed,
+                       obstacle_index=ObstacleIndex(grid, CELL_SIZE))
+    controller.configure(model, max_time)
+
+    saved_cwd = os.getcwd()
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    output = io.StringIO()
+    error = None
+    # Con CONTROLLER_PROFILE los ficheros de instrumentación de cada ejecución llevan el mapa
+    # y los argumentos del controlador en el nombre y se escriben fuera del directorio temporal
+    saved_profile = os.environ.get(step_profiler.PROFILE_ENV)
+    if saved_profile not in (None, '', '0'):
+        prefix = step_profiler.DEFAULT_PREFIX if saved_profile == '1' else saved_profile
+        run_name = '_'.join([map_name] + args)
+        os.environ[step_profiler.PROFILE_ENV] = os.path.abspath(f"{prefix}_{run_name}")
+    saved_plan_ticks = os.environ.get('PATH_FOLLOWER_PLAN_TICKS')
+    os.environ['PATH_FOLLOWER_PLAN_TICKS'] = '' if plan_ticks is None else str(plan_ticks)
+    with tempfile.TemporaryDirectory() as workdir:
+        write_occupancy_csv(os.path.join(workdir, 'map.csv'), grid)
+        os.chdir(workdir)
+        sys.argv = [script] + args
+        sys.path.insert(0, os.path.dirname(script))
+        t0 = time.perf_counter()
+        try:
+            redirect = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(output)
+            with redirect:
+                runpy.run_path(script, run_name='__main__')
+        except SystemExit:
+            pass
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        wall_time = time.perf_counter() - t0
+        step_profiler.dump_all()
+        if saved_profile is not None:
+            os.environ[step_profiler.PROFILE_ENV] = saved_profile
+        if saved_plan_ticks is None:
+            del os.environ['PATH_FOLLOWER_PLAN_TICKS']
+        else:
+            os.environ['PATH_FOLLOWER_PLAN_TICKS'] = saved_plan_ticks
+        os.chdir(saved_cwd)
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+
+    return {
+        'controller': spec,
+        'rows': int(grid.shape[0]),
+        'cols': int(grid.shape[1]),
+        'start_pose': list(pose),
+        # El controlador salió de su bucle antes del tiempo máximo (por ejemplo, al llegar a la meta)
+        'finished': error is None and not model.terminated,
+        'error': error,
+        'sim_time_s': model.time,
+        'steps': model.steps,
+        'wall_time_s': wall_time,
+        'steps_per_s': model.steps / wall_time if wall_time > 0 else None,
+        'distance_m': model.distance,
+        'collisions': model.collisions,
+        # Menor distancia entre el cuerpo del robot y un obstáculo (0 si llegó a tocarlo)
+        'min_clearance_m': model.min_clearance,
+        'final_pose': [model.x, model.y, model.theta],
+        'final_cell': [math.floor(model.x / CELL_SIZE), math.floor(model.y / CELL_SIZE)],
+    }
+
+# Función para ejecutar un controlador sobre un fichero de mapa.
+# job = (fichero del mapa, especificación del controlador, pose, tiempo máximo, semilla del
+# ruido de los sensores o None, mostrar la salida del controlador, pasos hasta la ruta completa
+# o None).
+def run_job(job):
+    map_file, spec, pose, max_time, noise_seed, verbose, plan_ticks = job
+    map_name = os.path.splitext(os.path.basename(map_file))[0]
+    result = run_controller(load_occupancy(map_file), spec, pose, max_time, noise_seed, verbose, map_name, plan_ticks)
+    return {'map': os.path.relpath(map_file, RAIZ), **result}
+
+# Función para ejecutar todas las ejecuciones, en paralelo si processes > 1.
+# Cada proceso ejecuta una sola tarea para que los módulos importados por un controlador
+# (y su estado global) no pasen a la siguiente ejecución.
+def run_jobs(jobs, processes):
+    if processes <= 1:
+        for job in jobs:
+            yield run_job(job)
+        return
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool:
+        yield from pool.imap(run_job, jobs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ejecución de los controladores sin Webots")
+    parser.add_argument("--maps", type=str, default=os.path.join(RAIZ, 'proyecto_webots', 'world', 'map.csv'),
+                        help="Patrones glob de mapas (CSV u .ogm) separados por comas")
+    parser.add_argument("--controllers", type=str, default="bug_2_controller,path_follower",
+                        help="Controladores separados por comas, con sus argumentos separados por ':'")
+    parser.add_argument("--pose", type=str, default=",".join(str(value) for value in DEFAULT_POSE),
+                        help="Pose inicial x,y,ángulo [m, m, rad]")
+    parser.add_argument("--max-time", type=float, default=DEFAULT_MAX_TIME, help="Tiempo simulado máximo por ejecución [s]")
+    parser.add_argument("--noise-seed", type=int, default=None, help="Semilla del ruido de los sensores (por defecto, sin ruido)")
+    parser.add_argument("--plan-ticks", type=int, default=DEFAULT_PLAN_TICKS,
+                        help="Pasos de control hasta que path_follower recibe la ruta completa")
+    parser.add_argument("--async-planning", action="store_true",
+                        help="Planificar en el hilo de path_follower, como en Webots (el resultado depende del reloj)")
+    parser.add_argument("--processes", type=int, default=1, help="Número de procesos")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar la salida de los controladores")
+    parser.add_argument("--output", type=str, default=None, help="Fichero JSON de salida (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    specs = [spec for spec in args.controllers.split(',') if spec]
+    for spec in specs:
+        try:
+            parse_controller(spec)
+        except ValueError as exc:
+            parser.error(str(exc))
+    pose = tuple(float(value) for value in args.pose.split(','))
+    if len(pose) != 3:
+        parser.error("la pose debe ser x,y,ángulo")
+    maps = []
+    for pattern in (pattern for pattern in args.maps.split(',') if pattern):
+        maps.extend(sorted(glob.glob(pattern)))
+    if args.verbose and args.processes > 1:
+        parser.error("--verbose solo con --processes 1")
+
+    plan_ticks = None if args.async_planning else args.plan_ticks
+    jobs = [(map_file, spec, pose, args.max_time, args.noise_seed, args.verbose, plan_ticks)
+            for map_file in maps for spec in specs]
+    results = []
+    for result in run_jobs(jobs, args.processes):
+        results.append(result)
+        status = 'terminado' if result['finished'] else (result['error'] or 'tiempo máximo')
+        print(f"{result['map']} {result['controller']}: {status}, {result['sim_time_s']:.1f} s simulados, "
+              f"{result['steps']} pasos ({result['steps_per_s']:.0f} pasos/s), {result['collisions']} colisiones",
+              file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'max_time_s': args.max_time,
+        'noise_seed': args.noise_seed,
+        'plan_ticks': plan_ticks,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+if __name__ == "__main__":
+    main()
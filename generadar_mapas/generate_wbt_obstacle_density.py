@@ -8,67 +8,117 @@ Generador de laberintos para Webots.
 """
 
 import argparse
-import random
 import csv
-from numpy import genfromtxt
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Librería compartida con los controladores (formato binario de mapas .ogm, conectividad)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proyecto_webots', 'libraries', 'python'))
+from occupancy_map import load_occupancy_grid, write_occupancy, write_occupancy_csv
+from occupancy_grid import OccupancyGrid, as_occupancy_grid, BAND_ROWS
+from connectivity import label_components, connected, repair_connectivity, grid_digest, labels_path, write_labels
+
+# A* de path_follower, para la ruta de los mundos por corredor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proyecto_webots', 'controllers', 'path_follower'))
+from grid_astar import astar_flat
 
 # VARIABLES
 altura_caja_píxel = 0.5
 resolution = 4  # Just to make similar to MATLAB [pixel/meter]
 metro_por_píxel = 1 / resolution  # [meter/pixel]
+max_intentos = 100  # Mapas generados como mucho con --unsolvable reject
+tamaño_tesela = 64  # Celdas por lado de cada tesela con --tiles
+margen_corredor = 8  # Celdas alrededor de la ruta cuyas teselas se cargan con --corridor
 
-# Función para generar un laberinto con las dimensiones basadas en el nombre y apellido dados.
-def generate_maze(name, surname, obstacle_density, multiplication):
-    rows = len(name) * multiplication - 2
-    cols = len(surname) * multiplication - 2
-    maze = []
-    maze.append([1] * (cols + 2))
-    for _ in range(rows):
-        row = [1]
-        for _ in range(cols):
-            if random.random() < obstacle_density:
-                row.append(1)  # Obstacle
-            else:
-                row.append(0)  # Empty space
-        row.append(1)
-        maze.append(row)
-    maze.append([1] * (cols + 2))
+# Función para generar un laberinto de filas x columnas (bordes incluidos) como array uint8 de NumPy.
+# Cada celda interior es obstáculo si su número aleatorio es menor que la densidad.
+def generate_maze_array(rows, cols, obstacle_density, seed=None):
+    rng = np.random.default_rng(seed)
+    maze = np.ones((rows, cols), dtype=np.uint8)
+    if rows > 2 and cols > 2:
+        interior = rng.random((rows - 2, cols - 2), dtype=np.float32)
+        maze[1:-1, 1:-1] = interior < obstacle_density
     return maze
 
-# Función para guardar el laberinto en un archivo CSV.
-def save_maze_to_csv(maze, filename):
-    with open(filename, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        for row in maze:
-            writer.writerow(row)
+# Igual que generate_maze_array pero como OccupancyGrid (un bit por celda), generada por bandas
+# de filas para no tener nunca el mapa entero en bytes. Con la misma semilla el laberinto es
+# idéntico al de generate_maze_array: los números aleatorios se consumen en el mismo orden.
+def generate_maze_grid(rows, cols, obstacle_density, seed=None):
+    rng = np.random.default_rng(seed)
+    maze = OccupancyGrid(rows, cols)
+    for inicio in range(0, rows, BAND_ROWS):
+        fin = min(inicio + BAND_ROWS, rows)
+        banda = np.ones((fin - inicio, cols), dtype=np.uint8)
+        # Filas interiores de la banda (la primera y la última del mapa son borde)
+        primera, ultima = max(inicio, 1), min(fin, rows - 1)
+        if rows > 2 and cols > 2 and ultima > primera:
+            interior = rng.random((ultima - primera, cols - 2), dtype=np.float32)
+            banda[primera - inicio:ultima - inicio, 1:-1] = interior < obstacle_density
+        maze.set_rows(inicio, banda)
+    return maze
 
-def generar_mapa_webots(archivo_entrada):
-    # This function is made by: Author: Juan G Victores
-    # CopyPolicy: released under the terms of the LGPLv2.1
-    # URL: <https://github.com/roboticslab-uc3m/webots-tools>
+# Función para generar el laberinto con las dimensiones basadas en el nombre y apellido dados.
+def generate_maze_grid_from_name(name, surname, obstacle_density, multiplication, seed=None):
+    rows = len(name) * multiplication
+    cols = len(surname) * multiplication
+    return generate_maze_grid(rows, cols, obstacle_density, seed)
 
-    # Cargar datos del archivo CSV
-    datos_entrada = genfromtxt(archivo_entrada, delimiter=',')
-    print(datos_entrada)
+# Función para guardar un laberinto uint8 (0/1) en CSV de una sola escritura.
+# Cada fila se compone como bytes "d,d,...,d\r\n", idéntico a la salida de csv.writer.
+def save_maze_array_to_csv(maze, filename):
+    write_occupancy_csv(filename, maze)
 
-    # Obtener dimensiones del mapa
-    num_filas = datos_entrada.shape[0]
-    num_columnas = datos_entrada.shape[1]
-    print("líneas (NOMBRE)= X =", datos_entrada.shape[0])
-    print("columnas (APELLIDO)= Y =", datos_entrada.shape[1])
+# Función para guardar el laberinto en el formato binario .ogm junto al CSV.
+def save_maze_to_ogm(maze, filename, bit_packed=False):
+    archivo_ogm = os.path.splitext(filename)[0] + '.ogm'
+    write_occupancy(archivo_ogm, maze, resolution, bit_packed=bit_packed)
+    return archivo_ogm
 
-    altura_caja = altura_caja_píxel
+# Función para guardar el índice de conectividad (etiquetas de componentes) junto al mapa.
+def save_maze_labels(maze, labels, filename):
+    archivo_etiquetas = labels_path(filename)
+    write_labels(archivo_etiquetas, labels, grid_digest(maze))
+    return archivo_etiquetas
 
-    longitud_unidad_x = metro_por_píxel
-    longitud_unidad_y = metro_por_píxel
+# Función para generar un laberinto comprobando si hay ruta entre el inicio (1, 1) y la meta
+# (filas-2, columnas-2) que usa path_follower. 'generar' recibe la semilla y devuelve el
+# laberinto. Según el modo, si no hay ruta: 'keep' lo deja así, 'reject' genera otro con una
+# semilla derivada (hasta max_intentos veces) y 'repair' quita el mínimo de obstáculos.
+# Con 'keep' las componentes solo se etiquetan si se pide con 'etiquetar'.
+# Devuelve (laberinto, etiquetas, semilla usada, si hay ruta, obstáculos eliminados); sin
+# etiquetar, las etiquetas y si hay ruta son None.
+def generar_conectado(generar, semilla=None, modo='keep', etiquetar=False):
+    maze = generar(semilla)
+    if modo == 'keep' and not etiquetar:
+        return maze, None, semilla, None, 0
+    labels = label_components(maze)
+    rows, cols = maze.shape
+    inicio, meta = (1, 1), (rows - 2, cols - 2)
+    resoluble = lambda labels: rows > 2 and cols > 2 and bool(connected(labels, inicio, meta))
+    intento = 0
+    while modo == 'reject' and not resoluble(labels) and intento < max_intentos:
+        intento += 1
+        semilla_intento = semilla_lote(semilla, intento) if semilla is not None else None
+        maze = generar(semilla_intento)
+        labels = label_components(maze)
+    if modo == 'reject' and intento:
+        semilla = semilla_intento
+    eliminados = 0
+    if modo == 'repair' and not resoluble(labels) and rows > 2 and cols > 2:
+        maze, eliminados = repair_connectivity(maze, inicio, meta)
+        labels = label_components(maze)
+    return maze, labels, semilla, resoluble(labels), eliminados
 
-    # Cadena de texto con las definiciones de los elementos del mundo
-    cadena_mundo = '#VRML_SIM R2022b utf8\n\
+# Cabecera del mundo con las definiciones de los elementos fijos: versión y PROTO externos,
+# después de los cuales los mundos por teselas añaden los de sus teselas, y nodos fijos
+cadena_protos_mundo = '#VRML_SIM R2022b utf8\n\
     EXTERNPROTO "https://raw.githubusercontent.com/cyberbotics/webots/R2023a/projects/objects/backgrounds/protos/TexturedBackground.proto"\n\
     EXTERNPROTO "https://raw.githubusercontent.com/cyberbotics/webots/R2023a/projects/objects/backgrounds/protos/TexturedBackgroundLight.proto"\n\
     EXTERNPROTO "https://raw.githubusercontent.com/cyberbotics/webots/R2023a/projects/objects/floors/protos/Floor.proto"\n\
-    EXTERNPROTO "https://raw.githubusercontent.com/cyberbotics/webots/R2023a/projects/objects/solids/protos/SolidBox.proto"\n\
-    WorldInfo {\n\
+    EXTERNPROTO "https://raw.githubusercontent.com/cyberbotics/webots/R2023a/projects/objects/solids/protos/SolidBox.proto"\n'
+cadena_nodos_mundo = '    WorldInfo {\n\
     coordinateSystem "ENU"\n\
     }\n\
     Viewpoint {\n\
@@ -79,75 +129,454 @@ def generar_mapa_webots(archivo_entrada):
     }\n\
     TexturedBackgroundLight {\n\
     }\n'
+cadena_cabecera_mundo = cadena_protos_mundo + cadena_nodos_mundo
+
+# Plantilla del suelo (los floats se formatean con %r, igual que str(float))
+formato_suelo = 'Floor {\n\
+    translation %r %r 0\n\
+    size %r %r\n\
+    }\n'
+
+# Plantilla de cada tesela: un PROTO sin campos con un grupo de cajas
+formato_cabecera_tesela = '#VRML_SIM R2022b utf8\n\
+EXTERNPROTO "https://raw.githubusercontent.com/cyberbotics/webots/R2023a/projects/objects/solids/protos/SolidBox.proto"\n\
+\n\
+PROTO %s [\n\
+]\n\
+{\n\
+Group {\n\
+    children [\n'
+cadena_pie_tesela = '    ]\n\
+}\n\
+}\n'
+
+# Columnas del índice de teselas. 'tile_size' es el lado de las teselas con que se generó el
+# mapa (las del borde pueden ser más pequeñas).
+campos_indice_teselas = ['tile_row', 'tile_col', 'proto', 'file', 'row_start', 'row_end', 'col_start', 'col_end',
+                         'occupied', 'boxes', 'tile_size']
+
+# Función para escribir las cajas de los obstáculos directamente en el fichero, fila a fila.
+# El formato se precompila una vez con los valores constantes (z y tamaño) y por cada
+# celda ocupada solo se sustituyen nombre y posición. Las filas de la OccupancyGrid se
+# desempaquetan al recorrerlas. 'origen' es la celda (fila, columna) del mapa que corresponde a
+# la primera de datos_entrada, para escribir una parte del mapa (teselas).
+def escribir_cajas(archivo_salida, datos_entrada, longitud_unidad_x, longitud_unidad_y, altura_caja, origen=(0, 0)):
+    num_filas, num_columnas = datos_entrada.shape
+    fila_origen, columna_origen = origen
+    z = altura_caja / 2.0
+    formato = 'SolidBox {\n\
+    name "caja_%%d_%%d"\n\
+    translation %%r %%r %r\n\
+    size %r %r %r\n\
+    }\n' % (z, longitud_unidad_x, longitud_unidad_y, altura_caja)
+    posiciones_y = [longitud_unidad_y / 2.0 + (columna_origen + i_y) * metro_por_píxel for i_y in range(num_columnas)]
+    for i_x, fila in enumerate(datos_entrada, fila_origen):
+        # Calcular la posición de la fila y escribir solo las celdas distintas de 0
+        x = longitud_unidad_x / 2.0 + i_x * metro_por_píxel
+        columnas = np.flatnonzero(fila).tolist()
+        archivo_salida.writelines([formato % (i_x, columna_origen + i_y, x, posiciones_y[i_y]) for i_y in columnas])
+
+# Función para agrupar las celdas ocupadas en rectángulos alineados con los ejes.
+# Primero se buscan los tramos horizontales de cada fila y después se fusionan en vertical
+# los tramos que ocupan exactamente las mismas columnas en filas consecutivas.
+# Devuelve una lista de rectángulos (fila, columna, alto, ancho) en celdas.
+def compactar_rectangulos(datos_entrada):
+    num_filas, num_columnas = datos_entrada.shape
+    rectangulos = []
+    abiertos = {}  # (columna_inicio, columna_fin) -> fila de inicio
+    borde = np.zeros(1, dtype=np.int8)
+    filas = iter(datos_entrada)
+    for i_x in range(num_filas + 1):
+        tramos = set()
+        if i_x < num_filas:
+            fila = np.concatenate((borde, next(filas) != 0, borde)).astype(np.int8)
+            cambios = np.flatnonzero(np.diff(fila))
+            tramos = set(zip(cambios[0::2].tolist(), cambios[1::2].tolist()))
+        # Cerrar los rectángulos cuyo tramo no continúa en esta fila
+        for tramo in list(abiertos):
+            if tramo not in tramos:
+                fila_inicio = abiertos.pop(tramo)
+                rectangulos.append((fila_inicio, tramo[0], i_x - fila_inicio, tramo[1] - tramo[0]))
+        # Abrir los tramos nuevos
+        for tramo in tramos:
+            if tramo not in abiertos:
+                abiertos[tramo] = i_x
+    rectangulos.sort()
+    return rectangulos
+
+# Función para escribir una caja escalada por cada rectángulo de celdas ocupadas.
+# Cada caja se nombra por su celda superior izquierda y se centra en el rectángulo.
+def escribir_cajas_compactadas(archivo_salida, rectangulos, longitud_unidad_x, longitud_unidad_y, altura_caja):
+    z = altura_caja / 2.0
+    formato = 'SolidBox {\n\
+    name "caja_%%d_%%d"\n\
+    translation %%r %%r %r\n\
+    size %%r %%r %r\n\
+    }\n' % (z, altura_caja)
+    for (i_x, i_y, alto, ancho) in rectangulos:
+        x = (i_x + alto / 2.0) * metro_por_píxel
+        y = (i_y + ancho / 2.0) * metro_por_píxel
+        archivo_salida.write(formato % (i_x, i_y, x, y, alto * longitud_unidad_x, ancho * longitud_unidad_y))
+
+def generar_mapa_webots(archivo_entrada, datos_entrada=None, compactar=False, verbose=True):
+    # This function is made by: Author: Juan G Victores
+    # CopyPolicy: released under the terms of the LGPLv2.1
+    # URL: <https://github.com/roboticslab-uc3m/webots-tools>
+
+    # Cargar datos del archivo CSV o .ogm (si no se han pasado ya en memoria) como OccupancyGrid
+    if datos_entrada is None:
+        datos_entrada = load_occupancy_grid(archivo_entrada)
+    datos_entrada = as_occupancy_grid(datos_entrada)
+
+    # Obtener dimensiones del mapa
+    num_filas = datos_entrada.shape[0]
+    num_columnas = datos_entrada.shape[1]
+    if verbose:
+        print("líneas (NOMBRE)= X =", datos_entrada.shape[0])
+        print("columnas (APELLIDO)= Y =", datos_entrada.shape[1])
+
+    altura_caja = altura_caja_píxel
+
+    longitud_unidad_x = metro_por_píxel
+    longitud_unidad_y = metro_por_píxel
 
-    # Crear el suelo
+    # Dimensiones del suelo
     longitud_suelo_x = metro_por_píxel * num_filas
     longitud_suelo_y = metro_por_píxel * num_columnas
 
-    cadena_suelo = 'Floor {\n\
-    translation $posicion_x $posicion_y 0\n\
-    size $longitud_x $longitud_y\n\
-    }\n'
+    # Escribir el archivo de salida en streaming: cabecera, suelo y paredes
+    name = os.path.splitext(archivo_entrada)[0]
+    with open(name + '.wbt', 'w', buffering=1 << 20) as archivo_salida:
+        archivo_salida.write(cadena_cabecera_mundo)
+        archivo_salida.write(formato_suelo % (longitud_suelo_x / 2.0, longitud_suelo_y / 2.0,
+                                              longitud_suelo_x, longitud_suelo_y))
+        if compactar:
+            rectangulos = compactar_rectangulos(datos_entrada)
+            escribir_cajas_compactadas(archivo_salida, rectangulos, longitud_unidad_x, longitud_unidad_y, altura_caja)
+        else:
+            escribir_cajas(archivo_salida, datos_entrada, longitud_unidad_x, longitud_unidad_y, altura_caja)
 
-    cadena_suelo = cadena_suelo.replace('$posicion_x', str(longitud_suelo_x / 2.0))
-    cadena_suelo = cadena_suelo.replace('$posicion_y', str(longitud_suelo_y / 2.0))
-    cadena_suelo = cadena_suelo.replace('$longitud_x', str(longitud_suelo_x))
-    cadena_suelo = cadena_suelo.replace('$longitud_y', str(longitud_suelo_y))
-    cadena_mundo += cadena_suelo
-
-    # Crear las paredes
-    cadena_caja = 'SolidBox {\n\
-    name "$nombre"\n\
-    translation $x $y $z\n\
-    size $longitud_unidad_x $longitud_unidad_y $altura_caja\n\
-    }\n'
+    # Informe del número de cajas (cuerpos físicos) antes y después de compactar
+    num_celdas = datos_entrada.count()
+    num_cajas = len(rectangulos) if compactar else num_celdas
+    if compactar and verbose:
+        ratio = num_celdas / num_cajas if num_cajas else 1.0
+        print(f"Cajas: {num_celdas} celdas ocupadas -> {num_cajas} cajas compactadas (ratio {ratio:.2f}x)")
+    return num_celdas, num_cajas
+
+# Función para obtener las teselas de un mapa de num_filas x num_columnas en bloques de
+# tamaño x tamaño celdas. Devuelve (fila de la tesela, columna de la tesela, fila inicial,
+# fila final, columna inicial, columna final) con los rangos de celdas semiabiertos.
+def teselas_de_mapa(num_filas, num_columnas, tamaño):
+    for fila_tesela, fila_inicio in enumerate(range(0, num_filas, tamaño)):
+        for columna_tesela, columna_inicio in enumerate(range(0, num_columnas, tamaño)):
+            yield (fila_tesela, columna_tesela, fila_inicio, min(fila_inicio + tamaño, num_filas),
+                   columna_inicio, min(columna_inicio + tamaño, num_columnas))
+
+# Directorio de las teselas de un mapa (map1.csv -> map1_tiles) y su índice
+def directorio_teselas(archivo_entrada):
+    return os.path.splitext(archivo_entrada)[0] + '_tiles'
+
+def indice_teselas(archivo_entrada):
+    return os.path.join(directorio_teselas(archivo_entrada), 'index.csv')
+
+# Nombre del PROTO de una tesela
+def nombre_tesela(fila_tesela, columna_tesela):
+    return f"Tesela_{fila_tesela}_{columna_tesela}"
+
+# Función para escribir un mundo con el suelo del mapa entero y solo las teselas indicadas
+# (filas del índice). Los PROTO de las teselas se referencian con rutas relativas al mundo.
+def escribir_mundo_teselas(archivo_mundo, num_filas, num_columnas, teselas):
+    longitud_suelo_x = metro_por_píxel * num_filas
+    longitud_suelo_y = metro_por_píxel * num_columnas
+    directorio_mundo = os.path.dirname(os.path.abspath(archivo_mundo))
+    with open(archivo_mundo, 'w', buffering=1 << 20) as archivo_salida:
+        archivo_salida.write(cadena_protos_mundo)
+        for tesela in teselas:
+            ruta = os.path.relpath(tesela['path'], directorio_mundo).replace(os.sep, '/')
+            archivo_salida.write(f'    EXTERNPROTO "{ruta}"\n')
+        archivo_salida.write(cadena_nodos_mundo)
+        archivo_salida.write(formato_suelo % (longitud_suelo_x / 2.0, longitud_suelo_y / 2.0,
+                                              longitud_suelo_x, longitud_suelo_y))
+        for tesela in teselas:
+            archivo_salida.write(f"{tesela['proto']} {{\n    }}\n")
+
+# Función para escribir el mapa por teselas: un PROTO por cada bloque de tamaño x tamaño celdas
+# con obstáculos (map1_tiles/Tesela_<fila>_<columna>.proto), el índice de teselas
+# (map1_tiles/index.csv) y un mundo con todas ellas (map1.wbt). Las cajas conservan el nombre y
+# la posición que tendrían en el mundo completo, así que cualquier subconjunto de teselas se
+# puede cargar junto (generar_mundo_corredor). Con compactar, los rectángulos se buscan dentro
+# de cada tesela.
+def generar_mapa_webots_teselas(archivo_entrada, datos_entrada=None, tamaño=tamaño_tesela, compactar=False, verbose=True):
+    if datos_entrada is None:
+        datos_entrada = load_occupancy_grid(archivo_entrada)
+    datos_entrada = as_occupancy_grid(datos_entrada)
+    num_filas, num_columnas = datos_entrada.shape
+    directorio = directorio_teselas(archivo_entrada)
+    os.makedirs(directorio, exist_ok=True)
+
+    teselas = []
+    num_celdas = num_cajas = 0
+    # Las filas de teselas se desempaquetan de una en una, como las bandas del generador
+    for fila_inicio in range(0, num_filas, tamaño):
+        banda = datos_entrada.band(fila_inicio, fila_inicio + tamaño)
+        fila_tesela = fila_inicio // tamaño
+        for _, columna_tesela, _, fila_fin, columna_inicio, columna_fin in teselas_de_mapa(banda.shape[0], num_columnas, tamaño):
+            bloque = banda[:, columna_inicio:columna_fin]
+            ocupadas = int(np.count_nonzero(bloque))
+            fila = {'tile_row': fila_tesela, 'tile_col': columna_tesela, 'proto': '', 'file': '',
+                    'row_start': fila_inicio, 'row_end': fila_inicio + fila_fin,
+                    'col_start': columna_inicio, 'col_end': columna_fin, 'occupied': ocupadas, 'boxes': 0,
+                    'tile_size': tamaño}
+            if ocupadas:
+                fila['proto'] = nombre_tesela(fila_tesela, columna_tesela)
+                fila['file'] = fila['proto'] + '.proto'
+                fila['path'] = os.path.join(directorio, fila['file'])
+                with open(fila['path'], 'w', buffering=1 << 20) as archivo_salida:
+                    archivo_salida.write(formato_cabecera_tesela % fila['proto'])
+                    if compactar:
+                        rectangulos = [(i_x + fila_inicio, i_y + columna_inicio, alto, ancho)
+                                       for (i_x, i_y, alto, ancho) in compactar_rectangulos(bloque)]
+                        escribir_cajas_compactadas(archivo_salida, rectangulos, metro_por_píxel, metro_por_píxel, altura_caja_píxel)
+                        fila['boxes'] = len(rectangulos)
+                    else:
+                        escribir_cajas(archivo_salida, bloque, metro_por_píxel, metro_por_píxel, altura_caja_píxel,
+                                       (fila_inicio, columna_inicio))
+                        fila['boxes'] = ocupadas
+                    archivo_salida.write(cadena_pie_tesela)
+            num_celdas += ocupadas
+            num_cajas += fila['boxes']
+            teselas.append(fila)
 
-    for i_x in range(num_filas):
-        for i_y in range(num_columnas):
-
-            # Saltar si el valor es 0
-            if datos_entrada[i_x][i_y] == 0:
-                continue
-
-            # Calcular la posición de la caja
-            x = longitud_unidad_x / 2.0 + i_x * metro_por_píxel
-            y = longitud_unidad_y / 2.0 + i_y * metro_por_píxel
-            z = altura_caja / 2.0
-
-            # Crear la caja
-            nombre_caja = 'caja_' + str(i_x) + '_' + str(i_y)
-            cadena_tmp_caja = cadena_caja.replace('$nombre', nombre_caja)
-            cadena_tmp_caja = cadena_tmp_caja.replace('$x', str(x))
-            cadena_tmp_caja = cadena_tmp_caja.replace('$y', str(y))
-            cadena_tmp_caja = cadena_tmp_caja.replace('$z', str(z))
-            cadena_tmp_caja = cadena_tmp_caja.replace('$longitud_unidad_x', str(longitud_unidad_x))
-            cadena_tmp_caja = cadena_tmp_caja.replace('$longitud_unidad_y', str(longitud_unidad_y))
-            cadena_tmp_caja = cadena_tmp_caja.replace('$altura_caja', str(altura_caja))
-            cadena_mundo += cadena_tmp_caja
-
-    # Escribir el archivo de salida
-    name = archivo_entrada.split('.')[0]
-    archivo_salida = open(name + '.wbt', 'w')
-    archivo_salida.write(cadena_mundo)
-    archivo_salida.close()
+    with open(indice_teselas(archivo_entrada), 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=campos_indice_teselas, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(teselas)
+    escribir_mundo_teselas(os.path.splitext(archivo_entrada)[0] + '.wbt', num_filas, num_columnas,
+                           [tesela for tesela in teselas if tesela['file']])
+    if verbose:
+        con_cajas = sum(1 for tesela in teselas if tesela['file'])
+        print(f"Teselas de {tamaño}x{tamaño} celdas: {con_cajas} con obstáculos de {len(teselas)}, {num_cajas} cajas, índice en {indice_teselas(archivo_entrada)}")
+    return num_celdas, num_cajas
+
+# Función para leer el índice de teselas de un mapa. Añade a cada fila la ruta de su PROTO.
+# Devuelve (filas del índice, lado de las teselas). En los índices sin la columna 'tile_size'
+# el lado es la mayor extensión de las teselas, que solo las del borde no alcanzan.
+def leer_indice_teselas(archivo_entrada):
+    directorio = directorio_teselas(archivo_entrada)
+    teselas = []
+    with open(indice_teselas(archivo_entrada), newline='') as csvfile:
+        for fila in csv.DictReader(csvfile):
+            tesela = {campo: fila[campo] if campo in ('proto', 'file') else int(fila[campo])
+                      for campo in campos_indice_teselas if campo in fila}
+            tesela['path'] = os.path.join(directorio, tesela['file']) if tesela['file'] else ''
+            teselas.append(tesela)
+    if teselas and 'tile_size' in teselas[0]:
+        tamaño = teselas[0]['tile_size']
+    else:
+        tamaño = max((max(tesela['row_end'] - tesela['row_start'], tesela['col_end'] - tesela['col_start'])
+                      for tesela in teselas), default=tamaño_tesela)
+    return teselas, tamaño
+
+# Función para generar un mundo con solo las teselas a menos de 'margen' celdas de una ruta
+# (lista de celdas). Sin ruta se planifica con A* entre el inicio (1, 1) y la meta
+# (filas-2, columnas-2) de path_follower. El mundo se escribe en map1_corridor.wbt (o en
+# archivo_mundo) y necesita las teselas de generar_mapa_webots_teselas.
+# Devuelve (teselas del mundo, teselas con obstáculos del mapa, cajas del mundo).
+def generar_mundo_corredor(archivo_entrada, ruta=None, margen=margen_corredor, archivo_mundo=None, verbose=True):
+    datos_entrada = load_occupancy_grid(archivo_entrada)
+    num_filas, num_columnas = datos_entrada.shape
+    teselas, tamaño = leer_indice_teselas(archivo_entrada)
+    if ruta is None:
+        ruta = astar_flat(datos_entrada, (1, 1), (num_filas - 2, num_columnas - 2))
+    if not ruta:
+        raise ValueError(f"no hay ruta para el corredor en {archivo_entrada}")
+
+    # Teselas que toca el corredor
+    celdas = np.array(ruta)
+    primera = np.maximum(celdas - margen, 0) // tamaño
+    ultima = np.minimum(celdas + margen, [num_filas - 1, num_columnas - 1]) // tamaño
+    tocadas = set()
+    for (fila_a, columna_a), (fila_b, columna_b) in zip(primera.tolist(), ultima.tolist()):
+        for fila_tesela in range(fila_a, fila_b + 1):
+            for columna_tesela in range(columna_a, columna_b + 1):
+                tocadas.add((fila_tesela, columna_tesela))
+    con_cajas = [tesela for tesela in teselas if tesela['file']]
+    elegidas = [tesela for tesela in con_cajas if (tesela['tile_row'], tesela['tile_col']) in tocadas]
+
+    archivo_mundo = archivo_mundo or os.path.splitext(archivo_entrada)[0] + '_corridor.wbt'
+    escribir_mundo_teselas(archivo_mundo, num_filas, num_columnas, elegidas)
+    num_cajas = sum(tesela['boxes'] for tesela in elegidas)
+    if verbose:
+        total = sum(tesela['boxes'] for tesela in con_cajas)
+        print(f"Corredor de {len(ruta)} celdas (margen {margen}): {len(elegidas)} de {len(con_cajas)} teselas, "
+              f"{num_cajas} de {total} cajas, mundo en {archivo_mundo}")
+    return len(elegidas), len(con_cajas), num_cajas
+
+# Función para obtener una semilla reproducible e independiente para el mapa número indice del lote.
+def semilla_lote(semilla_base, indice):
+    return int(np.random.SeedSequence([semilla_base, indice]).generate_state(1)[0])
+
+# Función para crear las tareas del lote a partir de la rejilla densidades x tamaños.
+# Cada tamaño es una cadena "FILASxCOLUMNAS" y cada combinación se repite 'repeticiones' veces.
+def tareas_desde_rejilla(densidades, tamaños, repeticiones, directorio_salida, semilla_base):
+    tareas = []
+    for tamaño in tamaños:
+        rows, cols = (int(valor) for valor in tamaño.lower().split('x'))
+        for densidad in densidades:
+            for _ in range(repeticiones):
+                indice = len(tareas)
+                tareas.append({
+                    'map': os.path.join(directorio_salida, f'map_{indice:05d}.csv'),
+                    'rows': rows,
+                    'cols': cols,
+                    'obstacle_density': densidad,
+                    'seed': semilla_lote(semilla_base, indice),
+                })
+    return tareas
+
+# Función para crear las tareas del lote a partir de un manifiesto CSV con cabecera
+# map,rows,cols,obstacle_density[,seed]. Las filas sin semilla reciben una derivada de la base.
+def tareas_desde_manifiesto(archivo_manifiesto, directorio_salida, semilla_base):
+    tareas = []
+    with open(archivo_manifiesto, 'r', newline='') as csvfile:
+        for indice, fila in enumerate(csv.DictReader(csvfile)):
+            semilla = fila.get('seed')
+            tareas.append({
+                'map': os.path.join(directorio_salida, fila['map']),
+                'rows': int(fila['rows']),
+                'cols': int(fila['cols']),
+                'obstacle_density': float(fila['obstacle_density']),
+                'seed': int(semilla) if semilla else semilla_lote(semilla_base, indice),
+            })
+    return tareas
+
+# Función que ejecuta cada proceso del lote: genera el laberinto, lo guarda en CSV (junto a su
+# índice de conectividad si se ha etiquetado) y escribe su .wbt (por teselas si teselas > 0).
+def generar_mapa_lote(tarea, compactar=False, binario=False, modo='keep', teselas=0, etiquetar=False):
+    generar = lambda semilla: generate_maze_grid(tarea['rows'], tarea['cols'], tarea['obstacle_density'], semilla)
+    maze, labels, semilla, resoluble, eliminados = generar_conectado(generar, tarea['seed'], modo, etiquetar)
+    save_maze_array_to_csv(maze, tarea['map'])
+    if labels is not None:
+        save_maze_labels(maze, labels, tarea['map'])
+    if binario:
+        save_maze_to_ogm(maze, tarea['map'])
+    if teselas:
+        num_celdas, num_cajas = generar_mapa_webots_teselas(tarea['map'], maze, teselas, compactar, verbose=False)
+    else:
+        num_celdas, num_cajas = generar_mapa_webots(tarea['map'], maze, compactar, verbose=False)
+    return {
+        'file': os.path.basename(tarea['map']),
+        'rows': maze.shape[0],
+        'cols': maze.shape[1],
+        'obstacle_density': tarea['obstacle_density'],
+        'free_ratio': round(1.0 - num_celdas / maze.size, 6),
+        'seed': semilla,
+        'boxes': num_cajas,
+        'components': int(labels.max()) if labels is not None else '',
+        'solvable': int(resoluble) if labels is not None else '',
+        'removed_obstacles': eliminados,
+    }
+
+# Función para generar todos los mapas del lote en paralelo y escribir el índice resumen (index.csv).
+def generar_lote(tareas, directorio_salida, compactar=False, procesos=None, binario=False, modo='keep', teselas=0,
+                 etiquetar=False):
+    os.makedirs(directorio_salida, exist_ok=True)
+    archivo_indice = os.path.join(directorio_salida, 'index.csv')
+    campos = ['file', 'rows', 'cols', 'obstacle_density', 'free_ratio', 'seed', 'boxes', 'components', 'solvable',
+              'removed_obstacles']
+    with ProcessPoolExecutor(max_workers=procesos) as executor, open(archivo_indice, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=campos)
+        writer.writeheader()
+        chunksize = max(1, len(tareas) // (4 * (procesos or os.cpu_count() or 1)))
+        resultados = executor.map(generar_mapa_lote, tareas, [compactar] * len(tareas), [binario] * len(tareas),
+                                  [modo] * len(tareas), [teselas] * len(tareas), [etiquetar] * len(tareas),
+                                  chunksize=chunksize)
+        for resultado in resultados:
+            writer.writerow(resultado)
+    return archivo_indice
 
 # Función principal del programa.
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--map", type=str, required=True, help="Nombre del archivo CSV del laberinto")
-    parser.add_argument("--name", type=str, required=True, help="Tu nombre para determinar las dimensiones del laberinto")
-    parser.add_argument("--surname", type=str, required=True, help="Tu apellido para determinar las dimensiones del laberinto")
+    parser.add_argument("--map", type=str, help="Nombre del archivo CSV del laberinto")
+    parser.add_argument("--name", type=str, help="Tu nombre para determinar las dimensiones del laberinto")
+    parser.add_argument("--surname", type=str, help="Tu apellido para determinar las dimensiones del laberinto")
     parser.add_argument("--obstacle-density", type=float, default=0.2, help="Densidad de obstáculos en el laberinto (valor entre 0 y 1)")
     parser.add_argument("--multiplication", type=int, default=1, help="Factor de multiplicación para el laberinto")
+    parser.add_argument("--seed", type=int, default=None, help="Semilla para reproducir el laberinto (aleatoria si no se indica)")
+    parser.add_argument("--compact", action="store_true", help="Agrupar las celdas ocupadas en rectángulos para reducir el número de cajas")
+    parser.add_argument("--binary", action="store_true", help="Guardar también el mapa en formato binario .ogm junto al CSV")
+    parser.add_argument("--unsolvable", choices=["keep", "reject", "repair"], default="keep",
+                        help="Si no hay ruta entre (1, 1) y (filas-2, columnas-2): dejar el mapa, generar otro o quitar los obstáculos mínimos")
+    parser.add_argument("--labels", action="store_true",
+                        help="Guardar el índice de conectividad (.labels) también con --unsolvable keep")
+    parser.add_argument("--tiles", type=int, default=0,
+                        help="Escribir el .wbt por teselas de TILES x TILES celdas (un PROTO por tesela e índice en <mapa>_tiles/)")
+    parser.add_argument("--corridor", action="store_true",
+                        help="Generar <mapa>_corridor.wbt con solo las teselas cercanas a la ruta A* de un mapa ya generado con --tiles")
+    parser.add_argument("--corridor-margin", type=int, default=margen_corredor, help="Corredor: celdas alrededor de la ruta")
+    parser.add_argument("--batch", action="store_true", help="Generar un lote de mapas en paralelo (rejilla de densidades y tamaños o manifiesto)")
+    parser.add_argument("--densities", type=str, default="0.2", help="Lote: densidades separadas por comas, p. ej. 0.1,0.2,0.3")
+    parser.add_argument("--sizes", type=str, default="40x20", help="Lote: tamaños FILASxCOLUMNAS separados por comas, p. ej. 40x20,200x100")
+    parser.add_argument("--repetitions", type=int, default=1, help="Lote: número de mapas por cada combinación densidad/tamaño")
+    parser.add_argument("--manifest", type=str, default=None, help="Lote: CSV con columnas map,rows,cols,obstacle_density[,seed]")
+    parser.add_argument("--output-dir", type=str, default=".", help="Lote: directorio donde se escriben los mapas y index.csv")
+    parser.add_argument("--workers", type=int, default=None, help="Lote: número de procesos (por defecto, uno por CPU)")
     args = parser.parse_args()
+
+    if args.tiles < 0:
+        parser.error("--tiles debe ser 0 (sin teselas) o el número de celdas por lado de cada tesela")
+    if args.corridor:
+        if args.map is None:
+            parser.error("--corridor necesita --map")
+        try:
+            generar_mundo_corredor(args.map, margen=args.corridor_margin)
+        except (OSError, ValueError, IndexError) as error:
+            print(f"Error: {error}")
+        return
+
+    if args.batch:
+        semilla_base = args.seed if args.seed is not None else 0
+        if args.manifest:
+            tareas = tareas_desde_manifiesto(args.manifest, args.output_dir, semilla_base)
+        else:
+            densidades = [float(valor) for valor in args.densities.split(',')]
+            tareas = tareas_desde_rejilla(densidades, args.sizes.split(','), args.repetitions, args.output_dir, semilla_base)
+        if not all(0 <= tarea['obstacle_density'] <= 1 for tarea in tareas):
+            print("Error: La densidad de obstáculos debe estar entre 0 y 1.")
+            return
+        archivo_indice = generar_lote(tareas, args.output_dir, args.compact, args.workers, args.binary, args.unsolvable,
+                                      args.tiles, args.labels)
+        print(f"Lote generado: {len(tareas)} mapas, índice en {archivo_indice}")
+        return
+
+    if args.map is None or args.name is None or args.surname is None:
+        parser.error("--map, --name y --surname son obligatorios si no se usa --batch")
     if not 0 <= args.obstacle_density <= 1:
         print("Error: La densidad de obstáculos debe estar entre 0 y 1.")
         return
-    maze = generate_maze(args.name, args.surname, args.obstacle_density, args.multiplication)
-    save_maze_to_csv(maze, args.map)
+    generar = lambda semilla: generate_maze_grid_from_name(args.name, args.surname, args.obstacle_density, args.multiplication, semilla)
+    maze, labels, semilla, resoluble, eliminados = generar_conectado(generar, args.seed, args.unsolvable, args.labels)
+    save_maze_array_to_csv(maze, args.map)
+    if labels is not None:
+        save_maze_labels(maze, labels, args.map)
+    if args.binary:
+        save_maze_to_ogm(maze, args.map)
 
-    print(f"Laberinto generado con dimensiones: {len(maze)}x{len(maze[0])}")
-    generar_mapa_webots(args.map)
+    print(f"Laberinto generado con dimensiones: {maze.shape[0]}x{maze.shape[1]}")
+    if labels is not None:
+        print(f"Componentes conexas: {labels.max()}, ruta entre inicio y meta: {'sí' if resoluble else 'no'}")
+    if args.unsolvable == 'reject' and not resoluble:
+        print(f"Aviso: no se ha generado un mapa con ruta en {max_intentos} intentos")
+    elif semilla != args.seed:
+        print(f"Mapa sin ruta descartado, semilla usada: {semilla}")
+    if eliminados:
+        print(f"Mapa reparado quitando {eliminados} obstáculos")
+    if args.tiles:
+        generar_mapa_webots_teselas(args.map, maze, args.tiles, args.compact)
+    else:
+        generar_mapa_webots(args.map, maze, args.compact)
 
 if __name__ == "__main__":
     main()
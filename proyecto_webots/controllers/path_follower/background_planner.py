@@ -0,0 +1,329 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Planificación en segundo plano para path_follower. La búsqueda se hace en un hilo aparte, que
+recibe las peticiones por una cola, y el bucle de control sigue llamando a robot.step()
+mientras tanto, así que nunca se pierden pasos esperando al planificador. El hilo es de tipo
+daemon: si la simulación termina en mitad de una búsqueda, el proceso del controlador sale sin
+esperar a que acabe.
+
+Cada petición publica en una cola hasta dos rutas:
+
+- una ruta parcial: A* limitado a PARTIAL_BUDGET celdas expandidas, hasta la celda expandida
+  más cercana a la meta (o hasta la meta si se alcanza). Tarda milisegundos y permite que el
+  robot empiece a moverse enseguida;
+- la ruta completa del planificador elegido.
+
+El bucle de control consulta la cola en cada paso con poll(), que nunca bloquea, y cambia de
+ruta entre dos pasos, así que el cambio es atómico para el control. Como el robot ya se ha
+movido por la ruta parcial, el hilo del planificador empalma la ruta completa con la celda en
+la que está el robot al terminar la búsqueda (splice_path) y el bucle de control la une a la
+posición del robot al recibirla (join_paths).
+
+Se mide la latencia de cada ruta (segundos de reloj desde la petición) y los pasos de control
+que pasan esperando: sin ninguna ruta (robot parado) y con la ruta parcial.
+
+Con 'delay_ticks' el planificador es determinista: no se usa ningún hilo y las búsquedas se
+hacen dentro de poll(), la parcial en la primera llamada y la completa cuando han pasado
+'delay_ticks' pasos de control desde la petición. Así el resultado de una simulación sin
+Webots no depende de lo que tarde el hilo en cada ejecución.
+"""
+import heapq
+import math
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from grid_astar import flatten_maze
+from path_smoothing import compress_path
+
+# Celdas que puede expandir la búsqueda de la ruta parcial
+PARTIAL_BUDGET = 2000
+
+# Ruta publicada por el planificador: parcial o completa, celdas, puntos de paso (suavizados en
+# el mismo hilo) y latencia [s] desde la petición
+PlanUpdate = namedtuple('PlanUpdate', ['partial', 'path', 'waypoints', 'latency'])
+
+# Función para buscar una ruta parcial: A* desde start limitado a 'budget' celdas expandidas.
+# Devuelve la ruta hasta la meta si se alcanza y, si no, hasta la celda expandida más cercana
+# a la meta (distancia Manhattan). Devuelve [start] si start está bloqueada.
+def partial_path(maze, start, goal, budget=PARTIAL_BUDGET):
+    grid, width = flatten_maze(maze)
+    start_index = (start[0] + 1) * width + start[1] + 1
+    goal_index = (goal[0] + 1) * width + goal[1] + 1
+    goal_row, goal_col = divmod(goal_index, width)
+    if grid[start_index]:
+        return [start]
+
+    def heuristic(index):
+        row, col = divmod(index, width)
+        return abs(row - goal_row) + abs(col - goal_col)
+
+    cost_so_far = {start_index: 0}
+    came_from = {start_index: -1}
+    closed = set()
+    frontier = [(heuristic(start_index), start_index)]
+    best = start_index
+    best_h = heuristic(start_index)
+    while frontier and len(closed) < budget:
+        _, current = heapq.heappop(frontier)
+        if current in closed:
+            continue
+        closed.add(current)
+        h = heuristic(current)
+        if h < best_h:
+            best, best_h = current, h
+        if current == goal_index:
+            break
+        new_cost = cost_so_far[current] + 1
+        for neighbor in (current + 1, current - 1, current + width, current - width):
+            if not grid[neighbor] and new_cost < cost_so_far.get(neighbor, math.inf):
+                cost_so_far[neighbor] = new_cost
+                came_from[neighbor] = current
+                heapq.heappush(frontier, (new_cost + heuristic(neighbor), neighbor))
+
+    path = []
+    current = best
+    while current != -1:
+        row, col = divmod(current, width)
+        path.append((row - 1, col - 1))
+        current = came_from[current]
+    path.reverse()
+    return path
+
+# Función para empalmar la ruta con la celda 'cell': búsqueda en anchura desde la celda hasta
+# las celdas de la ruta, eligiendo la que minimiza la distancia hasta ella más lo que queda de
+# ruta desde ella. Devuelve la ruta desde 'cell' hasta la meta, o la ruta sin cambios si la
+# celda está bloqueada o no llega a la ruta.
+def splice_path(maze, cell, path):
+    grid, width = flatten_maze(maze)
+    rows = len(grid) // width - 2
+    if not path or not (0 <= cell[0] < rows and 0 <= cell[1] < width - 2):
+        return path
+    origin = (cell[0] + 1) * width + cell[1] + 1
+    if grid[origin]:
+        return path
+    index = {(row + 1) * width + col + 1: i for i, (row, col) in enumerate(path)}
+    last = len(path) - 1
+    came_from = {origin: -1}
+    layer = [origin]
+    distance = 0
+    best = None
+    best_score = math.inf
+    # Más allá de la mejor puntuación ninguna celda puede mejorarla
+    while layer and distance < best_score:
+        next_layer = []
+        for current in layer:
+            i = index.get(current)
+            if i is not None and distance + last - i < best_score:
+                best, best_score = current, distance + last - i
+            for neighbor in (current + 1, current - 1, current + width, current - width):
+                if not grid[neighbor] and neighbor not in came_from:
+                    came_from[neighbor] = current
+                    next_layer.append(neighbor)
+        layer = next_layer
+        distance += 1
+    if best is None:
+        return path
+
+    prefix = []
+    current = came_from[best]
+    while current != -1:
+        row, col = divmod(current, width)
+        prefix.append((row - 1, col - 1))
+        current = came_from[current]
+    prefix.reverse()
+    return prefix + path[index[best]:]
+
+# Función para unir la ruta nueva a la posición actual del robot (fila, columna en celdas
+# reales), que sigue la ruta 'driven'. Si la celda del robot está en la ruta nueva se recorta
+# desde ella y, si no, se vuelve por 'driven' desde su celda más cercana al robot hasta la
+# última que también está en la ruta nueva. Devuelve (ruta unida, índice en ella de la celda
+# donde empieza la ruta nueva).
+def join_paths(driven, path, position):
+    index = {cell: i for i, cell in enumerate(path)}
+    here = (int(position[0]), int(position[1]))
+    if here in index:
+        return path[index[here]:], 0
+    if not driven:
+        return list(path), 0
+    nearest = min(range(len(driven)),
+                  key=lambda i: (driven[i][0] + 0.5 - position[0]) ** 2 + (driven[i][1] + 0.5 - position[1]) ** 2)
+    # Volver por la ruta recorrida hasta la última celda que también está en la ruta completa
+    back = nearest
+    while back > 0 and driven[back] not in index:
+        back -= 1
+    if driven[back] not in index:
+        return list(path), 0
+    prefix = driven[back:nearest + 1][::-1]
+    return prefix[:-1] + path[index[driven[back]]:], len(prefix) - 1
+
+# Función para obtener los puntos de paso de la ruta unida: los de la vuelta por la ruta
+# recorrida (comprimidos), las celdas de la ruta completa hasta su siguiente punto de paso y
+# el resto de puntos de paso de la ruta completa.
+def join_waypoints(joined, join_index, path, waypoints):
+    if not waypoints:
+        return compress_path(joined)
+    index = {cell: i for i, cell in enumerate(path)}
+    start = index[joined[join_index]]
+    following = [i for i in (index.get(point, -1) for point in waypoints) if i > start]
+    if not following:
+        return compress_path(joined)
+    # Las celdas de la ruta son contiguas, así que el tramo hasta el siguiente punto de paso
+    # siempre es transitable aunque el atajo original no lo sea desde la celda de unión
+    head = compress_path(joined[:join_index] + path[start:following[0] + 1])
+    return head + [path[i] for i in following[1:]]
+
+class BackgroundPlanner:
+    # plan_fn(maze, start, goal) -> ruta completa; smooth_fn(ruta) -> puntos de paso (o None
+    # para no suavizar); report_fn(ruta) se llama en el hilo del planificador después de
+    # publicar la ruta completa, para mostrarla sin retrasar el cambio de ruta; delay_ticks
+    # (None para usar el hilo) son los pasos de control hasta publicar la ruta completa en el
+    # modo determinista
+    def __init__(self, maze, plan_fn, smooth_fn=None, partial_budget=PARTIAL_BUDGET, report_fn=None,
+                 delay_ticks=None):
+        self.maze = maze
+        self.plan_fn = plan_fn
+        self.smooth_fn = smooth_fn
+        self.report_fn = report_fn
+        self.partial_budget = partial_budget
+        self.delay_ticks = delay_ticks
+        # Peticiones para el hilo del planificador y rutas (o errores) que publica
+        self.requests = queue.Queue()
+        self.updates = queue.Queue()
+        self.worker = None
+        if delay_ticks is None:
+            self.worker = threading.Thread(target=self.serve, name='planificador', daemon=True)
+            self.worker.start()
+        # Modo determinista: petición pendiente de búsqueda y pasos de control desde que se hizo
+        self.deferred = None
+        self.deferred_ticks = 0
+        # Hay una petición cuya ruta completa no se ha recibido todavía
+        self.pending = False
+        # Número de la petición en curso: se descartan las rutas de peticiones anteriores
+        self.request = 0
+        self.submitted = 0.0
+        # Celda del robot, actualizada por el bucle de control en cada paso
+        self.position = None
+        # Pasos de control de la petición en curso sin ruta y con la ruta parcial
+        self.idle_ticks = 0
+        self.partial_ticks = 0
+
+    # Lanza una petición en segundo plano. 'plan_fn' sustituye al planificador del constructor
+    # (por ejemplo para replanificar con D* Lite) y con partial=False no se busca ruta parcial.
+    def submit(self, start, goal, plan_fn=None, partial=True):
+        self.request += 1
+        self.submitted = time.perf_counter()
+        self.pending = True
+        self.idle_ticks = 0
+        self.partial_ticks = 0
+        plan_fn = plan_fn or self.plan_fn
+        partial = partial and self.partial_budget > 0
+        job = (self.request, self.submitted, start, goal, plan_fn, partial)
+        if self.worker is None:
+            self.deferred = job
+            self.deferred_ticks = 0
+        else:
+            self.requests.put(job)
+
+    # Bucle del hilo del planificador: atiende las peticiones en orden, salta las que ya ha
+    # sustituido otra más reciente y termina al recibir None. Los errores de la búsqueda se
+    # publican en la cola para lanzarlos en poll().
+    def serve(self):
+        while True:
+            job = self.requests.get()
+            if job is None:
+                return
+            if job[0] != self.request:
+                continue
+            try:
+                self.run(*job)
+            except Exception as error:
+                self.updates.put((job[0], error))
+
+    # Búsqueda de una petición: la ruta parcial (si se pide) y la completa
+    def run(self, request, submitted, start, goal, plan_fn, partial):
+        if partial:
+            self.run_partial(request, submitted, start, goal)
+        return self.run_full(request, submitted, start, goal, plan_fn, partial)
+
+    def run_partial(self, request, submitted, start, goal):
+        path = partial_path(self.maze, start, goal, self.partial_budget)
+        self.publish(request, submitted, True, path)
+
+    def run_full(self, request, submitted, start, goal, plan_fn, partial):
+        path = plan_fn(self.maze, start, goal)
+        # El robot ha podido avanzar por la ruta parcial durante la búsqueda
+        position = self.position
+        if partial and position is not None:
+            path = splice_path(self.maze, position, path)
+        self.publish(request, submitted, False, path)
+        if self.report_fn is not None and plan_fn is self.plan_fn:
+            self.report_fn(path)
+        return path
+
+    def publish(self, request, submitted, partial, path):
+        waypoints = self.smooth_fn(path) if self.smooth_fn is not None and path else None
+        self.updates.put((request, PlanUpdate(partial, path, waypoints, time.perf_counter() - submitted)))
+
+    # Modo determinista: hace en el bucle de control la parte de la búsqueda que toca en este paso
+    def step_deferred(self):
+        request, submitted, start, goal, plan_fn, partial = self.deferred
+        if partial and self.deferred_ticks == 0:
+            self.run_partial(request, submitted, start, goal)
+        if self.deferred_ticks >= self.delay_ticks:
+            self.deferred = None
+            self.run_full(request, submitted, start, goal, plan_fn, partial)
+        self.deferred_ticks += 1
+
+    # Ruta más reciente de la petición en curso, o None si no hay ninguna nueva. No bloquea
+    # (salvo en el modo determinista, que busca aquí); si la búsqueda ha fallado, la excepción
+    # se lanza aquí.
+    def poll(self):
+        if self.deferred is not None:
+            self.step_deferred()
+        latest = None
+        while True:
+            try:
+                request, update = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            if request != self.request:
+                continue
+            if isinstance(update, Exception):
+                self.pending = False
+                raise update
+            latest = update
+        if latest is not None and not latest.partial:
+            self.pending = False
+        return latest
+
+    # Hay una petición sin ruta completa todavía
+    def busy(self):
+        return self.pending
+
+    # Cuenta un paso de control mientras se espera la ruta completa: sin ruta o con la parcial
+    def tick(self, has_path):
+        if has_path:
+            self.partial_ticks += 1
+        else:
+            self.idle_ticks += 1
+
+    # Descripción de la espera de la petición en curso, para mostrar al recibir la ruta completa
+    def describe(self, update):
+        return (f"Ruta {'parcial' if update.partial else 'completa'} ({len(update.path)} celdas) en "
+                f"{update.latency * 1000:.1f} ms: {self.idle_ticks} pasos sin ruta, "
+                f"{self.partial_ticks} con la ruta parcial")
+
+    # Termina el hilo del planificador sin esperar a la búsqueda en curso: las peticiones que
+    # queden en la cola se descartan y la búsqueda en curso no retiene el proceso (daemon)
+    def shutdown(self):
+        self.request += 1
+        self.pending = False
+        self.deferred = None
+        if self.worker is not None:
+            self.requests.put(None)
@@ -0,0 +1,76 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Programa de control de path_follower precalculado a partir de la ruta. La ruta celda a celda
+se compila una sola vez en una lista de segmentos rectos, cada uno con el ángulo de la brújula
+que debe seguir el robot (0 abajo, 90 derecha, 180 arriba, 270 izquierda). Durante el bucle
+de control solo se consulta la celda objetivo y el ángulo del segmento actual, así que el
+trabajo por paso no depende del tamaño del mapa ni de la longitud de la ruta.
+"""
+import math
+
+# Ángulo de la brújula para moverse de la celda a a la celda b
+def step_heading(a, b):
+    return math.degrees(math.atan2(b[1] - a[1], b[0] - a[0])) % 360
+
+# Función para compilar la ruta en segmentos rectos.
+# Cada segmento es (ángulo, índice de la última celda del segmento en la ruta).
+def compile_schedule(path):
+    segments = []
+    for i in range(1, len(path)):
+        heading = step_heading(path[i - 1], path[i])
+        if segments and segments[-1][0] == heading:
+            segments[-1] = (heading, i)
+        else:
+            segments.append((heading, i))
+    return segments
+
+class PathSchedule:
+    def __init__(self, path):
+        self.path = path
+        self.segments = compile_schedule(path)
+        # Índice de la última celda alcanzada y del segmento que se está recorriendo
+        self.index = 0
+        self.segment = 0
+
+    def finished(self):
+        return self.index >= len(self.path) - 1
+
+    # Celda actual de la ruta y siguiente celda a alcanzar
+    def current(self):
+        return self.path[self.index]
+
+    def target(self):
+        return self.path[self.index + 1]
+
+    # Ángulo que debe seguir el robot para llegar a la celda objetivo
+    def heading(self):
+        return self.segments[self.segment][0]
+
+    # Ángulo a seguir desde la posición (fila, columna) en celdas: el del segmento, salvo que
+    # el robot se haya pasado del centro de la celda objetivo, en cuyo caso se vuelve hacia él
+    def heading_from(self, position, margin):
+        heading = self.segments[self.segment][0]
+        target = self.path[self.index + 1]
+        d_row = target[0] + 0.5 - position[0]
+        d_col = target[1] + 0.5 - position[1]
+        rad = math.radians(heading)
+        if d_row * math.cos(rad) + d_col * math.sin(rad) < -margin:
+            return step_heading(position, (target[0] + 0.5, target[1] + 0.5))
+        return heading
+
+    # Marca la celda objetivo como alcanzada
+    def advance(self):
+        self.index += 1
+        if self.segment < len(self.segments) - 1 and self.index >= self.segments[self.segment][1]:
+            self.segment += 1
+
+    # Celdas pendientes (incluida la actual) y celdas ya recorridas
+    def remaining(self):
+        return self.path[self.index:]
+
+    def completed(self):
+        return self.path[:self.index]
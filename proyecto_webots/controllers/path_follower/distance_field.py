@@ -0,0 +1,156 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Campos de distancia para resolver muchas consultas con la misma meta sobre un mapa.
+El campo se construye una vez con una búsqueda en anchura inversa desde la meta, avanzando
+el frente de onda entero en cada iteración con operaciones de NumPy. Después la ruta desde
+cualquier inicio se obtiene en O(longitud de la ruta) bajando por el campo: en cada paso se
+elige la vecina con distancia una unidad menor (en el orden de 'actions').
+
+Las rutas tienen la misma longitud que las de astar(), aunque con empates entre rutas
+óptimas pueden no ser las mismas celdas. Los campos se guardan en una caché LRU por
+(mapa, meta), limitada en número de campos.
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from grid_astar import flatten_maze
+
+# Distancia de las celdas desde las que no se puede llegar a la meta
+UNREACHABLE = -1
+
+# Número máximo de campos en la caché por defecto
+FIELD_CACHE_SIZE = 16
+
+class DistanceField:
+    def __init__(self, maze, goal):
+        grid, self.width = flatten_maze(maze)
+        self.goal = tuple(goal)
+        self.offsets = (1, -1, self.width, -self.width)
+        free = np.frombuffer(bytes(grid), dtype=np.uint8) == 0
+        field = np.full(len(grid), UNREACHABLE, dtype=np.int32)
+
+        # Búsqueda en anchura inversa: en cada iteración se etiqueta todo el frente de onda
+        goal_index = self.index(goal)
+        self.reached = 0
+        if free[goal_index]:
+            field[goal_index] = 0
+            offsets = np.array(self.offsets)
+            frontier = np.array([goal_index])
+            distance = 0
+            self.reached = 1
+            while frontier.size:
+                distance += 1
+                # El borde de paredes de flatten_maze evita salirse del array
+                neighbors = (frontier[:, None] + offsets).ravel()
+                neighbors = np.unique(neighbors[free[neighbors] & (field[neighbors] == UNREACHABLE)])
+                field[neighbors] = distance
+                self.reached += neighbors.size
+                frontier = neighbors
+
+        self.field = field
+        # memoryview para leer distancias como enteros de Python sin pasar por escalares de NumPy
+        self.values = memoryview(field)
+
+    def index(self, cell):
+        return (cell[0] + 1) * self.width + cell[1] + 1
+
+    # Número de pasos desde la celda hasta la meta (UNREACHABLE si no hay ruta)
+    def distance(self, cell):
+        return self.values[self.index(cell)]
+
+    # Ruta desde start hasta la meta bajando por el campo, o lista vacía si no hay ruta
+    def path_from(self, start):
+        values = self.values
+        width = self.width
+        node = self.index(start)
+        remaining = values[node]
+        path = [tuple(start)]
+        if path[0] == self.goal:
+            return path
+        if remaining == UNREACHABLE:
+            # Como en astar(), desde un inicio ocupado se puede salir a una vecina libre
+            options = [values[node + offset] for offset in self.offsets if values[node + offset] != UNREACHABLE]
+            if not options:
+                return []
+            remaining = min(options) + 1
+        while remaining > 0:
+            remaining -= 1
+            for offset in self.offsets:
+                if values[node + offset] == remaining:
+                    node += offset
+                    break
+            row, col = divmod(node, width)
+            path.append((row - 1, col - 1))
+        return path
+
+# Función para calcular la clave de un mapa a partir de su contenido.
+def maze_key(maze):
+    grid, width = flatten_maze(maze)
+    return hashlib.sha256(bytes(grid) + width.to_bytes(4, 'little')).hexdigest()
+
+class FieldCache:
+    def __init__(self, max_fields=FIELD_CACHE_SIZE):
+        self.max_fields = max_fields
+        self.fields = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Devuelve el campo de (mapa, meta), construyéndolo si no está. Si no se pasa map_key
+    # (por ejemplo el hash del fichero, path_cache.map_hash) se calcula a partir del contenido.
+    def get(self, maze, goal, map_key=None):
+        if map_key is None:
+            map_key = maze_key(maze)
+        key = (map_key, tuple(goal))
+        field = self.fields.get(key)
+        if field is not None:
+            self.fields.move_to_end(key)
+            self.hits += 1
+            return field
+        self.misses += 1
+        field = DistanceField(maze, goal)
+        self.fields[key] = field
+        # Expulsar los campos usados hace más tiempo
+        while len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+        return field
+
+    def clear(self):
+        self.fields.clear()
+
+# Caché compartida por el planificador 'field' de planners.py
+FIELD_CACHE = FieldCache()
+
+# Función para planificar con el campo de distancia de la meta (misma firma que astar).
+# La primera consulta a una meta construye el campo; las siguientes solo bajan por él.
+# Si se pasa el diccionario stats, se guarda en stats['expanded'] el número de celdas
+# etiquetadas al construir el campo (0 si ya estaba en la caché). Sin map_key (por ejemplo
+# path_cache.map_hash del fichero) cada consulta calcula el hash del contenido del mapa, que
+# es O(mapa); con él una consulta a un campo ya construido es O(longitud de la ruta).
+def field_plan(maze, start, goal, stats=None, cache=FIELD_CACHE, map_key=None):
+    misses = cache.misses
+    field = cache.get(maze, goal, map_key)
+    if stats is not None:
+        stats['expanded'] = field.reached if cache.misses > misses else 0
+    return field.path_from(start)
+
+# Función para resolver muchas consultas (start, goal) sobre un mismo mapa.
+# Agrupa las consultas por meta, así que el coste es un campo por meta distinta más O(ruta)
+# por consulta. Con una caché, los campos se reutilizan también entre llamadas.
+def plan_queries(maze, queries, cache=None, map_key=None):
+    if cache is not None and map_key is None:
+        map_key = maze_key(maze)
+    by_goal = {}
+    for i, (start, goal) in enumerate(queries):
+        by_goal.setdefault(tuple(goal), []).append(i)
+    paths = [None] * len(queries)
+    for goal, indices in by_goal.items():
+        field = cache.get(maze, goal, map_key) if cache is not None else DistanceField(maze, goal)
+        for i in indices:
+            paths[i] = field.path_from(queries[i][0])
+    return paths
@@ -0,0 +1,187 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Replanificación incremental con D* Lite (Koenig y Likhachev, versión optimizada).
+La búsqueda se hace desde la meta hacia el robot y se conserva entre llamadas: cuando el
+robot avanza solo se actualiza km, y cuando una celda pasa a estar ocupada o libre solo se
+reparan los nodos cuyo coste cambia, así que el coste de replanificar es proporcional al
+cambio y no al tamaño del mapa.
+
+Uso:
+    planner = DStarLite(maze, start, goal)
+    path = planner.plan()
+    ...
+    planner.move_to(celda_actual)
+    planner.update_cells([((fila, columna), 1)])  # 1 ocupada, 0 libre
+    path = planner.plan()
+
+Usa 4-conectividad y coste 1 por paso, como astar().
+"""
+import heapq
+
+from grid_astar import flatten_maze
+
+INF = float('inf')
+
+class DStarLite:
+    def __init__(self, maze, start, goal):
+        self.grid, self.width = flatten_maze(maze)
+        size = len(self.grid)
+        self.offsets = (1, -1, self.width, -self.width)
+        self.start = self.index(start)
+        self.goal = self.index(goal)
+        self.last = self.start
+        self.km = 0
+        self.g = [INF] * size
+        self.rhs = [INF] * size
+        # Clave actual de cada nodo en la cola (las entradas del heap con otra clave están obsoletas)
+        self.queued = {}
+        self.heap = []
+        self.expanded = 0
+        self.rhs[self.goal] = 0
+        self.push(self.goal, (self.heuristic(self.goal), 0))
+
+    # Conversión entre (fila, columna) e índice en la rejilla con borde
+    def index(self, cell):
+        return (cell[0] + 1) * self.width + cell[1] + 1
+
+    def cell(self, node):
+        row, col = divmod(node, self.width)
+        return (row - 1, col - 1)
+
+    # Distancia Manhattan desde la posición actual del robot
+    def heuristic(self, node):
+        row, col = divmod(node, self.width)
+        start_row, start_col = divmod(self.start, self.width)
+        return abs(row - start_row) + abs(col - start_col)
+
+    def key(self, node):
+        best = min(self.g[node], self.rhs[node])
+        return (best + self.heuristic(node) + self.km, best)
+
+    def push(self, node, key):
+        self.queued[node] = key
+        heapq.heappush(self.heap, (key[0], key[1], node))
+
+    # Devuelve (clave, nodo) de la cima válida de la cola, descartando entradas obsoletas
+    def top(self):
+        heap = self.heap
+        while heap:
+            k1, k2, node = heap[0]
+            if self.queued.get(node) == (k1, k2):
+                return (k1, k2), node
+            heapq.heappop(heap)
+        return (INF, INF), -1
+
+    def update_vertex(self, node):
+        if node != self.goal:
+            best = INF
+            if not self.grid[node]:
+                g = self.g
+                for offset in self.offsets:
+                    neighbor = node + offset
+                    if not self.grid[neighbor] and g[neighbor] + 1 < best:
+                        best = g[neighbor] + 1
+            self.rhs[node] = best
+        if self.g[node] != self.rhs[node]:
+            self.push(node, self.key(node))
+        elif node in self.queued:
+            del self.queued[node]
+
+    def compute_shortest_path(self):
+        g = self.g
+        rhs = self.rhs
+        while True:
+            top_key, node = self.top()
+            start_key = self.key(self.start)
+            if node < 0 or (top_key >= start_key and rhs[self.start] <= g[self.start]):
+                break
+            new_key = self.key(node)
+            if top_key < new_key:
+                self.push(node, new_key)
+                continue
+            heapq.heappop(self.heap)
+            del self.queued[node]
+            self.expanded += 1
+            if g[node] > rhs[node]:
+                g[node] = rhs[node]
+                for offset in self.offsets:
+                    neighbor = node + offset
+                    if not self.grid[neighbor]:
+                        self.update_vertex(neighbor)
+            else:
+                g[node] = INF
+                self.update_vertex(node)
+                for offset in self.offsets:
+                    neighbor = node + offset
+                    if not self.grid[neighbor]:
+                        self.update_vertex(neighbor)
+
+    # El robot se ha movido a la celda 'cell': se acumula km para no reordenar la cola
+    def move_to(self, cell):
+        node = self.index(cell)
+        if node == self.start:
+            return
+        self.start = node
+        self.km += self.heuristic(self.last)
+        self.last = node
+
+    # Marca celdas como ocupadas (1) o libres (0) y repara los nodos afectados.
+    # Devuelve el número de celdas que han cambiado realmente.
+    def update_cells(self, changes):
+        changed = 0
+        for (cell, occupied) in changes:
+            node = self.index(cell)
+            occupied = 1 if occupied else 0
+            if self.grid[node] == occupied:
+                continue
+            self.grid[node] = occupied
+            changed += 1
+            if occupied:
+                # Una celda ocupada deja de tener coste: se saca de la cola
+                self.g[node] = INF
+                self.rhs[node] = INF
+                self.queued.pop(node, None)
+            else:
+                self.update_vertex(node)
+            for offset in self.offsets:
+                neighbor = node + offset
+                if not self.grid[neighbor]:
+                    self.update_vertex(neighbor)
+        return changed
+
+    # Calcula (o repara) la ruta desde la posición actual hasta la meta.
+    # Devuelve la lista de celdas, o una lista vacía si la meta no es alcanzable.
+    def plan(self):
+        self.compute_shortest_path()
+        g = self.g
+        node = self.start
+        # Al terminar, rhs(start) es el coste exacto hasta la meta (g(start) puede no estarlo)
+        if self.rhs[node] == INF:
+            return []
+        path = [self.cell(node)]
+        while node != self.goal:
+            # Siguiente celda: la vecina con menor coste hasta la meta (orden de 'actions')
+            best = INF
+            next_node = -1
+            for offset in self.offsets:
+                neighbor = node + offset
+                if not self.grid[neighbor] and g[neighbor] < best:
+                    best = g[neighbor]
+                    next_node = neighbor
+            if next_node < 0 or len(path) > self.rhs[self.start]:
+                return []
+            node = next_node
+            path.append(self.cell(node))
+        return path
+
+# Planificación de una sola vez con D* Lite (misma firma que astar).
+def dstar_lite(maze, start, goal, stats=None):
+    planner = DStarLite(maze, start, goal)
+    path = planner.plan()
+    if stats is not None:
+        stats['expanded'] = planner.expanded
+    return path
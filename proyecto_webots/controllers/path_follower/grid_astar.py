@@ -0,0 +1,288 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Núcleo A* sobre un array plano de ocupación. Devuelve exactamente la misma ruta que
+astar() de maze_planning.py pero sin tuplas ni diccionarios en el bucle principal:
+
+- El laberinto se aplana a un bytearray con un borde de paredes, así los vecinos se
+  obtienen sumando desplazamientos precalculados (±1, ±ancho) sin comprobar límites.
+- El coste y el padre de cada celda están en listas preasignadas indexadas por celda.
+- La frontera se guarda por nivel de prioridad y dentro de cada nivel las celdas salen por
+  orden de índice. Como el índice plano crece con (fila, columna), el desempate es el mismo
+  que el de las tuplas (prioridad, celda) del astar() original. La mayoría de las celdas
+  llegan en orden creciente y van a una lista ordenada; solo las demás pasan por un heap.
+- Las celdas cerradas se marcan en la propia rejilla aplanada.
+"""
+import heapq
+import os
+import sys
+
+# Librería compartida del proyecto (rejilla de ocupación empaquetada en bits)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'libraries', 'python'))
+from occupancy_grid import OccupancyGrid
+from clearance_map import ClearanceMap
+from connectivity import grid_digest
+
+# Función para aplanar el laberinto (lista de listas, array u OccupancyGrid) añadiendo un borde
+# de paredes. Devuelve el bytearray de ocupación (1 = obstáculo) y el ancho de cada fila aplanada.
+def flatten_maze(maze):
+    if isinstance(maze, OccupancyGrid):
+        return maze.flatten()
+    rows = len(maze)
+    cols = len(maze[0])
+    width = cols + 2
+    grid = bytearray(b'\x01') * (width * (rows + 2))
+    for i, row in enumerate(maze):
+        inicio = (i + 1) * width + 1
+        # Camino rápido para filas de enteros 0/1 (load_map) o arrays uint8 (generador)
+        try:
+            cells = bytes(row)
+        except (TypeError, ValueError):
+            cells = b''
+        if len(cells) != cols:
+            cells = bytes(map(bool, row))
+        grid[inicio:inicio + cols] = cells
+    return grid, width
+
+# Función para encontrar la ruta óptima usando A* sobre el array plano.
+# Misma firma y resultado que astar(); si la meta no es alcanzable devuelve una lista vacía.
+# Si se pasa el diccionario stats, se guarda en stats['expanded'] el número de celdas expandidas.
+def astar_flat(maze, start, goal, stats=None):
+    grid, width = flatten_maze(maze)
+    size = len(grid)
+    start_index = (start[0] + 1) * width + start[1] + 1
+    goal_index = (goal[0] + 1) * width + goal[1] + 1
+    goal_row, goal_col = divmod(goal_index, width)
+
+    cost_so_far = [size] * size
+    came_from = [-1] * size
+    # Las celdas cerradas se marcan como obstáculos en la propia rejilla (flatten_maze
+    # devuelve una copia), así un mismo acceso descarta paredes y celdas ya expandidas.
+    # El inicio se expande aunque sea un obstáculo, como en astar().
+    grid[start_index] = 0
+    walls = grid.count(1)
+
+    # Con la distancia Manhattan un paso hacia la meta mantiene f y un paso en contra la
+    # aumenta en 2, así que en la frontera solo hay celdas con f mínima o f mínima + 2.
+    # Las de f + 2 se acumulan en una lista que pasa a ser la frontera cuando se agota el
+    # nivel actual. Las de f mínima se sacan por orden de índice (mismo desempate que las
+    # tuplas (prioridad, celda) de astar()) repartidas en tres sitios:
+    # - 'carry': el vecino de menor índice de la última expansión. Si es menor que todo lo
+    #   demás se expande directamente, sin pasar por ninguna cola;
+    # - 'run': una lista ordenada que se consume desde 'head'. Las celdas que llegan en orden
+    #   creciente (lo habitual al avanzar hacia la meta) se añaden al final;
+    # - 'frontier': un heap binario de índices para las que llegan desordenadas.
+    # Así la mayoría de las celdas no pasan por el heap.
+    goal_row_start = goal_row * width
+    goal_row_end = goal_row_start + width
+    cost_so_far[start_index] = 0
+    frontier = []
+    frontier_next = []
+    run = []
+    head = tail = 0
+    last = -1
+    run_append = run.append
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+    current = start_index
+    found = False
+
+    while True:
+        if not grid[current]:
+            if current == goal_index:
+                found = True
+                break
+            grid[current] = 1
+            new_cost = cost_so_far[current] + 1
+            col = current % width
+            carry = -1
+
+            # Vecinos en el mismo orden que 'actions': derecha, izquierda, abajo, arriba
+            neighbor = current + 1
+            if not grid[neighbor] and new_cost < cost_so_far[neighbor]:
+                cost_so_far[neighbor] = new_cost
+                came_from[neighbor] = current
+                if col < goal_col:
+                    carry = neighbor
+                else:
+                    frontier_next.append(neighbor)
+            neighbor = current - 1
+            if not grid[neighbor] and new_cost < cost_so_far[neighbor]:
+                cost_so_far[neighbor] = new_cost
+                came_from[neighbor] = current
+                if col > goal_col:
+                    carry = neighbor
+                else:
+                    frontier_next.append(neighbor)
+            neighbor = current + width
+            if not grid[neighbor] and new_cost < cost_so_far[neighbor]:
+                cost_so_far[neighbor] = new_cost
+                came_from[neighbor] = current
+                if current >= goal_row_start:
+                    frontier_next.append(neighbor)
+                elif carry < 0:
+                    carry = neighbor
+                elif neighbor >= last:
+                    run_append(neighbor)
+                    tail += 1
+                    last = neighbor
+                else:
+                    heappush(frontier, neighbor)
+            neighbor = current - width
+            if not grid[neighbor] and new_cost < cost_so_far[neighbor]:
+                cost_so_far[neighbor] = new_cost
+                came_from[neighbor] = current
+                if current < goal_row_end:
+                    frontier_next.append(neighbor)
+                else:
+                    # Arriba es el menor índice: pasa a ser 'carry' y el anterior se encola
+                    if carry < 0:
+                        pass
+                    elif carry >= last:
+                        run_append(carry)
+                        tail += 1
+                        last = carry
+                    else:
+                        heappush(frontier, carry)
+                    carry = neighbor
+
+            if carry >= 0:
+                if (head == tail or carry <= run[head]) and (not frontier or carry <= frontier[0]):
+                    current = carry
+                    continue
+                if carry >= last:
+                    run_append(carry)
+                    tail += 1
+                    last = carry
+                else:
+                    heappush(frontier, carry)
+
+        # Siguiente celda del nivel actual: la menor entre la cabeza de 'run' y el heap
+        if head < tail and (not frontier or run[head] <= frontier[0]):
+            current = run[head]
+            head += 1
+            if head == tail:
+                run.clear()
+                head = tail = 0
+                last = -1
+            elif head >= 4096:
+                # Descartar lo ya consumido para que 'run' no crezca con todo el nivel
+                del run[:head]
+                tail -= head
+                head = 0
+        elif frontier:
+            current = heappop(frontier)
+        elif frontier_next:
+            frontier = frontier_next
+            frontier_next = []
+            heapq.heapify(frontier)
+            current = heappop(frontier)
+        else:
+            break
+
+    if stats is not None:
+        stats['expanded'] = grid.count(1) - walls + found
+    if not found:
+        return []
+
+    # Reconstruir el camino pasando de índices planos a (fila, columna)
+    path = []
+    current = goal_index
+    while current != -1:
+        row, col = divmod(current, width)
+        path.append((row - 1, col - 1))
+        current = came_from[current]
+    path.reverse()
+
+    return path
+
+# Función para encontrar la ruta de menor coste usando A* sobre un mapa de costes (array
+# filas x columnas con el coste de entrar en cada celda, >= 1; ver clearance_map.py).
+# Con la distancia Manhattan como heurística (coste mínimo 1 por paso) la ruta es óptima.
+# Si la meta no es alcanzable devuelve una lista vacía. Si se pasa el diccionario stats, se
+# guarda en stats['expanded'] el número de celdas expandidas.
+def astar_weighted(maze, start, goal, costs, stats=None):
+    grid, width = flatten_maze(maze)
+    size = len(grid)
+    cols = width - 2
+    # Costes aplanados con el mismo borde que la rejilla (las celdas del borde no se visitan)
+    step_cost = [1.0] * size
+    for i, row in enumerate(costs):
+        inicio = (i + 1) * width + 1
+        step_cost[inicio:inicio + cols] = [float(value) for value in row]
+    start_index = (start[0] + 1) * width + start[1] + 1
+    goal_index = (goal[0] + 1) * width + goal[1] + 1
+    goal_row, goal_col = divmod(goal_index, width)
+
+    cost_so_far = [float('inf')] * size
+    came_from = [-1] * size
+    closed = bytearray(size)
+    cost_so_far[start_index] = 0.0
+    frontier = [(0.0, start_index)]
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+    offsets = (1, -1, width, -width)
+    found = False
+    expanded = 0
+
+    while frontier:
+        _, current = heappop(frontier)
+        if closed[current]:
+            continue
+        if current == goal_index:
+            found = True
+            break
+        closed[current] = 1
+        expanded += 1
+        current_cost = cost_so_far[current]
+        for offset in offsets:
+            neighbor = current + offset
+            if grid[neighbor] or closed[neighbor]:
+                continue
+            new_cost = current_cost + step_cost[neighbor]
+            if new_cost < cost_so_far[neighbor]:
+                cost_so_far[neighbor] = new_cost
+                came_from[neighbor] = current
+                row, col = divmod(neighbor, width)
+                heappush(frontier, (new_cost + abs(row - goal_row) + abs(col - goal_col), neighbor))
+
+    if stats is not None:
+        stats['expanded'] = expanded + found
+    if not found:
+        return []
+
+    path = []
+    current = goal_index
+    while current != -1:
+        row, col = divmod(current, width)
+        path.append((row - 1, col - 1))
+        current = came_from[current]
+    path.reverse()
+
+    return path
+
+# Mapas de holgura en memoria del planificador 'clearance' de planners.py, por contenido del mapa
+CLEARANCE_CACHE = {}
+
+# Función para planificar lejos de las paredes (misma firma que astar): A* con el mapa de
+# costes de holgura sobre el mapa inflado. Si en el mapa inflado no hay ruta (un pasillo más
+# estrecho que el robot inflado, o el inicio o la meta dentro de la inflación) se planifica
+# con los mismos costes sobre el mapa original. Si no se pasan los mapas de holgura (por
+# ejemplo los de clearance_map.load_clearance) se calculan y se guardan en memoria.
+def clearance_plan(maze, start, goal, stats=None, clearance=None):
+    if clearance is None:
+        key = grid_digest(maze)
+        clearance = CLEARANCE_CACHE.get(key)
+        if clearance is None:
+            CLEARANCE_CACHE.clear()
+            clearance = CLEARANCE_CACHE[key] = ClearanceMap.build(maze)
+    path = astar_weighted(clearance.inflated, start, goal, clearance.costs, stats)
+    if not path:
+        expanded = stats.get('expanded', 0) if stats is not None else 0
+        path = astar_weighted(maze, start, goal, clearance.costs, stats)
+        if stats is not None:
+            stats['expanded'] += expanded
+    return path
@@ -0,0 +1,383 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Planificador jerárquico (HPA*, Botea, Müller y Schaeffer) para laberintos muy grandes.
+
+- El mapa se divide en bloques (clusters) de CLUSTER_SIZE x CLUSTER_SIZE celdas.
+- En cada frontera entre dos bloques, cada tramo de celdas libres a ambos lados es una
+  entrada: si es corto se usa su celda central y si es largo sus dos extremos. Las celdas de
+  las entradas son los nodos del grafo abstracto, unidos con coste 1 a través de la frontera.
+- Dentro de cada bloque se precalcula la distancia entre cada par de entradas con búsquedas
+  en anchura limitadas al bloque. Se lanza a la vez la búsqueda desde la entrada k de todos
+  los bloques, como un único frente de onda de NumPy que no cruza fronteras.
+- Una consulta conecta el inicio y la meta con las entradas de su bloque, busca con A* en el
+  grafo abstracto y refina cada tramo dentro de su bloque.
+
+Las rutas son válidas celda a celda pero pueden ser algo más largas que las de astar(),
+porque solo se cruza de bloque por las entradas. La abstracción se guarda junto al mapa
+(map.csv -> map.hpa) con el hash del mapa, y las siguientes ejecuciones la leen en lugar de
+reconstruirla.
+"""
+import heapq
+import os
+from collections import deque
+
+import numpy as np
+
+from grid_astar import flatten_maze
+from distance_field import maze_key
+from path_cache import map_hash
+
+CLUSTER_SIZE = 16
+
+# Tramos de entrada con esta longitud o más se conectan por sus dos extremos
+LONG_ENTRANCE = 6
+
+VERSION = 1
+
+# Función para encontrar las transiciones a lo largo de un conjunto de fronteras.
+# 'both' es un array booleano (posición a lo largo de la frontera, frontera) con las celdas
+# libres a ambos lados; los tramos se cortan también en los límites de bloque.
+# Devuelve (posiciones, índices de frontera) de las transiciones.
+def border_transitions(both, cluster_size):
+    length = both.shape[0]
+    positions = np.arange(length)[:, None]
+    first = positions % cluster_size == 0
+    last = (positions % cluster_size == cluster_size - 1) | (positions == length - 1)
+    previous = np.zeros_like(both)
+    previous[1:] = both[:-1]
+    following = np.zeros_like(both)
+    following[:-1] = both[1:]
+    starts = both & (first | ~previous)
+    ends = both & (last | ~following)
+    # np.nonzero sobre la traspuesta ordena por frontera y después por posición,
+    # así el inicio y el final de cada tramo quedan emparejados
+    border, start = np.nonzero(starts.T)
+    _, end = np.nonzero(ends.T)
+    run = end - start + 1
+    short = run < LONG_ENTRANCE
+    positions = np.concatenate([(start + run // 2)[short], start[~short], end[~short]])
+    borders = np.concatenate([border[short], border[~short], border[~short]])
+    return positions, borders
+
+class HPAGraph:
+    def __init__(self, maze, cluster_size=CLUSTER_SIZE, data=None):
+        grid, width = flatten_maze(maze)
+        self.grid = grid
+        self.width = width
+        self.rows = len(maze)
+        self.cols = len(maze[0])
+        self.cluster_size = cluster_size
+        self.offsets = (1, -1, width, -width)
+
+        # Bloque de cada celda del array plano (-1 en el borde de paredes)
+        self.cluster_cols = -(-self.cols // cluster_size)
+        cluster = np.full((self.rows + 2, width), -1, dtype=np.int32)
+        rows_index = np.arange(self.rows)[:, None] // cluster_size
+        cols_index = np.arange(self.cols)[None, :] // cluster_size
+        cluster[1:-1, 1:-1] = rows_index * self.cluster_cols + cols_index
+        self.cluster_array = cluster.ravel()
+        self.cluster = memoryview(self.cluster_array)
+
+        if data is None:
+            data = self.build()
+        self.data = data
+        self.nodes = data['nodes'].tolist()
+        self.cluster_ptr = data['cluster_ptr'].tolist()
+        self.cluster_nodes = data['cluster_nodes'].tolist()
+        self.edge_ptr = data['edge_ptr'].tolist()
+        self.edge_to = data['edge_to'].tolist()
+        self.edge_cost = data['edge_cost'].tolist()
+
+    # Construcción de la abstracción: nodos, entradas por bloque y aristas (formato CSR)
+    def build(self):
+        size = self.cluster_size
+        width = self.width
+        free = np.frombuffer(bytes(self.grid), dtype=np.uint8) == 0
+        inner = free.reshape(self.rows + 2, width)[1:-1, 1:-1]
+
+        # Transiciones en fronteras verticales (entre columnas k*size - 1 y k*size)
+        positions, borders = border_transitions(inner[:, size - 1:self.cols - 1:size] & inner[:, size::size], size)
+        col = (borders + 1) * size
+        cells_a = [(positions + 1) * width + col]
+        cells_b = [(positions + 1) * width + col + 1]
+        # Transiciones en fronteras horizontales (entre filas k*size - 1 y k*size)
+        positions, borders = border_transitions((inner[size - 1:self.rows - 1:size, :] & inner[size::size, :]).T, size)
+        row = (borders + 1) * size
+        cells_a.append(row * width + positions + 1)
+        cells_b.append((row + 1) * width + positions + 1)
+        cells_a = np.concatenate(cells_a)
+        cells_b = np.concatenate(cells_b)
+
+        # Nodos: celdas distintas de las transiciones
+        nodes, inverse = np.unique(np.concatenate([cells_a, cells_b]), return_inverse=True)
+        node_a = inverse[:cells_a.size]
+        node_b = inverse[cells_a.size:]
+
+        # Entradas de cada bloque (tabla bloques x rango, -1 si no hay)
+        node_cluster = self.cluster_array[nodes]
+        clusters = -(-self.rows // size) * self.cluster_cols
+        order = np.argsort(node_cluster, kind='stable')
+        counts = np.bincount(node_cluster, minlength=clusters)
+        cluster_ptr = np.concatenate([[0], np.cumsum(counts)])
+        rank = np.arange(nodes.size) - cluster_ptr[node_cluster[order]]
+        table = np.full((clusters, max(int(counts.max(initial=0)), 1)), -1, dtype=np.int64)
+        table[node_cluster[order], rank] = order
+
+        # Distancias dentro de cada bloque: frente de onda desde la entrada k de todos los bloques
+        edges_from = [node_a, node_b]
+        edges_to = [node_b, node_a]
+        edges_cost = [np.ones(node_a.size, dtype=np.int64)] * 2
+        offsets = np.array(self.offsets)
+        distance = np.empty(free.size, dtype=np.int32)
+        # Para quitar duplicados del frente sin ordenar: cada celda se queda con la última
+        # posición que la escribe y solo se conserva esa aparición
+        owner = np.empty(free.size, dtype=np.int64)
+        # passable[d, i]: se puede pasar de la celda i a su vecina en la dirección d sin salir del bloque
+        passable = np.zeros((len(self.offsets), free.size), dtype=bool)
+        for d, offset in enumerate(self.offsets):
+            source = slice(max(0, -offset), free.size - max(0, offset))
+            target = slice(max(0, offset), free.size - max(0, -offset))
+            passable[d, source] = free[target] & (self.cluster_array[target] == self.cluster_array[source])
+        for k in range(table.shape[1]):
+            valid = table[:, k] >= 0
+            if not valid.any():
+                continue
+            frontier = nodes[table[valid, k]]
+            distance.fill(-1)
+            distance[frontier] = 0
+            step = 0
+            while frontier.size:
+                step += 1
+                neighbors = frontier[:, None] + offsets
+                allowed = passable[:, frontier].T & (distance[neighbors] < 0)
+                candidates = neighbors[allowed]
+                positions = np.arange(candidates.size)
+                owner[candidates] = positions
+                frontier = candidates[owner[candidates] == positions]
+                distance[frontier] = step
+            entries = table[valid]
+            found = distance[nodes[np.maximum(entries, 0)]]
+            found[entries < 0] = -1
+            mask = found > 0
+            edges_from.append(np.broadcast_to(table[valid, k][:, None], entries.shape)[mask])
+            edges_to.append(entries[mask])
+            edges_cost.append(found[mask].astype(np.int64))
+
+        edge_from = np.concatenate(edges_from)
+        order_edges = np.argsort(edge_from, kind='stable')
+        edge_ptr = np.concatenate([[0], np.cumsum(np.bincount(edge_from, minlength=nodes.size))])
+        # Los costes internos caben en uint16 (como mucho size * size pasos)
+        return {
+            'nodes': nodes.astype(np.int64),
+            'cluster_ptr': cluster_ptr.astype(np.int64),
+            'cluster_nodes': order.astype(np.int32),
+            'edge_ptr': edge_ptr.astype(np.int64),
+            'edge_to': np.concatenate(edges_to)[order_edges].astype(np.int32),
+            'edge_cost': np.concatenate(edges_cost)[order_edges].astype(np.uint16),
+        }
+
+    def index(self, cell):
+        return (cell[0] + 1) * self.width + cell[1] + 1
+
+    def cell(self, index):
+        row, col = divmod(index, self.width)
+        return (row - 1, col - 1)
+
+    # Búsqueda en anchura limitada al bloque de 'source'. Si se indica 'target' se para al
+    # encontrarla. Devuelve el diccionario de padres (y, por tanto, las celdas alcanzadas) y
+    # el de distancias.
+    def local_search(self, source, target=-1):
+        grid = self.grid
+        cluster = self.cluster
+        home = cluster[source]
+        parent = {source: -1}
+        distance = {source: 0}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            if current == target:
+                break
+            for offset in self.offsets:
+                neighbor = current + offset
+                if neighbor not in parent and not grid[neighbor] and cluster[neighbor] == home:
+                    parent[neighbor] = current
+                    distance[neighbor] = distance[current] + 1
+                    queue.append(neighbor)
+        return parent, distance
+
+    # Entradas del bloque de una celda con su distancia dentro del bloque
+    def cluster_links(self, distance, index):
+        home = self.cluster[index]
+        links = []
+        for i in range(self.cluster_ptr[home], self.cluster_ptr[home + 1]):
+            node = self.cluster_nodes[i]
+            d = distance.get(self.nodes[node])
+            if d is not None:
+                links.append((node, d))
+        return links
+
+    # Consulta: A* sobre el grafo abstracto y refinado local de cada tramo.
+    # Devuelve la ruta celda a celda o lista vacía si no hay ruta.
+    def plan(self, start, goal, stats=None):
+        start_index = self.index(start)
+        goal_index = self.index(goal)
+        if stats is not None:
+            stats['expanded'] = 0
+        if start_index == goal_index:
+            return [tuple(start)]
+        if self.grid[start_index] or self.grid[goal_index]:
+            return []
+
+        count = len(self.nodes)
+        START = count
+        GOAL = count + 1
+        start_parent, start_distance = self.local_search(start_index)
+        goal_parent, goal_distance = self.local_search(goal_index)
+        start_links = self.cluster_links(start_distance, start_index)
+        goal_links = dict(self.cluster_links(goal_distance, goal_index))
+        # Si están en el mismo bloque también se considera la ruta directa dentro de él
+        direct = start_distance.get(goal_index)
+
+        goal_row, goal_col = divmod(goal_index, self.width)
+        nodes = self.nodes
+        width = self.width
+
+        def heuristic(node):
+            row, col = divmod(nodes[node], width)
+            return abs(row - goal_row) + abs(col - goal_col)
+
+        # En la frontera se guarda -coste para que, a igual prioridad, salga antes el nodo más
+        # avanzado (con la distancia Manhattan hay muchos empates en mapas abiertos)
+        cost = {START: 0}
+        came_from = {START: -1}
+        frontier = []
+        for (node, d) in start_links:
+            if d < cost.get(node, d + 1):
+                cost[node] = d
+                came_from[node] = START
+                heapq.heappush(frontier, (d + heuristic(node), -d, node))
+        if direct is not None:
+            cost[GOAL] = direct
+            came_from[GOAL] = START
+            heapq.heappush(frontier, (direct, -direct, GOAL))
+
+        expanded = 0
+        closed = set()
+        while frontier:
+            _, current_cost, current = heapq.heappop(frontier)
+            current_cost = -current_cost
+            if current in closed or current_cost > cost[current]:
+                continue
+            if current == GOAL:
+                break
+            closed.add(current)
+            expanded += 1
+            neighbors = [(self.edge_to[i], self.edge_cost[i]) for i in range(self.edge_ptr[current], self.edge_ptr[current + 1])]
+            if current in goal_links:
+                neighbors.append((GOAL, goal_links[current]))
+            for (neighbor, edge_cost) in neighbors:
+                new_cost = current_cost + edge_cost
+                if new_cost < cost.get(neighbor, new_cost + 1):
+                    cost[neighbor] = new_cost
+                    came_from[neighbor] = current
+                    priority = new_cost + (0 if neighbor == GOAL else heuristic(neighbor))
+                    heapq.heappush(frontier, (priority, -new_cost, neighbor))
+        if stats is not None:
+            stats['expanded'] = expanded
+        if GOAL not in came_from:
+            return []
+
+        # Secuencia de nodos abstractos desde el inicio hasta la meta
+        sequence = []
+        node = GOAL
+        while node != -1:
+            sequence.append(node)
+            node = came_from[node]
+        sequence.reverse()
+
+        # Refinado: cada par de nodos consecutivos es un paso entre bloques o un tramo interno
+        location = lambda node: start_index if node == START else goal_index if node == GOAL else nodes[node]
+        path = [start_index]
+        for (u, v) in zip(sequence, sequence[1:]):
+            a = location(u)
+            b = location(v)
+            if a == b:
+                continue
+            if self.cluster[a] != self.cluster[b]:
+                path.append(b)
+                continue
+            if u == START:
+                parent = start_parent
+                segment = []
+                node = b
+                while node != a:
+                    segment.append(node)
+                    node = parent[node]
+                path.extend(reversed(segment))
+            elif v == GOAL:
+                # Los padres de la búsqueda desde la meta apuntan hacia ella
+                node = goal_parent[a]
+                while node != -1:
+                    path.append(node)
+                    node = goal_parent[node]
+            else:
+                parent, _ = self.local_search(a, b)
+                segment = []
+                node = b
+                while node != a:
+                    segment.append(node)
+                    node = parent[node]
+                path.extend(reversed(segment))
+        return [self.cell(index) for index in path]
+
+    # Guarda la abstracción con el hash del mapa y los parámetros con que se construyó (tamaño
+    # de bloque y LONG_ENTRANCE) para poder comprobar que sigue siendo válida
+    def save(self, path, digest=''):
+        with open(path, 'wb') as file:
+            np.savez(file, meta=np.array([VERSION, self.rows, self.cols, self.cluster_size, LONG_ENTRANCE]),
+                     digest=np.frombuffer(digest.encode(), dtype=np.uint8), **self.data)
+
+# Función para leer una abstracción guardada. Devuelve None si no existe o no corresponde
+# al mapa (hash, tamaño, tamaño de bloque o LONG_ENTRANCE distintos).
+def read_abstraction(path, maze, digest='', cluster_size=CLUSTER_SIZE):
+    try:
+        with np.load(path) as archive:
+            data = {name: archive[name] for name in archive.files}
+    except (OSError, ValueError, KeyError):
+        return None
+    meta = data.pop('meta', None)
+    saved_digest = data.pop('digest', np.zeros(0, dtype=np.uint8)).tobytes().decode(errors='replace')
+    if meta is None or meta.tolist() != [VERSION, len(maze), len(maze[0]), cluster_size, LONG_ENTRANCE] or saved_digest != digest:
+        return None
+    return HPAGraph(maze, cluster_size, data)
+
+# Función para obtener la abstracción de un fichero de mapa: la lee de map.hpa si es válida
+# y si no la construye y la guarda junto al mapa.
+def abstraction_for_map(map_file, maze, cluster_size=CLUSTER_SIZE):
+    digest = map_hash(map_file)
+    abstraction_file = os.path.splitext(map_file)[0] + '.hpa'
+    graph = read_abstraction(abstraction_file, maze, digest, cluster_size)
+    if graph is None:
+        graph = HPAGraph(maze, cluster_size)
+        try:
+            graph.save(abstraction_file, digest)
+        except OSError:
+            pass
+    return graph
+
+# Abstracciones en memoria del planificador 'hpa' de planners.py, por contenido del mapa
+GRAPH_CACHE = {}
+
+# Función para planificar con HPA* (misma firma que astar). La abstracción del mapa se
+# construye la primera vez y se reutiliza en las consultas siguientes sobre el mismo mapa.
+def hpa_plan(maze, start, goal, stats=None):
+    key = maze_key(maze)
+    graph = GRAPH_CACHE.get(key)
+    if graph is None:
+        GRAPH_CACHE.clear()
+        graph = GRAPH_CACHE[key] = HPAGraph(maze)
+    return graph.plan(start, goal, stats)
@@ -0,0 +1,285 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Jump Point Search (JPS) para los laberintos de coste uniforme del generador.
+En lugar de expandir todas las celdas libres de un pasillo, la búsqueda "salta" en línea
+recta hasta la siguiente celda con un vecino forzado (o la meta) y solo inserta esos puntos
+de salto en la frontera. Las rutas tienen el mismo coste que las de A*.
+
+Compensa cuando hay pocos puntos de salto. En los mapas del generador, con obstáculos sueltos,
+jps() encuentra un vecino forzado en casi todas las celdas de los saltos verticales y es más
+lento que astar_flat. jps8() solo es más rápido con densidades muy bajas y jps8() con
+corner_cutting hasta densidad 0.1 (ver benchmark_planners.py).
+
+- jps(): 4-conectividad, los mismos movimientos que 'actions' en maze_planning.py.
+- jps8(): 8-conectividad con reglas de esquina. Por defecto una diagonal solo se permite si
+  las dos celdas ortogonales que atraviesa están libres; con corner_cutting=True basta con
+  que lo esté una de ellas (nunca se pasa entre dos obstáculos en diagonal).
+
+Ambas reciben (maze, start, goal) igual que astar() y devuelven la ruta celda a celda
+(incluidas las celdas intermedias entre puntos de salto), o una lista vacía si no hay ruta.
+"""
+import heapq
+import math
+
+from grid_astar import flatten_maze
+
+SQRT2 = math.sqrt(2)
+
+# Marca de 'known' para los saltos rectos todavía sin calcular
+UNKNOWN = -2
+
+# Salto en línea recta sin ramas desde node con paso 'step' (±1 en horizontal, ±ancho en
+# vertical). Devuelve el índice del punto de salto o -1 si se llega a una pared.
+# El resultado solo depende de la celda de partida y de la dirección, y es el mismo para todas
+# las celdas recorridas hasta el punto de salto, así que se guarda para todas ellas en 'known'
+# (lista por celda de la rejilla aplanada): en toda la búsqueda cada celda se recorre como
+# mucho una vez por dirección. Con corner_cutting el vecino forzado está en diagonal hacia
+# delante (jps8).
+def jump_straight(grid, width, node, step, goal, known, corner_cutting=False):
+    side = width if step == 1 or step == -1 else 1
+    n = node + step
+    result = -1
+    while not grid[n]:
+        if n == goal:
+            result = n
+            break
+        if corner_cutting:
+            if (not grid[n + step + side] and grid[n + side]) or (not grid[n + step - side] and grid[n - side]):
+                result = n
+                break
+        # Vecino forzado: celda lateral libre cuyo lado anterior estaba bloqueado
+        elif (not grid[n + side] and grid[n - step + side]) or (not grid[n - side] and grid[n - step - side]):
+            result = n
+            break
+        if known[n] != UNKNOWN:
+            result = known[n]
+            break
+        n += step
+    known[node:n:step] = [result] * ((n - node) // step)
+    return result
+
+# Salto en línea recta (4-conectividad) desde node en la dirección (dr, dc).
+# Devuelve el índice del punto de salto o -1 si se llega a una pared. 'known' guarda los
+# saltos horizontales ya calculados por dirección (known[1] y known[-1], ver jump_straight).
+def jump4(grid, width, node, dr, dc, goal, known):
+    if dc:
+        return jump_straight(grid, width, node, dc, goal, known[dc])
+    step = dr * width
+    right = known[1]
+    left = known[-1]
+    n = node + step
+    while not grid[n]:
+        if n == goal:
+            return n
+        if (not grid[n + 1] and grid[n - step + 1]) or (not grid[n - 1] and grid[n - step - 1]):
+            return n
+        # En vertical también hay que parar si una rama horizontal encuentra un punto de salto
+        branch = right[n]
+        if branch == UNKNOWN:
+            branch = jump_straight(grid, width, n, 1, goal, right)
+        if branch >= 0:
+            return n
+        branch = left[n]
+        if branch == UNKNOWN:
+            branch = jump_straight(grid, width, n, -1, goal, left)
+        if branch >= 0:
+            return n
+        n += step
+    return -1
+
+# Direcciones a explorar desde node en 4-conectividad, podando según la dirección de llegada.
+def successors4(grid, width, dr, dc):
+    if dr == 0 and dc == 0:
+        return ((0, 1), (0, -1), (1, 0), (-1, 0))
+    if dc:
+        return ((0, dc), (1, 0), (-1, 0))
+    return ((dr, 0), (0, 1), (0, -1))
+
+# Comprueba si el movimiento diagonal desde n es válido según las reglas de esquina.
+def diagonal_allowed(grid, width, n, dr, dc, corner_cutting):
+    free_col = not grid[n + dc]
+    free_row = not grid[n + dr * width]
+    if corner_cutting:
+        return free_col or free_row
+    return free_col and free_row
+
+# Salto (8-conectividad) desde node en la dirección (dr, dc), recta o diagonal. 'known'
+# guarda los saltos rectos ya calculados por paso (±1, ±ancho; ver jump_straight).
+def jump8(grid, width, node, dr, dc, goal, corner_cutting, known):
+    if not (dr and dc):
+        step = dr * width + dc
+        return jump_straight(grid, width, node, step, goal, known[step], corner_cutting)
+    step = dr * width + dc
+    vertical = dr * width
+    across = known[dc]
+    along = known[vertical]
+    n = node + step
+    while not grid[n]:
+        if n == goal:
+            return n
+        if corner_cutting and ((not grid[n - dc + vertical] and grid[n - dc]) or
+                               (not grid[n + dc - vertical] and grid[n - vertical])):
+            return n
+        # En diagonal se para si alguna de las dos ramas rectas encuentra un punto de salto
+        branch = across[n]
+        if branch == UNKNOWN:
+            branch = jump_straight(grid, width, n, dc, goal, across, corner_cutting)
+        if branch >= 0:
+            return n
+        branch = along[n]
+        if branch == UNKNOWN:
+            branch = jump_straight(grid, width, n, vertical, goal, along, corner_cutting)
+        if branch >= 0:
+            return n
+        if not diagonal_allowed(grid, width, n, dr, dc, corner_cutting):
+            return -1
+        n += step
+    return -1
+
+# Direcciones a explorar desde node en 8-conectividad, podando según la dirección de llegada.
+def successors8(grid, width, node, dr, dc, corner_cutting):
+    directions = []
+    if dr == 0 and dc == 0:
+        for (r, c) in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+            directions.append((r, c))
+        for (r, c) in ((1, 1), (1, -1), (-1, 1), (-1, -1)):
+            if diagonal_allowed(grid, width, node, r, c, corner_cutting):
+                directions.append((r, c))
+        return directions
+
+    if dr and dc:
+        free_row = not grid[node + dr * width]
+        free_col = not grid[node + dc]
+        directions.append((dr, 0))
+        directions.append((0, dc))
+        if diagonal_allowed(grid, width, node, dr, dc, corner_cutting):
+            directions.append((dr, dc))
+        if corner_cutting:
+            if grid[node - dc] and free_row:
+                directions.append((dr, -dc))
+            if grid[node - dr * width] and free_col:
+                directions.append((-dr, dc))
+        return directions
+
+    # Movimiento recto: (dr, dc) hacia delante y los dos lados perpendiculares
+    sides = ((1, 0), (-1, 0)) if dc else ((0, 1), (0, -1))
+    directions.append((dr, dc))
+    for (r, c) in sides:
+        side = r * width + c
+        if corner_cutting:
+            # Solo la diagonal forzada junto a un obstáculo lateral
+            if grid[node + side] and not grid[node + dr * width + dc]:
+                directions.append((dr + r, dc + c))
+        else:
+            directions.append((r, c))
+            if not grid[node + dr * width + dc] and not grid[node + side]:
+                directions.append((dr + r, dc + c))
+    return directions
+
+# Función común de búsqueda sobre puntos de salto.
+# Si se pasa el diccionario stats, se guarda en stats['expanded'] el número de puntos de salto
+# expandidos.
+def jump_point_search(maze, start, goal, diagonal=False, corner_cutting=False, stats=None):
+    grid, width = flatten_maze(maze)
+    size = len(grid)
+    start_index = (start[0] + 1) * width + start[1] + 1
+    goal_index = (goal[0] + 1) * width + goal[1] + 1
+    goal_row, goal_col = divmod(goal_index, width)
+
+    def heuristic(node):
+        row, col = divmod(node, width)
+        d_row = abs(row - goal_row)
+        d_col = abs(col - goal_col)
+        if diagonal:
+            return max(d_row, d_col) + (SQRT2 - 1) * min(d_row, d_col)
+        return d_row + d_col
+
+    # Coste, padre y cerrados en listas indexadas por celda, como en astar_flat
+    cost_so_far = [math.inf] * size
+    came_from = [-1] * size
+    closed = bytearray(size)
+    # Saltos rectos ya calculados por paso (ver jump_straight)
+    steps = (1, -1, width, -width) if diagonal else (1, -1)
+    known = {step: [UNKNOWN] * size for step in steps}
+
+    cost_so_far[start_index] = 0
+    frontier = [(heuristic(start_index), start_index)]
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+    expanded = 0
+    found = False
+
+    while frontier:
+        _, current = heappop(frontier)
+        if closed[current]:
+            continue
+        if current == goal_index:
+            found = True
+            break
+        closed[current] = 1
+        expanded += 1
+
+        # Dirección de llegada (normalizada) para podar los sucesores
+        parent = came_from[current]
+        dr = dc = 0
+        if parent >= 0:
+            p_row, p_col = divmod(parent, width)
+            c_row, c_col = divmod(current, width)
+            dr = (c_row > p_row) - (c_row < p_row)
+            dc = (c_col > p_col) - (c_col < p_col)
+
+        if diagonal:
+            directions = successors8(grid, width, current, dr, dc, corner_cutting)
+        else:
+            directions = successors4(grid, width, dr, dc)
+
+        current_cost = cost_so_far[current]
+        for (r, c) in directions:
+            if diagonal:
+                jump_point = jump8(grid, width, current, r, c, goal_index, corner_cutting, known)
+            else:
+                jump_point = jump4(grid, width, current, r, c, goal_index, known)
+            if jump_point < 0 or closed[jump_point]:
+                continue
+            # Coste del tramo recto o diagonal hasta el punto de salto
+            distance = abs(jump_point - current) // abs(r * width + c)
+            new_cost = current_cost + (SQRT2 * distance if r and c else distance)
+            if new_cost < cost_so_far[jump_point]:
+                cost_so_far[jump_point] = new_cost
+                came_from[jump_point] = current
+                heappush(frontier, (new_cost + heuristic(jump_point), jump_point))
+
+    if stats is not None:
+        stats['expanded'] = expanded + found
+    if not found:
+        return []
+
+    # Reconstruir el camino rellenando las celdas entre puntos de salto consecutivos
+    jump_points = []
+    current = goal_index
+    while current != -1:
+        jump_points.append(current)
+        current = came_from[current]
+    jump_points.reverse()
+
+    path = [divmod(start_index, width)]
+    for previous, current in zip(jump_points, jump_points[1:]):
+        p_row, p_col = divmod(previous, width)
+        c_row, c_col = divmod(current, width)
+        dr = (c_row > p_row) - (c_row < p_row)
+        dc = (c_col > p_col) - (c_col < p_col)
+        for k in range(1, max(abs(c_row - p_row), abs(c_col - p_col)) + 1):
+            path.append((p_row + k * dr, p_col + k * dc))
+    return [(row - 1, col - 1) for (row, col) in path]
+
+# JPS con 4-conectividad (misma firma que astar).
+def jps(maze, start, goal, stats=None):
+    return jump_point_search(maze, start, goal, stats=stats)
+
+# JPS con 8-conectividad (misma firma que astar más las reglas de esquina).
+def jps8(maze, start, goal, corner_cutting=False, stats=None):
+    return jump_point_search(maze, start, goal, diagonal=True, corner_cutting=corner_cutting, stats=stats)
@@ -0,0 +1,116 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Carga del laberinto, A* de referencia y visualización por consola para path_follower.
+No depende del módulo 'controller' de Webots, así que se puede importar fuera del simulador
+(benchmarks, pruebas offline).
+"""
+import csv
+import heapq
+import os
+import sys
+
+# Librería compartida del proyecto (formato binario de mapas .ogm)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'libraries', 'python'))
+from occupancy_map import read_occupancy_grid
+
+# Función para cargar el laberinto desde el archivo CSV o .ogm. Un .ogm se carga como
+# OccupancyGrid (un bit por celda), que los planificadores aceptan igual que las listas.
+def load_map(file_path):
+    if file_path.endswith('.ogm'):
+        return read_occupancy_grid(file_path)[0]
+    maze = []
+    with open(file_path, 'r') as file:
+        reader = csv.reader(file)
+        for row in reader:
+            maze.append([int(cell) for cell in row])
+    return maze
+
+# Definición de acciones posibles (moverse hacia arriba, abajo, izquierda, derecha)
+actions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+# Función para obtener vecinos válidos de una celda
+def get_neighbors(maze, cell):
+    neighbors = []
+    rows = len(maze)
+    cols = len(maze[0])
+    for action in actions:
+        neighbor_row = cell[0] + action[0]
+        neighbor_col = cell[1] + action[1]
+        if 0 <= neighbor_row < rows and 0 <= neighbor_col < cols and maze[neighbor_row][neighbor_col] == 0:
+            neighbors.append((neighbor_row, neighbor_col))
+    return neighbors
+
+# Función de heurística (distancia Manhattan)
+def heuristic(cell, goal):
+    return abs(cell[0] - goal[0]) + abs(cell[1] - goal[1])
+
+# Función para encontrar la ruta óptima usando A*.
+# Si se pasa el diccionario stats, se guarda en stats['expanded'] el número de celdas extraídas.
+def astar(maze, start, goal, stats=None):
+    frontier = []
+    heapq.heappush(frontier, (0, start))
+    came_from = {}
+    cost_so_far = {}
+    came_from[start] = None
+    cost_so_far[start] = 0
+    
+    expanded = 0
+    while frontier:
+        current_cost, current_cell = heapq.heappop(frontier)
+        expanded += 1
+        
+        if current_cell == goal:
+            break
+        
+        for next_cell in get_neighbors(maze, current_cell):
+            new_cost = cost_so_far[current_cell] + 1
+            if next_cell not in cost_so_far or new_cost < cost_so_far[next_cell]:
+                cost_so_far[next_cell] = new_cost
+                priority = new_cost + heuristic(next_cell, goal)
+                heapq.heappush(frontier, (priority, next_cell))
+                came_from[next_cell] = current_cell
+    
+    if stats is not None:
+        stats['expanded'] = expanded
+
+    # Sin ruta a la meta (antes fallaba con KeyError al reconstruir el camino)
+    if goal not in came_from:
+        return []
+
+    # Reconstruir el camino
+    path = []
+    current_cell = goal
+    while current_cell != start:
+        path.append(current_cell)
+        current_cell = came_from[current_cell]
+    path.append(start)
+    path.reverse()
+    
+    return path
+
+# Función para mostrar el laberinto con el camino
+def print_maze_with_path(maze, path):
+    print_maze_with_path_completed(maze, path, [])
+
+# Igual que print_maze_with_path pero marcando con 'O' las celdas ya recorridas.
+# Las rutas se pasan a conjuntos y cada fila se imprime de una vez (con la ruta en una lista,
+# comprobar cada celda recorría la ruta entera).
+def print_maze_with_path_completed(maze, path,path_completed):
+    path = set(path)
+    path_completed = set(path_completed)
+    for i, row in enumerate(maze):
+        line = []
+        for j, cell in enumerate(row):
+            if (i, j) in path:
+                line.append('X ')
+            elif (i, j) in path_completed:
+                line.append('O ')
+            elif cell == 1:
+                line.append('# ')
+            else:
+                line.append('  ')
+        print(''.join(line))
@@ -0,0 +1,135 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Caché en disco de rutas planificadas. La clave es el hash del contenido del mapa junto con
+el inicio, la meta, el planificador y sus opciones (planners.planner_options), así que un
+arranque con el mismo mapa y la misma configuración no vuelve a planificar. Cada ruta se
+guarda en un fichero binario compacto:
+
+    b'PTH1' | fila inicio, columna inicio, número de celdas (3 x uint32 little endian)
+    | un byte por paso con el código de la dirección (índice en STEPS)
+
+La caché tiene un tamaño máximo en bytes; cuando se supera se borran las rutas usadas hace
+más tiempo (LRU, usando la fecha de modificación de cada fichero como último acceso).
+"""
+import hashlib
+import os
+import struct
+
+CACHE_DIR = '.path_cache'
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+MAGIC = b'PTH1'
+HEADER = struct.Struct('<4sIII')
+
+# Pasos unitarios posibles entre celdas consecutivas (4 y 8-conectividad)
+STEPS = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+STEP_CODES = {step: code for code, step in enumerate(STEPS)}
+
+# Función para calcular el hash del contenido del fichero del mapa.
+def map_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Función para construir la clave de la caché a partir del mapa, inicio, meta, planificador y
+# las opciones del planificador que cambian la ruta (pares (nombre, valor)).
+def path_key(map_digest, start, goal, planner='astar', options=()):
+    text = f"{map_digest}|{tuple(start)}|{tuple(goal)}|{planner}|{tuple(options)}"
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# Función para codificar una ruta celda a celda en el formato binario.
+# Devuelve None si la ruta tiene pasos que no son unitarios (no se puede cachear).
+def encode_path(path):
+    if not path:
+        return HEADER.pack(MAGIC, 0, 0, 0)
+    codes = bytearray(len(path) - 1)
+    for i in range(1, len(path)):
+        code = STEP_CODES.get((path[i][0] - path[i - 1][0], path[i][1] - path[i - 1][1]))
+        if code is None:
+            return None
+        codes[i - 1] = code
+    return HEADER.pack(MAGIC, path[0][0], path[0][1], len(path)) + bytes(codes)
+
+# Función para decodificar una ruta guardada. Devuelve None si el contenido no es válido.
+def decode_path(data):
+    if len(data) < HEADER.size:
+        return None
+    magic, row, col, count = HEADER.unpack_from(data)
+    if magic != MAGIC or len(data) != HEADER.size + max(count - 1, 0):
+        return None
+    if count == 0:
+        return []
+    path = [(row, col)]
+    for code in data[HEADER.size:]:
+        if code >= len(STEPS):
+            return None
+        d_row, d_col = STEPS[code]
+        row += d_row
+        col += d_col
+        path.append((row, col))
+    return path
+
+# Función para leer una ruta de la caché (None si no está). Marca la entrada como usada.
+def read_path(key, cache_dir=CACHE_DIR):
+    entry = os.path.join(cache_dir, key + '.path')
+    try:
+        with open(entry, 'rb') as file:
+            data = file.read()
+        os.utime(entry)
+    except OSError:
+        return None
+    return decode_path(data)
+
+# Función para borrar las rutas usadas hace más tiempo hasta quedar por debajo de max_bytes.
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.path'):
+            info = entry.stat()
+            entries.append((info.st_mtime, info.st_size, entry.path))
+            total += info.st_size
+    entries.sort()
+    for (_, entry_size, entry_path) in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(entry_path)
+        except OSError:
+            continue
+        total -= entry_size
+
+# Función para guardar una ruta en la caché. Devuelve False si la ruta no se puede codificar.
+def write_path(key, path, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    data = encode_path(path)
+    if data is None:
+        return False
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, key + '.path')
+    # Escritura atómica para que otro proceso nunca lea una ruta a medias
+    temporary = f"{entry}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, entry)
+    evict(cache_dir, max_bytes)
+    return True
+
+# Función para planificar usando la caché: si la ruta ya está guardada no se planifica.
+# plan_fn recibe (maze, start, goal); 'options' son las opciones que cambian su ruta.
+# Si ya se tiene el hash del fichero (map_hash) se puede pasar en map_digest para no leerlo otra
+# vez. Devuelve la ruta y si se ha leído de la caché.
+def cached_plan(map_file, maze, start, goal, plan_fn, planner='astar', options=(),
+                cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, map_digest=None):
+    key = path_key(map_digest or map_hash(map_file), start, goal, planner, options)
+    path = read_path(key, cache_dir)
+    if path is not None:
+        return path, True
+    path = plan_fn(maze, start, goal)
+    write_path(key, path, cache_dir, max_bytes)
+    return path, False
@@ -14,101 +14,54 @@ CONS:
 - Requiere un mapa del entorno.
 
 """
-import csv
-import heapq
 import math
+import os
+import sys
 from controller import Robot, Motor, DistanceSensor, GPS, InertialUnit, Compass
-
-# Función para cargar el laberinto desde el archivo CSV
-def load_map(file_path):
-    maze = []
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file)
-        for row in reader:
-            maze.append([int(cell) for cell in row])
-    return maze
-
-# Definición de acciones posibles (moverse hacia arriba, abajo, izquierda, derecha)
-actions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-
-# Función para obtener vecinos válidos de una celda
-def get_neighbors(maze, cell):
-    neighbors = []
-    rows = len(maze)
-    cols = len(maze[0])
-    for action in actions:
-        neighbor_row = cell[0] + action[0]
-        neighbor_col = cell[1] + action[1]
-        if 0 <= neighbor_row < rows and 0 <= neighbor_col < cols and maze[neighbor_row][neighbor_col] == 0:
-            neighbors.append((neighbor_row, neighbor_col))
-    return neighbors
-
-# Función de heurística (distancia Manhattan)
-def heuristic(cell, goal):
-    return abs(cell[0] - goal[0]) + abs(cell[1] - goal[1])
-
-# Función para encontrar la ruta óptima usando A*
-def astar(maze, start, goal):
-    frontier = []
-    heapq.heappush(frontier, (0, start))
-    came_from = {}
-    cost_so_far = {}
-    came_from[start] = None
-    cost_so_far[start] = 0
-    
-    while frontier:
-        current_cost, current_cell = heapq.heappop(frontier)
-        
-        if current_cell == goal:
-            break
-        
-        for next_cell in get_neighbors(maze, current_cell):
-            new_cost = cost_so_far[current_cell] + 1
-            if next_cell not in cost_so_far or new_cost < cost_so_far[next_cell]:
-                cost_so_far[next_cell] = new_cost
-                priority = new_cost + heuristic(next_cell, goal)
-                heapq.heappush(frontier, (priority, next_cell))
-                came_from[next_cell] = current_cell
-    
-    # Reconstruir el camino
-    path = []
-    current_cell = goal
-    while current_cell != start:
-        path.append(current_cell)
-        current_cell = came_from[current_cell]
-    path.append(start)
-    path.reverse()
-    
-    return path
-
-# Función para mostrar el laberinto con el camino
-def print_maze_with_path(maze, path):
-    for i, row in enumerate(maze):
-        for j, cell in enumerate(row):
-            if (i, j) in path:
-                print('X', end=' ')
-            elif cell == 1:
-                print('#', end=' ')
-            elif (i, j) == path[0]:
-                print('S', end=' ')
-            elif (i, j) == path[-1]:
-                print('M', end=' ')
-            else:
-                print(' ', end=' ')
-        print()
-        
-def print_maze_with_path_completed(maze, path,path_completed):
-    for i, row in enumerate(maze):
-        for j, cell in enumerate(row):
-            if (i, j) in path:
-                print('X', end=' ')
-            elif (i, j) in path_completed:
-                print('O', end=' ')
-            elif cell == 1:
-                print('#', end=' ')
-            else:
-                print(' ', end=' ')
-        print()
+from maze_planning import load_map, print_maze_with_path, print_maze_with_path_completed
+from planners import plan_path, planner_options
+from path_cache import cached_plan, map_hash
+from control_schedule import PathSchedule
+from path_smoothing import smooth_path, pursuit_speeds, PurePursuit
+from dstar_lite import DStarLite
+from hpa import abstraction_for_map
+from grid_astar import clearance_plan
+from clearance_map import load_clearance
+from connectivity import connected, load_labels
+from step_profiler import make_profiler
+from background_planner import BackgroundPlanner, PARTIAL_BUDGET, join_paths, join_waypoints
+
+# Mapa a cargar: el binario map.ogm si existe (se abre con memmap), si no map.csv
+MAP_FILE = 'map.ogm' if os.path.exists('map.ogm') else 'map.csv'
+
+# Planificador a usar: 'astar' por defecto, o el indicado en controllerArgs del mundo
+# ('jps', 'jps8', 'jps8_corner', 'dstar', 'field', 'hpa', 'clearance'; ver planners.py). Con
+# 'dstar' la ruta se repara durante la ejecución cuando los sensores frontales encuentran una
+# celda bloqueada. Con 'clearance' la ruta se aleja de las paredes usando el mapa de costes
+# de holgura (map.clearance, se calcula y guarda la primera vez).
+PLANNER = sys.argv[1] if len(sys.argv) > 1 else 'astar'
+
+# Suavizado de la ruta (segundo argumento, o la variable PATH_FOLLOWER_SMOOTHING): 'none' por
+# defecto para seguir la ruta celda a celda, 'compress' o 'shortcut' (ver path_smoothing.py).
+# Con 'dstar' no se suaviza.
+SMOOTHING = sys.argv[2] if len(sys.argv) > 2 else os.environ.get('PATH_FOLLOWER_SMOOTHING', 'none')
+
+# Umbral de los sensores de proximidad para considerar bloqueada la siguiente celda
+PROX_OBST = 100.0
+
+# Celdas que puede expandir la búsqueda de la ruta parcial con la que el robot empieza a
+# moverse mientras se calcula la ruta completa (0 para esperar a la ruta completa). Se puede
+# cambiar con la variable PATH_FOLLOWER_PARTIAL.
+PARTIAL_CELLS = int(os.environ.get('PATH_FOLLOWER_PARTIAL', PARTIAL_BUDGET))
+
+# Pasos de control hasta recibir la ruta completa con el planificador determinista (sin hilo,
+# ver background_planner.py). Vacío por defecto para planificar en segundo plano; headless_sim.py
+# lo fija con la variable PATH_FOLLOWER_PLAN_TICKS para que las ejecuciones sean reproducibles.
+PLAN_TICKS = int(os.environ['PATH_FOLLOWER_PLAN_TICKS']) if os.environ.get('PATH_FOLLOWER_PLAN_TICKS') else None
+
+# Vista de depuración (mapa con la ruta recorrida): periodo mínimo en segundos simulados entre
+# dos impresiones, 0 para desactivarla. Se puede cambiar con la variable PATH_FOLLOWER_DEBUG.
+DEBUG_VIEW_PERIOD = float(os.environ.get('PATH_FOLLOWER_DEBUG', '0'))
 
 def get_world_angle(compass_values):
     rad = math.atan2(compass_values[0], compass_values[1])
@@ -150,6 +103,13 @@ def move_forward(speed):
     left_motor.setVelocity(left_speed)
     right_motor.setVelocity(right_speed)
 
+def set_speeds(left_speed, right_speed):
+    
+    left_motor.setPosition(float('inf'))
+    right_motor.setPosition(float('inf'))
+    left_motor.setVelocity(left_speed)
+    right_motor.setVelocity(right_speed)
+
 def stop():
     
     left_motor.setPosition(float('inf'))
@@ -159,24 +119,14 @@ def stop():
 
 if __name__ == "__main__":
     # Cargar el laberinto
-    maze = load_map('map.csv')
+    maze = load_map(MAP_FILE)
 
     # Definir el punto de inicio y el punto de meta
     start = (1, 1)
     goal = (len(maze) - 2, len(maze[0]) - 2)
 
-    # Encontrar la ruta óptima
-    path = astar(maze, start, goal)
-    path_completed = []
-
-    # Mostrar el laberinto con el camino
-    print_maze_with_path(maze, path)
-
-    # Mostrar el camino en orden
-    print("Camino óptimo:")
-    for i, cell in enumerate(path):
-        if i > 0 and i < len(path) - 1:
-            print(f"{i+1} -> {cell}")
+    # Instrumentación por paso (se activa con la variable de entorno CONTROLLER_PROFILE)
+    profiler = make_profiler('path_follower')
 
     # Crear el robot
     robot = Robot()
@@ -200,104 +150,186 @@ if __name__ == "__main__":
     gps.enable(timestep)
     compass.enable(timestep)
 
+    # Sensores frontales para detectar celdas bloqueadas (solo con replanificación)
+    if PLANNER == 'dstar':
+        front_sensors = [robot.getDevice('ps0'), robot.getDevice('ps7')]
+        for sensor in front_sensors:
+            sensor.enable(timestep)
+
+    # Encontrar la ruta óptima ('astar' usa astar_flat, que devuelve la misma ruta que astar).
+    # Si el mapa no ha cambiado desde la última ejecución la ruta se lee de la caché.
+    # D* Lite no usa la caché: conserva su estado de búsqueda para replanificar.
+    # Con el índice de conectividad (map.labels, o calculado si no está) un mapa sin ruta se
+    # detecta en O(1) sin lanzar la búsqueda.
+    # Se ejecuta en el hilo del planificador, mientras el bucle de control sigue avanzando.
+    replanner = None
+    def plan_full(maze, start, goal):
+        global replanner
+        plan_stats = {}
+        with profiler.span('planificacion'):
+            labels = load_labels(MAP_FILE, maze)
+            if not connected(labels, start, goal):
+                print("No hay ruta entre el inicio y la meta")
+                path = []
+            elif PLANNER == 'dstar':
+                dstar = DStarLite(maze, start, goal)
+                path = dstar.plan()
+                plan_stats['expanded'] = dstar.expanded
+                replanner = dstar
+            else:
+                # El hash del fichero es la clave de la caché de rutas y, con 'field', la del mapa
+                # en la caché de campos
+                map_key = map_hash(MAP_FILE)
+                plan_fn = lambda maze, start, goal: plan_path(maze, start, goal, PLANNER, stats=plan_stats, map_key=map_key)
+                if PLANNER == 'hpa':
+                    # La abstracción jerárquica se lee de map.hpa (se construye y guarda la primera vez)
+                    plan_fn = lambda maze, start, goal: abstraction_for_map(MAP_FILE, maze).plan(start, goal, plan_stats)
+                elif PLANNER == 'clearance':
+                    plan_fn = lambda maze, start, goal: clearance_plan(maze, start, goal, plan_stats, load_clearance(MAP_FILE, maze))
+                path, cache_hit = cached_plan(MAP_FILE, maze, start, goal, plan_fn, PLANNER, planner_options(PLANNER),
+                                              map_digest=map_key)
+                if cache_hit:
+                    print("Ruta leída de la caché")
+        profiler.count('nodos_expandidos', plan_stats.get('expanded', 0))
+        return path
+
+    # Mostrar el laberinto con el camino (en el hilo del planificador, después de publicar la ruta)
+    def report_path(path):
+        print_maze_with_path(maze, path)
+
+        # Mostrar el camino en orden
+        print("Camino óptimo:")
+        for i, cell in enumerate(path):
+            if i > 0 and i < len(path) - 1:
+                print(f"{i+1} -> {cell}")
+
+    # Con suavizado el robot sigue los puntos de paso con pure pursuit, sin pararse en cada
+    # celda. D* Lite necesita la ruta celda a celda para poder repararla. El suavizado también
+    # se hace en el hilo del planificador.
+    smooth_fn = None
+    if PLANNER != 'dstar' and SMOOTHING != 'none':
+        smooth_fn = lambda path: smooth_path(maze, path, SMOOTHING)
+
+    # Planificador en segundo plano: primero publica una ruta parcial y después la completa
+    planner = BackgroundPlanner(maze, plan_full, smooth_fn, PARTIAL_CELLS, report_path, PLAN_TICKS)
+    planner.submit(start, goal)
+
+    # Ruta que sigue el robot (vacía hasta recibir la primera) y su programa de control: la
+    # ruta compilada en segmentos rectos con su ángulo
+    path = []
+    schedule = None
+    follower = None
+
+    max_speed = 6.28
+    angle_variation = 1
+    margin = 0.1
+    last_view = None
+
     # Bucle principal.
     while robot.step(timestep) != -1:
+        profiler.tick()
+
         # Obtener la posición del robot
-        gps_values = gps.getValues()
-        compass_values = compass.getValues()
-        angle = get_world_angle(compass_values)
-        #print(f"Posición: {gps_values}, Ángulo: {angle}")
-        actual_cell = (int(gps_values[0]*4), int(gps_values[1]*4))
+        with profiler.span('sensores'):
+            gps_values = gps.getValues()
+            angle = get_world_angle(compass.getValues())
         actual_cell_float = (gps_values[0]*4, gps_values[1]*4)
 
-        Kp = 0.1
-        max_speed = 6.28
-        angle_variation = 1
-
-        margin = 0.1
-
-
-        # Mover el robot a lo largo del camino
-        if len(path) > 1:
-            print("Siguiente celda: ", path[1], "Celda actual: ", actual_cell)
-            print_maze_with_path_completed(maze, path, path_completed)
-            if path[1][1]+ 0.5 +margin > actual_cell_float[1] and path[1][1]+0.5 - margin < actual_cell_float[1] and path[1][0]+0.5 + margin > actual_cell_float[0] and path[1][0]+0.5 - margin < actual_cell_float[0]:
-                print("pop")
-                path_completed.append(path.pop(0))
-            else:
-                #print("Moviendo hacia la celda, celda x actual: ", actual_cell[0], "celda y actual: ", actual_cell[1], "celda x siguiente: ", path[1][0], "celda y siguiente: ", path[1][1], "ángulo: ", angle)
-                if path[1][1] > actual_cell[1]: # Derecha
-                    idle_angle = 90
-                    if not(angle < idle_angle + angle_variation and angle > idle_angle - angle_variation):
-                        
-                        if abs(angle - idle_angle) < 20:
-                            speed = 1
-                        else:
-                            speed = max_speed
-                            
-                        if angle - idle_angle < 0:
-                            rotate_left(speed)
-                        else:
-                            rotate_right(speed)
-                    else:
-                        speed = max_speed
-                        move_forward(speed)
-
-                
-                elif path[1][1] < actual_cell[1]: # Izquierda
-                    idle_angle = 270
-                    if not(angle < idle_angle + angle_variation and angle > idle_angle - angle_variation):
-                        
-                        if abs(angle - idle_angle) < 20:
-                            speed = 1
-                        else:
-                            speed = max_speed
-                            
-                        if angle - idle_angle < 0:
-                            rotate_left(speed)
-                        else:
-                            rotate_right(speed)
-                    else:
-                        speed = max_speed
-                        move_forward(speed)
-                
-                elif path[1][0] < actual_cell[0]: # Arriba
-                    idle_angle = 180
-                    if not(angle < idle_angle + angle_variation and angle > idle_angle - angle_variation):
-                        
-                        if abs(angle - idle_angle) < 20:
-                            speed = 1
-                        else:
-                            speed = max_speed
-                            
-                        if angle - idle_angle < 0:
-                            rotate_left(speed)
-                        else:
-                            rotate_right(speed)
-                    else:
-                        speed = max_speed
-                        move_forward(speed)
-
-                
-                elif path[1][0] > actual_cell[0]: # Abajo
-                    idle_angle = 0
-                    if not(angle < idle_angle + angle_variation and angle > idle_angle - angle_variation):
-                        
-                        if abs(angle - idle_angle) < 20:
-                            speed = 1
-                        else:
-                            speed = max_speed
-                            
-                        if angle - idle_angle < 0:
-                            rotate_left(speed)
-                        else:
-                            rotate_right(speed)
-                    else:
-                        speed = max_speed
-                        move_forward(speed)
-        else:
+        # Ruta nueva del planificador: se cambia entre dos pasos. La completa se une a la
+        # posición actual del robot, que puede haber avanzado por la parcial.
+        planner.position = (int(actual_cell_float[0]), int(actual_cell_float[1]))
+        waiting = planner.busy()
+        update = planner.poll()
+        if update is not None:
+            print(planner.describe(update))
+            if not update.partial:
+                profiler.count('pasos_sin_ruta', planner.idle_ticks)
+                profiler.count('pasos_ruta_parcial', planner.partial_ticks)
+                profiler.count('latencia_ruta_us', int(update.latency * 1e6))
+                if not update.path:
+                    print("No hay ruta a la meta")
+                    stop()
+                    break
+            with profiler.span('cambio_de_ruta'):
+                path, join_index = join_paths(path, update.path, actual_cell_float)
+                schedule = PathSchedule(path)
+                follower = None
+                if update.waypoints is not None:
+                    waypoints = join_waypoints(path, join_index, update.path, update.waypoints)
+                    print(f"Puntos de paso ({SMOOTHING}): {len(waypoints)} de {len(path)} celdas")
+                    follower = PurePursuit(waypoints)
+                if replanner is not None and not update.partial:
+                    replanner.move_to(schedule.current())
+            waiting = planner.busy()
+        if waiting:
+            planner.tick(schedule is not None)
+
+        # Sin ruta todavía, o al final de la ruta parcial: el robot espera parado
+        if schedule is None or (waiting and schedule.finished()):
+            stop()
+            continue
+        if schedule.finished():
             print("Llegamos a la meta")
             stop()
-            
             break
-
+        target = schedule.target()
+
+        # Vista de depuración: como mucho una vez cada DEBUG_VIEW_PERIOD segundos simulados
+        if DEBUG_VIEW_PERIOD > 0 and (last_view is None or robot.getTime() - last_view >= DEBUG_VIEW_PERIOD):
+            with profiler.span('vista_depuracion'):
+                last_view = robot.getTime()
+                print("Siguiente celda: ", target, "Celda actual: ", (int(actual_cell_float[0]), int(actual_cell_float[1])))
+                print_maze_with_path_completed(maze, schedule.remaining(), schedule.completed())
+
+        with profiler.span('control'):
+            # Persecución del punto situado por delante del robot sobre los puntos de paso
+            if follower is not None:
+                heading = follower.heading(actual_cell_float, margin)
+                if heading is None:
+                    if waiting:
+                        stop()
+                        continue
+                    print("Llegamos a la meta")
+                    stop()
+                    break
+                set_speeds(*pursuit_speeds(angle, heading, max_speed))
+                continue
+
+            # Celda objetivo alcanzada: se pasa a la siguiente del segmento
+            if abs(target[0] + 0.5 - actual_cell_float[0]) < margin and abs(target[1] + 0.5 - actual_cell_float[1]) < margin:
+                schedule.advance()
+                profiler.count('celdas_alcanzadas')
+                if replanner is not None and not waiting:
+                    replanner.move_to(schedule.current())
+                continue
+
+            # Girar hasta el ángulo del segmento y avanzar
+            idle_angle = schedule.heading_from(actual_cell_float, margin)
+            aligned = abs(angle - idle_angle) < angle_variation
+            if aligned:
+                move_forward(max_speed)
+            else:
+                speed = 1 if abs(angle - idle_angle) < 20 else max_speed
+                if angle - idle_angle < 0:
+                    rotate_left(speed)
+                else:
+                    rotate_right(speed)
+
+            # Orientado hacia la siguiente celda y con un obstáculo delante: se marca como
+            # ocupada y D* Lite repara en segundo plano solo la parte de la ruta afectada; el
+            # robot espera parado a la ruta nueva
+            if replanner is not None and aligned and not waiting:
+                if all(sensor.getValue() > PROX_OBST for sensor in front_sensors):
+                    print("Celda bloqueada: ", target)
+                    profiler.count('replanificaciones')
+                    def replan(maze, start, goal, cell=target):
+                        with profiler.span('replanificacion'):
+                            replanner.update_cells([(cell, 1)])
+                            return replanner.plan()
+                    planner.submit(schedule.current(), goal, replan, partial=False)
+                    path = []
+                    schedule = None
+                    stop()
+
+    # El hilo del planificador no retiene el proceso si la simulación termina antes que él
+    planner.shutdown()
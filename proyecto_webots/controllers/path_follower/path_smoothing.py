@@ -0,0 +1,185 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Suavizado de rutas y control por persecución (pure pursuit) para path_follower.
+
+- compress_path(): reduce la ruta celda a celda a los extremos de sus tramos rectos.
+- shortcut_path(): sobre esos puntos de paso, une cada punto con el más lejano que se ve en
+  línea recta (ruta de cualquier ángulo, al estilo de Theta*). La línea de visión se comprueba
+  con un margen lateral CLEARANCE para que el cuerpo del e-puck no roce las esquinas.
+- PurePursuit: sigue la polilínea de puntos de paso apuntando a un punto situado LOOKAHEAD
+  celdas por delante de la proyección del robot sobre la ruta, sin pararse en cada celda.
+
+Las posiciones son (fila, columna) en celdas, con el centro de la celda (r, c) en
+(r + 0.5, c + 0.5), y los ángulos siguen el criterio de la brújula de path_follower
+(0 abajo, 90 derecha, 180 arriba, 270 izquierda).
+"""
+import math
+
+from grid_astar import flatten_maze
+from control_schedule import step_heading
+
+# Margen lateral de la línea de visión [celdas]: radio del e-puck (3.7 cm = 0.15 celdas) más holgura
+CLEARANCE = 0.2
+
+# Distancia del punto de persecución por delante del robot [celdas]
+LOOKAHEAD = 0.6
+
+# Ganancia del giro [rad/s de rueda por radián de error de orientación]
+TURN_GAIN = 4.0
+
+# Función para quedarse con los extremos de los tramos rectos de una ruta.
+def compress_path(path):
+    if len(path) < 3:
+        return list(path)
+    waypoints = [path[0]]
+    for i in range(1, len(path) - 1):
+        before = (path[i][0] - path[i - 1][0], path[i][1] - path[i - 1][1])
+        after = (path[i + 1][0] - path[i][0], path[i + 1][1] - path[i][1])
+        if before != after:
+            waypoints.append(path[i])
+    waypoints.append(path[-1])
+    return waypoints
+
+# Comprueba que el segmento de a a b (posiciones continuas) solo atraviesa celdas libres.
+# Recorre las celdas cortadas por el segmento (Amanatides-Woo); si pasa justo por una
+# esquina se comprueban también las dos celdas que la comparten.
+def segment_free(grid, width, a, b):
+    row, col = math.floor(a[0]), math.floor(a[1])
+    end_row, end_col = math.floor(b[0]), math.floor(b[1])
+    d_row = b[0] - a[0]
+    d_col = b[1] - a[1]
+    step_row = 1 if d_row > 0 else -1
+    step_col = 1 if d_col > 0 else -1
+    delta_row = abs(1 / d_row) if d_row else math.inf
+    delta_col = abs(1 / d_col) if d_col else math.inf
+    next_row = ((row + (step_row > 0)) - a[0]) / d_row if d_row else math.inf
+    next_col = ((col + (step_col > 0)) - a[1]) / d_col if d_col else math.inf
+
+    for _ in range(abs(end_row - row) + abs(end_col - col)):
+        if grid[(row + 1) * width + col + 1]:
+            return False
+        if next_row < next_col:
+            row += step_row
+            next_row += delta_row
+        elif next_col < next_row:
+            col += step_col
+            next_col += delta_col
+        else:
+            if grid[(row + step_row + 1) * width + col + 1] or grid[(row + 1) * width + col + step_col + 1]:
+                return False
+            row += step_row
+            col += step_col
+            next_row += delta_row
+            next_col += delta_col
+        if (row, col) == (end_row, end_col):
+            break
+    return not grid[(end_row + 1) * width + end_col + 1]
+
+# Línea de visión entre los centros de dos celdas con un margen lateral 'clearance':
+# se comprueban las dos rectas paralelas desplazadas ±clearance. Como el margen es menor que
+# media celda, ningún obstáculo puede quedar entre ellas sin cortar alguna.
+def line_of_sight(grid, width, a, b, clearance=CLEARANCE):
+    a = (a[0] + 0.5, a[1] + 0.5)
+    b = (b[0] + 0.5, b[1] + 0.5)
+    length = math.hypot(b[0] - a[0], b[1] - a[1])
+    if length == 0:
+        return not grid[(math.floor(a[0]) + 1) * width + math.floor(a[1]) + 1]
+    # Desplazamiento perpendicular al segmento
+    n_row = -(b[1] - a[1]) / length * clearance
+    n_col = (b[0] - a[0]) / length * clearance
+    return (segment_free(grid, width, (a[0] + n_row, a[1] + n_col), (b[0] + n_row, b[1] + n_col)) and
+            segment_free(grid, width, (a[0] - n_row, a[1] - n_col), (b[0] - n_row, b[1] - n_col)))
+
+# Función para acortar la ruta uniendo puntos de paso que se ven en línea recta.
+# Devuelve la lista de puntos de paso (celdas) desde el inicio hasta la meta.
+def shortcut_path(maze, path, clearance=CLEARANCE):
+    waypoints = compress_path(path)
+    if len(waypoints) < 3:
+        return waypoints
+    grid, width = flatten_maze(maze)
+    result = [waypoints[0]]
+    anchor = 0
+    while anchor < len(waypoints) - 1:
+        # El siguiente punto de paso siempre es visible (tramo recto de la ruta original)
+        reach = anchor + 1
+        while reach + 1 < len(waypoints) and line_of_sight(grid, width, waypoints[anchor], waypoints[reach + 1], clearance):
+            reach += 1
+        result.append(waypoints[reach])
+        anchor = reach
+    return result
+
+# Función para suavizar la ruta según el modo: 'none', 'compress' o 'shortcut'.
+def smooth_path(maze, path, mode='shortcut'):
+    if mode == 'none':
+        return list(path)
+    if mode == 'compress':
+        return compress_path(path)
+    if mode == 'shortcut':
+        return shortcut_path(maze, path)
+    raise ValueError(f"Modo de suavizado desconocido: {mode} (disponibles: none, compress, shortcut)")
+
+# Velocidades de las ruedas (izquierda, derecha) para orientarse hacia 'heading' desde 'angle'.
+# El avance se reduce con el error de orientación y es nulo si el error supera 90 grados.
+def pursuit_speeds(angle, heading, max_speed, turn_gain=TURN_GAIN):
+    error = math.radians((heading - angle + 180) % 360 - 180)
+    forward = max_speed * max(0.0, math.cos(error)) ** 2
+    turn = turn_gain * error
+    left = forward - turn
+    right = forward + turn
+    scale = max(abs(left), abs(right)) / max_speed
+    if scale > 1:
+        left /= scale
+        right /= scale
+    return left, right
+
+class PurePursuit:
+    def __init__(self, waypoints, lookahead=LOOKAHEAD):
+        self.points = [(row + 0.5, col + 0.5) for (row, col) in waypoints]
+        self.lookahead = lookahead
+        self.segment = 0
+
+    # Parámetro (0 a 1) de la proyección de la posición sobre el segmento i
+    def projection(self, i, position):
+        a = self.points[i]
+        b = self.points[i + 1]
+        d_row = b[0] - a[0]
+        d_col = b[1] - a[1]
+        length2 = d_row * d_row + d_col * d_col
+        if length2 == 0:
+            return 1.0
+        return ((position[0] - a[0]) * d_row + (position[1] - a[1]) * d_col) / length2
+
+    # Ángulo hacia el punto de persecución, o None si el robot ya está en la meta
+    def heading(self, position, tolerance):
+        goal = self.points[-1]
+        if math.hypot(goal[0] - position[0], goal[1] - position[1]) < tolerance:
+            return None
+        if len(self.points) < 2:
+            return step_heading(position, goal)
+
+        # Pasar al siguiente segmento cuando la proyección supera el final del actual
+        while self.segment < len(self.points) - 2 and self.projection(self.segment, position) >= 1:
+            self.segment += 1
+
+        # Avanzar LOOKAHEAD celdas sobre la polilínea desde la proyección del robot
+        i = self.segment
+        t = min(max(self.projection(i, position), 0.0), 1.0)
+        a = self.points[i]
+        b = self.points[i + 1]
+        point = (a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1]))
+        remaining = self.lookahead
+        while True:
+            length = math.hypot(b[0] - point[0], b[1] - point[1])
+            if length >= remaining or i == len(self.points) - 2:
+                ratio = min(remaining / length, 1.0) if length else 0.0
+                point = (point[0] + ratio * (b[0] - point[0]), point[1] + ratio * (b[1] - point[1]))
+                break
+            remaining -= length
+            i += 1
+            point = b
+            b = self.points[i + 1]
+        return step_heading(position, point)
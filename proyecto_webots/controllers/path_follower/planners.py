@@ -0,0 +1,66 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Planificadores disponibles para path_follower. Todos tienen la misma firma que astar():
+(maze, start, goal) -> lista de celdas (fila, columna) desde start hasta goal, o lista vacía
+si no hay ruta. El argumento opcional stats (diccionario) recibe el número de nodos
+expandidos en stats['expanded'].
+"""
+import os
+import sys
+
+from grid_astar import astar_flat, clearance_plan
+from jps import jps, jps8
+from dstar_lite import dstar_lite
+from distance_field import field_plan
+from hpa import hpa_plan, CLUSTER_SIZE, LONG_ENTRANCE
+
+# Librería compartida del proyecto (índice de conectividad de los mapas)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'libraries', 'python'))
+from connectivity import connected
+from clearance_map import CELL_SIZE, INFLATION_RADIUS, COST_DISTANCE, COST_WEIGHT
+
+PLANNERS = {
+    'astar': astar_flat,
+    # Con los obstáculos sueltos del generador 'jps' es más lento que 'astar' (ver jps.py); se
+    # mantiene para mapas casi vacíos y para compararlo con benchmark_planners.py
+    'jps': jps,
+    'jps8': jps8,
+    'jps8_corner': lambda maze, start, goal, stats=None: jps8(maze, start, goal, corner_cutting=True, stats=stats),
+    'dstar': dstar_lite,
+    'field': field_plan,
+    'hpa': hpa_plan,
+    'clearance': clearance_plan,
+}
+
+# Función para obtener las opciones que cambian la ruta de un planificador, además del mapa, el
+# inicio y la meta. Van en la clave de la caché de rutas (path_cache.cached_plan) para que una
+# ruta guardada con otra configuración no se reutilice.
+def planner_options(planner):
+    if planner in ('jps', 'jps8', 'jps8_corner'):
+        return (('diagonal', planner != 'jps'), ('corner_cutting', planner == 'jps8_corner'))
+    if planner == 'hpa':
+        return (('cluster_size', CLUSTER_SIZE), ('long_entrance', LONG_ENTRANCE))
+    if planner == 'clearance':
+        return (('cell_size', CELL_SIZE), ('inflation_radius', INFLATION_RADIUS),
+                ('cost_distance', COST_DISTANCE), ('weight', COST_WEIGHT))
+    return ()
+
+# Función para planificar con el planificador indicado por nombre.
+# Con las etiquetas de componentes del mapa (connectivity.py) se responde "sin ruta" en O(1)
+# sin lanzar la búsqueda cuando el inicio y la meta no están conectados. map_key identifica el
+# mapa en la caché de campos de 'field' (ver distance_field.field_plan) sin tener que calcular
+# el hash de su contenido en cada consulta.
+def plan_path(maze, start, goal, planner='astar', stats=None, labels=None, map_key=None):
+    if planner not in PLANNERS:
+        raise ValueError(f"Planificador desconocido: {planner} (disponibles: {', '.join(PLANNERS)})")
+    if labels is not None and not connected(labels, start, goal):
+        if stats is not None:
+            stats['expanded'] = 0
+        return []
+    if planner == 'field':
+        return field_plan(maze, start, goal, stats=stats, map_key=map_key)
+    return PLANNERS[planner](maze, start, goal, stats=stats)
@@ -0,0 +1,254 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Máquina de estados de Bug2 (bug_2_controller.py) separada del robot, en dos versiones:
+
+- bug2_step(): un paso para un robot. Es una función pura: recibe el estado (Bug2State), las
+  lecturas de los sensores, la posición, el rumbo y los parámetros, y devuelve el nuevo
+  estado, las velocidades de las ruedas y los mensajes que hay que mostrar. La usa el
+  controlador en cada paso de Webots.
+- Bug2Batch: la misma máquina para N robots a la vez, con el estado en arrays de NumPy
+  (código de estado, inicio y dirección de la m-line, punto de impacto) y un juego de
+  parámetros por robot. Sirve para barrer los parámetros sin Webots (evaluacion/bug2_sweep.py).
+
+Las dos versiones hacen las mismas comparaciones en el mismo orden, incluidas las
+particularidades del controlador original: el rumbo a la meta se calcula como
+grados(atan2(dy, dx) % 360) + 90 y, al volver a la m-line desde el seguimiento del
+obstáculo, ese paso no cambia las velocidades de las ruedas.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from bug_geometry import MLine
+
+# Estados, en el orden de sus códigos en Bug2Batch
+INICIO = 'inicio'
+MOVER_A_META = 'mover_a_meta'
+SEGUIR_OBSTACULO = 'seguir_obstaculo'
+FIN = 'fin'
+STATES = (INICIO, MOVER_A_META, SEGUIR_OBSTACULO, FIN)
+
+# Código de Bug2Batch para los robots que ya han terminado (el paso siguiente a 'fin')
+DONE = len(STATES)
+
+# Tolerancia de la m-line en 'mover_a_meta' [m] (la de MLine.contains)
+LINE_TOLERANCE = 0.02
+
+# Mensajes del controlador
+ALIGNING = 'Estado del robot: alineándose con la meta'
+MOVING = 'Estado del robot: moviéndose hacia la meta'
+FOLLOWING = 'Estado del robot: siguiendo el límite del obstáculo'
+REACHABLE = 'Estado del robot: meta alcanzable'
+ARRIVED = 'Estado del robot: meta alcanzada'
+
+# Parámetros de Bug2: paso de control [ms], velocidad máxima de las ruedas [rad/s], umbral de
+# los sensores de proximidad, distancia a la meta para detenerse y a la m-line para volver a
+# ella [m], tolerancia del rumbo al volver a la m-line [grados] y banda de alineación inicial
+# (el rumbo a la meta debe estar entre align_low y align_high veces el rumbo del robot)
+Bug2Params = namedtuple('Bug2Params', ['time_step', 'max_velocity', 'obstacle_threshold', 'goal_tolerance',
+                                       'angle_tolerance', 'align_low', 'align_high'])
+DEFAULT_PARAMS = Bug2Params(64, 6.28, 100.0, 0.07, 0.05, 0.98, 1.02)
+
+# Estado de un robot: estado de la máquina, inicio y m-line del tramo actual, punto de impacto
+Bug2State = namedtuple('Bug2State', ['mode', 'start', 'line', 'hit'])
+
+def initial_state():
+    return Bug2State(INICIO, None, None, None)
+
+# Distancia euclídea entre dos puntos (distancia_entre del controlador)
+def distance(a, b):
+    return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+
+# Rumbo de a hacia b en los grados del controlador (angulo_de)
+def bearing(a, b):
+    return math.degrees(math.atan2((b[1] - a[1]), (b[0] - a[0])) % 360) + 90
+
+# Rumbo del robot en grados a partir de la brújula (obtener_rumbo_en_grados del controlador)
+def compass_heading(north):
+    rumbo = (math.atan2(north[0], north[1]) - 1.5708) / 3.14 * 180.0 + 180
+    if rumbo < 0.0:
+        rumbo = rumbo + 360.0
+    return rumbo
+
+# Función para avanzar un paso la máquina de estados de Bug2. 'sensors' son los valores de
+# ps0..ps7, 'position' la del GPS y 'heading' el rumbo del robot (compass_heading).
+# Devuelve (nuevo estado, (velocidad izquierda, velocidad derecha) o None si las velocidades
+# no cambian en este paso, lista de mensajes).
+def bug2_step(state, sensors, position, heading, goal, params=DEFAULT_PARAMS):
+    mode, start, line, hit = state
+    speed = params.max_velocity
+    threshold = params.obstacle_threshold
+    left = right = 0.5 * speed
+    messages = []
+
+    if mode == INICIO:
+        start = position
+        line = MLine(start, goal)
+        target = bearing(position, goal)
+        aligned = params.align_low * heading < target < params.align_high * heading
+        if not aligned:
+            messages.append(ALIGNING)
+            left, right = -0.5 * speed, 0.5 * speed
+        else:
+            mode = MOVER_A_META
+
+    elif mode == MOVER_A_META:
+        if sensors[0] > threshold and sensors[7] > threshold:
+            hit = position
+            mode = SEGUIR_OBSTACULO
+        elif distance(position, goal) <= params.goal_tolerance:
+            mode = FIN
+        elif not line.contains(position, LINE_TOLERANCE):
+            # Volver a la m-line
+            error = heading - bearing(start, goal)
+            if error > params.angle_tolerance:
+                messages.append(ALIGNING)
+                left, right = 0.5 * speed, 0.1 * speed
+            elif error < -params.angle_tolerance:
+                messages.append(ALIGNING)
+                left, right = 0.1 * speed, 0.5 * speed
+        else:
+            messages.append(MOVING)
+
+    elif mode == SEGUIR_OBSTACULO:
+        messages.append(FOLLOWING)
+        on_line = line.contains(position, tolerance=params.goal_tolerance)
+        left_hit_point = distance(position, hit) > 1.5 * params.goal_tolerance
+        if on_line and left_hit_point:
+            messages.append(REACHABLE)
+            return Bug2State(MOVER_A_META, position, MLine(position, goal), hit), None, messages
+
+        if not sensors[2] > threshold:
+            left, right = -0.5 * speed, 0.5 * speed
+        else:
+            right_value = max(sensors[0:2])
+            left_value = max(sensors[5:7])
+            if right_value > 2.0 * threshold:
+                left, right = 0.20 * speed, 0.50 * speed
+            elif right_value < threshold and left_value < threshold:
+                left, right = 0.50 * speed, 0.20 * speed
+            else:
+                left, right = 0.50 * speed, 0.50 * speed
+
+    elif mode == FIN:
+        messages.append(ARRIVED)
+        left = right = 0.0
+
+    return Bug2State(mode, start, line, hit), (left, right), messages
+
+# Rumbo en los grados del controlador de N puntos hacia la meta (bearing vectorizado)
+def bearing_batch(x, y, goal):
+    return np.degrees(np.mod(np.arctan2(goal[1] - y, goal[0] - x), 360)) + 90
+
+# Rumbo del robot (compass_heading) a partir de su ángulo θ desde el eje x, con la brújula
+# de Webots en ENU: [sin θ, cos θ, 0]
+def heading_batch(theta):
+    rumbo = (np.arctan2(np.sin(theta), np.cos(theta)) - 1.5708) / 3.14 * 180.0 + 180
+    return np.where(rumbo < 0.0, rumbo + 360.0, rumbo)
+
+class Bug2Batch:
+    # 'params': Bug2Params con escalares o arrays de N valores (un juego por robot)
+    def __init__(self, count, goal, params=DEFAULT_PARAMS):
+        self.count = count
+        self.goal = (float(goal[0]), float(goal[1]))
+        self.params = Bug2Params(*(np.broadcast_to(np.asarray(value, dtype=np.float64), (count,)) for value in params))
+        self.mode = np.zeros(count, dtype=np.int8)
+        self.start_x = np.zeros(count)
+        self.start_y = np.zeros(count)
+        # Dirección normalizada y longitud de la m-line de cada robot (como en MLine)
+        self.ux = np.zeros(count)
+        self.uy = np.zeros(count)
+        self.length = np.zeros(count)
+        self.hit_x = np.zeros(count)
+        self.hit_y = np.zeros(count)
+        self.left = np.zeros(count)
+        self.right = np.zeros(count)
+
+    # Empieza un tramo nuevo desde la posición actual en los robots de la máscara
+    def reset_line(self, mask, x, y):
+        self.start_x[mask] = x[mask]
+        self.start_y[mask] = y[mask]
+        dx = self.goal[0] - x[mask]
+        dy = self.goal[1] - y[mask]
+        length = np.hypot(dx, dy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.ux[mask] = np.where(length > 0, dx / length, 0.0)
+            self.uy[mask] = np.where(length > 0, dy / length, 0.0)
+        self.length[mask] = length
+
+    # Distancia de cada punto a la m-line de su robot (MLine.distance)
+    def line_distance(self, x, y):
+        px = x - self.start_x
+        py = y - self.start_y
+        return np.where(self.length > 0, np.abs(self.ux * py - self.uy * px), np.hypot(px, py))
+
+    # Avanza un paso los robots de la máscara 'active' (todos si es None). sensors: N x 8,
+    # x, y: posición del GPS, heading: rumbo del robot (heading_batch). Actualiza self.left y
+    # self.right, que conservan su valor en los robots cuyas velocidades no cambian.
+    def step(self, sensors, x, y, heading, active=None):
+        params = self.params
+        speed = params.max_velocity
+        threshold = params.obstacle_threshold
+        tolerance = params.goal_tolerance
+        mode = self.mode.copy()
+        if active is None:
+            active = np.ones(self.count, dtype=bool)
+        left = 0.5 * speed
+        right = 0.5 * speed
+        changed = active.copy()
+
+        # inicio
+        start = active & (mode == 0)
+        self.reset_line(start, x, y)
+        target = bearing_batch(x, y, self.goal)
+        aligned = (params.align_low * heading < target) & (target < params.align_high * heading)
+        turn = start & ~aligned
+        left = np.where(turn, -0.5 * speed, left)
+        self.mode[start & aligned] = 1
+
+        # mover_a_meta
+        moving = active & (mode == 1)
+        obstacle = (sensors[:, 0] > threshold) & (sensors[:, 7] > threshold)
+        impact = moving & obstacle
+        self.hit_x[impact] = x[impact]
+        self.hit_y[impact] = y[impact]
+        self.mode[impact] = 2
+        arrived = moving & ~obstacle & (np.hypot(x - self.goal[0], y - self.goal[1]) <= tolerance)
+        self.mode[arrived] = 3
+        off_line = moving & ~obstacle & ~arrived & (self.line_distance(x, y) > LINE_TOLERANCE)
+        error = heading - bearing_batch(self.start_x, self.start_y, self.goal)
+        veer_right = off_line & (error > params.angle_tolerance)
+        veer_left = off_line & ~veer_right & (error < -params.angle_tolerance)
+        right = np.where(veer_right, 0.1 * speed, right)
+        left = np.where(veer_left, 0.1 * speed, left)
+
+        # seguir_obstaculo
+        following = active & (mode == 2)
+        back = (following & (self.line_distance(x, y) <= tolerance) &
+                (np.hypot(x - self.hit_x, y - self.hit_y) > 1.5 * tolerance))
+        self.mode[back] = 1
+        self.reset_line(back, x, y)
+        changed &= ~back
+        wall = following & ~back
+        uncovered = wall & ~(sensors[:, 2] > threshold)
+        right_value = np.maximum(sensors[:, 0], sensors[:, 1])
+        left_value = np.maximum(sensors[:, 5], sensors[:, 6])
+        covered = wall & ~uncovered
+        close = covered & (right_value > 2.0 * threshold)
+        lost = covered & ~close & (right_value < threshold) & (left_value < threshold)
+        left = np.where(uncovered, -0.5 * speed, np.where(close, 0.2 * speed, left))
+        right = np.where(lost, 0.2 * speed, right)
+
+        # fin: se paran las ruedas y el robot termina
+        finished = active & (mode == 3)
+        left = np.where(finished, 0.0, left)
+        right = np.where(finished, 0.0, right)
+        self.mode[finished] = DONE
+
+        self.left = np.where(changed, left, self.left)
+        self.right = np.where(changed, right, self.right)
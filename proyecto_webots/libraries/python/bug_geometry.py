@@ -0,0 +1,243 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Geometría para los algoritmos Bug, en metros y con las coordenadas del GPS (x, y).
+
+- MLine: la recta del inicio a la meta de un tramo (m-line). La dirección normalizada y la
+  longitud se calculan una vez al empezar el tramo, así que la distancia de un punto a la
+  recta en cada paso son dos productos, sin raíces.
+- ObstacleIndex: los bordes de los obstáculos de un mapa de ocupación como segmentos (cada
+  tramo recto de borde es un solo segmento), repartidos en una rejilla uniforme de cubetas.
+  La consulta del obstáculo más cercano recorre anillos de cubetas alrededor del punto y la
+  de intersección con un segmento recorre solo las cubetas que este atraviesa, así que el
+  coste depende de los obstáculos cercanos y no del tamaño del mapa. Las consultas no crean
+  listas ni arrays: los datos se guardan en listas planas y cada segmento se marca con el
+  número de consulta para no probarlo dos veces.
+
+La celda (fila, columna) del mapa ocupa [fila, fila+1] x [columna, columna+1] por el tamaño
+de celda, como en los mundos del generador, y fuera del mapa todo es obstáculo.
+"""
+import math
+
+import numpy as np
+
+# Tamaño de celda del mapa [m] (4 celdas por metro, como en el generador)
+CELL_SIZE = 0.25
+
+# Lado de las cubetas del índice, en celdas
+BUCKET_CELLS = 2
+
+class MLine:
+    def __init__(self, start, goal):
+        self.start = (start[0], start[1])
+        self.goal = (goal[0], goal[1])
+        dx = goal[0] - start[0]
+        dy = goal[1] - start[1]
+        self.length = math.hypot(dx, dy)
+        # Dirección normalizada (nula si inicio y meta coinciden)
+        self.ux = dx / self.length if self.length else 0.0
+        self.uy = dy / self.length if self.length else 0.0
+
+    # Distancia perpendicular de un punto a la recta (al inicio si la recta es un punto)
+    def distance(self, point):
+        px = point[0] - self.start[0]
+        py = point[1] - self.start[1]
+        if not self.length:
+            return math.hypot(px, py)
+        return abs(self.ux * py - self.uy * px)
+
+    # Avance del punto proyectado sobre la recta desde el inicio [m]
+    def progress(self, point):
+        return (point[0] - self.start[0]) * self.ux + (point[1] - self.start[1]) * self.uy
+
+    # Comprueba si el punto está sobre la recta con la tolerancia indicada
+    def contains(self, point, tolerance=0.02):
+        return self.distance(point) <= tolerance
+
+# Función para extraer los bordes entre celdas libres y ocupadas como segmentos
+# (x0, y0, x1, y1) en metros, uniendo en un segmento cada tramo recto de borde.
+def obstacle_segments(grid, cell_size=CELL_SIZE):
+    occupied = np.pad(np.asarray(grid) != 0, 1, constant_values=True)
+    segments = []
+    # Bordes horizontales (x constante) y verticales (y constante): se transpone la rejilla
+    # para tratar los dos casos igual
+    for transposed, mask in ((False, occupied), (True, occupied.T)):
+        # borders[i, j]: la frontera entre las filas i e i+1 de la rejilla con borde cambia de
+        # ocupación en la columna j
+        borders = mask[:-1, 1:-1] != mask[1:, 1:-1]
+        edges = np.pad(borders, ((0, 0), (1, 1)))
+        changes = np.diff(edges.astype(np.int8), axis=1)
+        line_start, col_start = np.nonzero(changes == 1)
+        line_end, col_end = np.nonzero(changes == -1)
+        # La línea i de la rejilla con borde es la coordenada i de la rejilla original
+        line = line_start.astype(float) * cell_size
+        low = col_start.astype(float) * cell_size
+        high = col_end.astype(float) * cell_size
+        if transposed:
+            segments.append(np.stack([low, line, high, line], axis=1))
+        else:
+            segments.append(np.stack([line, low, line, high], axis=1))
+    return np.concatenate(segments) if segments else np.empty((0, 4))
+
+# Distancia de (px, py) al segmento (x0, y0)-(x1, y1) alineado con los ejes
+def axis_segment_distance(px, py, x0, y0, x1, y1):
+    dx = px - min(max(px, x0), x1)
+    dy = py - min(max(py, y0), y1)
+    return math.hypot(dx, dy)
+
+class ObstacleIndex:
+    def __init__(self, grid, cell_size=CELL_SIZE, bucket_cells=BUCKET_CELLS):
+        grid = np.asarray(grid)
+        rows, cols = grid.shape
+        segments = obstacle_segments(grid, cell_size)
+        self.bucket_size = bucket_cells * cell_size
+        self.bucket_rows = -(-rows // bucket_cells) + 1
+        self.bucket_cols = -(-cols // bucket_cells) + 1
+
+        # Cubetas que cubre cada segmento (los segmentos del borde x = filas*celda caen en la
+        # última fila de cubetas, de ahí el +1)
+        b_x0 = np.floor(segments[:, 0] / self.bucket_size).astype(np.int64)
+        b_y0 = np.floor(segments[:, 1] / self.bucket_size).astype(np.int64)
+        b_x1 = np.floor(segments[:, 2] / self.bucket_size).astype(np.int64)
+        b_y1 = np.floor(segments[:, 3] / self.bucket_size).astype(np.int64)
+        span_x = b_x1 - b_x0 + 1
+        span_y = b_y1 - b_y0 + 1
+        counts = span_x * span_y
+        owner = np.repeat(np.arange(len(segments)), counts)
+        # Posición de cada entrada dentro del rectángulo de cubetas de su segmento
+        offset = np.arange(owner.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        bucket = (b_x0[owner] + offset // span_y[owner]) * self.bucket_cols + b_y0[owner] + offset % span_y[owner]
+        order = np.argsort(bucket, kind='stable')
+        ptr = np.zeros(self.bucket_rows * self.bucket_cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(bucket, minlength=self.bucket_rows * self.bucket_cols), out=ptr[1:])
+
+        # Listas planas para consultar sin escalares de NumPy
+        self.segments = segments
+        self.x0, self.y0, self.x1, self.y1 = (segments[:, i].tolist() for i in range(4))
+        self.bucket_ptr = ptr.tolist()
+        self.bucket_items = owner[order].tolist()
+        self.stamp = [0] * len(segments)
+        self.query = 0
+
+    def __len__(self):
+        return len(self.x0)
+
+    def bucket_of(self, x, y):
+        bx = min(max(math.floor(x / self.bucket_size), 0), self.bucket_rows - 1)
+        by = min(max(math.floor(y / self.bucket_size), 0), self.bucket_cols - 1)
+        return bx, by
+
+    # Obstáculo más cercano a (x, y): (distancia [m], índice del segmento), o (inf, -1) si no
+    # hay ninguno a menos de max_distance
+    def closest(self, x, y, max_distance=math.inf):
+        self.query += 1
+        query = self.query
+        stamp = self.stamp
+        ptr = self.bucket_ptr
+        items = self.bucket_items
+        x0, y0, x1, y1 = self.x0, self.y0, self.x1, self.y1
+        bx, by = self.bucket_of(x, y)
+        best = max_distance
+        best_segment = -1
+        size = self.bucket_size
+        ring = 0
+        max_ring = max(self.bucket_rows, self.bucket_cols)
+        # Lo que está en el anillo r queda fuera del bloque de los anillos anteriores, así que
+        # su distancia es al menos la del punto al borde de ese bloque
+        bound = -math.inf
+        while ring <= max_ring and bound < best:
+            for i in range(bx - ring, bx + ring + 1):
+                if i < 0 or i >= self.bucket_rows:
+                    continue
+                # En las filas intermedias del anillo solo las dos columnas de los extremos
+                step = 1 if i in (bx - ring, bx + ring) else max(2 * ring, 1)
+                for j in range(by - ring, by + ring + 1, step):
+                    if j < 0 or j >= self.bucket_cols:
+                        continue
+                    bucket = i * self.bucket_cols + j
+                    for k in range(ptr[bucket], ptr[bucket + 1]):
+                        segment = items[k]
+                        if stamp[segment] == query:
+                            continue
+                        stamp[segment] = query
+                        distance = axis_segment_distance(x, y, x0[segment], y0[segment], x1[segment], y1[segment])
+                        if distance < best:
+                            best = distance
+                            best_segment = segment
+            ring += 1
+            bound = min(x - (bx - ring + 1) * size, (bx + ring) * size - x,
+                        y - (by - ring + 1) * size, (by + ring) * size - y)
+        return (best, best_segment) if best_segment >= 0 else (math.inf, -1)
+
+    # Primer borde de obstáculo que corta el segmento de a a b: (t, índice del segmento) con t
+    # la fracción del recorrido (0 en a, 1 en b) del punto de corte, o None si no corta ninguno
+    def first_hit(self, a, b):
+        self.query += 1
+        query = self.query
+        stamp = self.stamp
+        ptr = self.bucket_ptr
+        items = self.bucket_items
+        ax, ay = a[0], a[1]
+        dx = b[0] - ax
+        dy = b[1] - ay
+        size = self.bucket_size
+        bx, by = self.bucket_of(ax, ay)
+        end_x, end_y = self.bucket_of(b[0], b[1])
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        delta_x = abs(size / dx) if dx else math.inf
+        delta_y = abs(size / dy) if dy else math.inf
+        next_x = ((bx + (step_x > 0)) * size - ax) / dx if dx else math.inf
+        next_y = ((by + (step_y > 0)) * size - ay) / dy if dy else math.inf
+
+        best = math.inf
+        best_segment = -1
+        while True:
+            bucket = bx * self.bucket_cols + by
+            for k in range(ptr[bucket], ptr[bucket + 1]):
+                segment = items[k]
+                if stamp[segment] == query:
+                    continue
+                stamp[segment] = query
+                t = self.segment_hit(ax, ay, dx, dy, segment)
+                if t < best:
+                    best = t
+                    best_segment = segment
+            # Los cortes dentro de esta cubeta son anteriores a los de las siguientes
+            t_exit = min(next_x, next_y)
+            if best <= t_exit or (bx, by) == (end_x, end_y) or t_exit > 1:
+                break
+            if next_x < next_y:
+                bx += step_x
+                next_x += delta_x
+            else:
+                by += step_y
+                next_y += delta_y
+            if not (0 <= bx < self.bucket_rows and 0 <= by < self.bucket_cols):
+                break
+        return (best, best_segment) if best_segment >= 0 else None
+
+    # Comprueba si el segmento de a a b corta algún borde de obstáculo
+    def intersects(self, a, b):
+        return self.first_hit(a, b) is not None
+
+    # Fracción t (0 a 1) del segmento a + t*(dx, dy) donde corta al segmento del índice, o inf
+    def segment_hit(self, ax, ay, dx, dy, segment):
+        x0, y0, x1, y1 = self.x0[segment], self.y0[segment], self.x1[segment], self.y1[segment]
+        if x0 == x1:
+            # Borde con x constante
+            if not dx:
+                return math.inf
+            t = (x0 - ax) / dx
+            if 0 <= t <= 1 and y0 <= ay + t * dy <= y1:
+                return t
+            return math.inf
+        if not dy:
+            return math.inf
+        t = (y0 - ay) / dy
+        if 0 <= t <= 1 and x0 <= ax + t * dx <= x1:
+            return t
+        return math.inf
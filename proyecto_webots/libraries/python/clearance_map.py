@@ -0,0 +1,198 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Mapas de holgura precalculados para planificar lejos de las paredes. A partir de la rejilla de
+ocupación se calcula:
+
+- La transformada de distancia euclídea (EDT): distancia en celdas del centro de cada celda
+  al centro de la celda ocupada más cercana. Se hace en dos pasadas separables vectorizadas
+  con NumPy (Felzenszwalb y Huttenlocher): primero la distancia vertical dentro de cada
+  columna, con un barrido hacia abajo y otro hacia arriba, y después, fila a fila, la
+  envolvente inferior de las parábolas (c - c')² + g(c')², avanzando todas las filas a la vez.
+- El mapa de obstáculos inflado (espacio de configuraciones): además de los obstáculos, las
+  celdas libres con holgura menor que INFLATION_RADIUS. Con la resolución de los mundos del
+  proyecto (4 celdas/m) la holgura mínima de una celda libre es media celda (0,125 m), mayor
+  que el radio del e-puck, así que el mapa inflado es igual al original: el e-puck cabe en
+  cualquier celda libre y lo que aleja la ruta de las paredes es el mapa de costes. La
+  inflación solo marca celdas con resoluciones de más de 13,5 celdas/m.
+- El mapa de costes: coste de entrar en cada celda libre, 1 lejos de los obstáculos y hasta
+  1 + COST_WEIGHT junto a ellos, creciendo linealmente cuando la holgura baja de
+  COST_DISTANCE. Con él A* prefiere rutas por el centro de los pasillos.
+
+La holgura de una celda es la distancia de su centro al borde del obstáculo más cercano,
+aproximada como (EDT - 0,5) celdas.
+
+Los tres mapas se guardan junto al mapa (map.csv -> map.clearance) con el hash de su contenido
+y los parámetros con los que se calcularon, y las siguientes ejecuciones los leen en lugar de
+recalcularlos.
+"""
+import os
+
+import numpy as np
+
+from connectivity import grid_digest
+from occupancy_map import RESOLUTION
+
+VERSION = 1
+
+# Tamaño de celda [m]
+CELL_SIZE = 1.0 / RESOLUTION
+
+# Radio de inflación [m]: el del cuerpo del e-puck (no infla nada a 4 celdas/m, ver arriba)
+INFLATION_RADIUS = 0.037
+
+# Holgura por debajo de la cual una celda se penaliza [m] y penalización máxima
+COST_DISTANCE = 0.5
+COST_WEIGHT = 4.0
+
+# Función para calcular la envolvente inferior de parábolas a lo largo del eje 1 de f:
+# d[i, q] = min_p (q - p)² + f[i, p]. Las filas avanzan a la vez; en cada columna q las
+# filas que tienen que descartar parábolas de su pila lo hacen en un bucle con máscara.
+def lower_envelope(f):
+    rows, n = f.shape
+    result = np.empty_like(f)
+    if n == 0 or rows == 0:
+        return result
+    all_rows = np.arange(rows)
+    # v: columnas de las parábolas de la envolvente, z: límites entre ellas, k: última parábola
+    v = np.zeros((rows, n), dtype=np.int64)
+    z = np.empty((rows, n + 1))
+    z[:, 0] = -np.inf
+    z[:, 1] = np.inf
+    k = np.zeros(rows, dtype=np.int64)
+
+    # Intersección de la parábola de q con la última de la pila de cada fila
+    def intersection(q, selected):
+        p = v[selected, k[selected]]
+        return ((f[selected, q] + q * q) - (f[selected, p] + p * p)) / (2.0 * (q - p))
+
+    for q in range(1, n):
+        s = intersection(q, all_rows)
+        pending = all_rows[s <= z[all_rows, k]]
+        while pending.size:
+            k[pending] -= 1
+            s[pending] = intersection(q, pending)
+            pending = pending[s[pending] <= z[pending, k[pending]]]
+        k += 1
+        v[all_rows, k] = q
+        z[all_rows, k] = s
+        z[all_rows, k + 1] = np.inf
+
+    k[:] = 0
+    for q in range(n):
+        pending = all_rows[z[all_rows, k + 1] < q]
+        while pending.size:
+            k[pending] += 1
+            pending = pending[z[pending, k[pending] + 1] < q]
+        p = v[all_rows, k]
+        result[:, q] = (q - p) ** 2 + f[all_rows, p]
+    return result
+
+# Función para calcular la transformada de distancia euclídea de una rejilla 0/1 (array, lista
+# de listas u OccupancyGrid). Devuelve un array float32 con la distancia en celdas de cada celda
+# a la celda ocupada más cercana (0 en los obstáculos, inf si el mapa no tiene obstáculos).
+def distance_transform(grid):
+    occupied = np.asarray(grid) != 0
+    rows, cols = occupied.shape
+    if not occupied.any():
+        return np.full((rows, cols), np.inf, dtype=np.float32)
+    # Distancia "infinita" mayor que cualquiera posible dentro del mapa
+    far = float(rows + cols)
+
+    # Primera pasada: distancia vertical al obstáculo más cercano de la misma columna
+    vertical = np.where(occupied, 0.0, far)
+    for row in range(1, rows):
+        np.minimum(vertical[row], vertical[row - 1] + 1, out=vertical[row])
+    for row in range(rows - 2, -1, -1):
+        np.minimum(vertical[row], vertical[row + 1] + 1, out=vertical[row])
+
+    # Segunda pasada: envolvente inferior de las parábolas de cada fila
+    squared = lower_envelope(np.minimum(vertical, far) ** 2)
+    return np.sqrt(squared).astype(np.float32)
+
+# Función para obtener la holgura [m] de cada celda a partir de la EDT (0 en los obstáculos).
+def clearance_from_distance(distance, cell_size=CELL_SIZE):
+    return np.maximum(distance - 0.5, 0.0) * cell_size
+
+# Función para obtener el mapa inflado: 1 en los obstáculos y en las celdas con holgura < radius.
+def inflate_obstacles(distance, radius=INFLATION_RADIUS, cell_size=CELL_SIZE):
+    return ((distance == 0) | (clearance_from_distance(distance, cell_size) < radius)).astype(np.uint8)
+
+# Función para obtener el mapa de costes: coste de entrar en cada celda libre (inf en los obstáculos).
+def clearance_costs(distance, cell_size=CELL_SIZE, cost_distance=COST_DISTANCE, weight=COST_WEIGHT):
+    clearance = clearance_from_distance(distance, cell_size)
+    penalty = np.clip((cost_distance - clearance) / cost_distance, 0.0, 1.0) if cost_distance > 0 else 0.0
+    costs = (1.0 + weight * penalty).astype(np.float32)
+    costs[distance == 0] = np.inf
+    return costs
+
+class ClearanceMap:
+    def __init__(self, distance, inflated, costs, params):
+        self.distance = distance
+        self.inflated = inflated
+        self.costs = costs
+        self.params = params
+
+    # Construye los tres mapas a partir de la rejilla de ocupación
+    @classmethod
+    def build(cls, grid, cell_size=CELL_SIZE, inflation_radius=INFLATION_RADIUS,
+              cost_distance=COST_DISTANCE, weight=COST_WEIGHT):
+        distance = distance_transform(grid)
+        return cls(distance, inflate_obstacles(distance, inflation_radius, cell_size),
+                   clearance_costs(distance, cell_size, cost_distance, weight),
+                   (cell_size, inflation_radius, cost_distance, weight))
+
+    @property
+    def shape(self):
+        return self.distance.shape
+
+    # Guarda los mapas con el hash del mapa y los parámetros para comprobar que siguen siendo válidos
+    def save(self, path, digest=''):
+        rows, cols = self.shape
+        with open(path, 'wb') as file:
+            np.savez(file, meta=np.array([VERSION, rows, cols]), params=np.array(self.params, dtype=np.float64),
+                     digest=np.frombuffer(digest.encode(), dtype=np.uint8), distance=self.distance,
+                     inflated=np.packbits(self.inflated, axis=1), costs=self.costs)
+
+# Fichero de los mapas de holgura de un mapa
+def clearance_path(map_file):
+    return os.path.splitext(map_file)[0] + '.clearance'
+
+# Función para leer los mapas guardados. Devuelve None si no existen o no corresponden al mapa
+# (hash o tamaño distintos) o a los parámetros indicados.
+def read_clearance(path, digest, params):
+    try:
+        with np.load(path) as archive:
+            meta = archive['meta'].tolist()
+            saved_params = tuple(archive['params'].tolist())
+            saved_digest = archive['digest'].tobytes().decode(errors='replace')
+            if meta[0] != VERSION or saved_digest != digest or saved_params != tuple(float(value) for value in params):
+                return None
+            rows, cols = meta[1], meta[2]
+            distance = archive['distance']
+            inflated = np.unpackbits(archive['inflated'], axis=1, count=cols)
+            costs = archive['costs']
+    except (OSError, ValueError, KeyError, IndexError):
+        return None
+    if distance.shape != (rows, cols) or inflated.shape != (rows, cols) or costs.shape != (rows, cols):
+        return None
+    return ClearanceMap(distance, inflated, costs, saved_params)
+
+# Función para obtener los mapas de holgura de un fichero de mapa: los de map.clearance si son
+# válidos y, si no, calculados y guardados junto al mapa.
+def load_clearance(map_file, grid, cell_size=CELL_SIZE, inflation_radius=INFLATION_RADIUS,
+                   cost_distance=COST_DISTANCE, weight=COST_WEIGHT):
+    params = (cell_size, inflation_radius, cost_distance, weight)
+    digest = grid_digest(grid)
+    path = clearance_path(map_file)
+    clearance = read_clearance(path, digest, params)
+    if clearance is None:
+        clearance = ClearanceMap.build(grid, *params)
+        try:
+            clearance.save(path, digest)
+        except OSError:
+            pass
+    return clearance
@@ -0,0 +1,189 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Índice de conectividad de los mapas de ocupación. Cada celda libre recibe la etiqueta de su
+componente conexa (4-conectividad) y los obstáculos la etiqueta 0, así que saber si hay ruta
+entre dos celdas es comparar dos etiquetas.
+
+El etiquetado es una unión-búsqueda vectorizada con NumPy: en cada ronda las raíces de los
+extremos de cada arista libre se enganchan a la menor de las dos y después se comprimen los
+caminos hasta que cada celda apunta a su raíz. Las aristas cuyos extremos ya comparten raíz
+se descartan, así que cada ronda trabaja con menos aristas.
+
+El mapa se etiqueta por bandas de BAND_ROWS filas con arrays int32, así que la memoria
+auxiliar es la de una banda y no la del mapa entero. Las componentes de cada banda reciben
+etiquetas provisionales, las aristas entre la última fila de una banda y la primera de la
+siguiente unen esas etiquetas con la misma unión-búsqueda y al final se renumeran.
+
+Las etiquetas se guardan comprimidas junto al mapa (map.csv -> map.labels) con un hash del
+contenido del mapa para detectar índices obsoletos.
+"""
+import hashlib
+import os
+from collections import deque
+
+import numpy as np
+
+from occupancy_grid import BAND_ROWS, iter_bands
+
+# Función para unir los nodos 0..size-1 con las aristas (u[i], v[i]). Devuelve para cada nodo
+# la raíz de su componente, que es el menor nodo de la componente.
+def union_roots(size, u, v):
+    parent = np.arange(size, dtype=np.int32)
+    while u.size:
+        root_u = parent[u]
+        root_v = parent[v]
+        pending = root_u != root_v
+        u, v = u[pending], v[pending]
+        if not u.size:
+            break
+        root_u, root_v = root_u[pending], root_v[pending]
+        # Enganchar la raíz mayor a la menor y comprimir hasta que todas apunten a su raíz
+        np.minimum.at(parent, np.maximum(root_u, root_v), np.minimum(root_u, root_v))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+# Función para etiquetar las componentes conexas de las celdas libres (valor 0) de la rejilla
+# (array, lista de listas u OccupancyGrid). Devuelve un array int32 del mismo tamaño: 0 en
+# obstáculos y 1..n en las celdas libres, numeradas por orden de su primera celda.
+def label_components(grid, band_rows=BAND_ROWS):
+    rows = len(grid)
+    cols = len(grid[0]) if rows else 0
+    labels = np.zeros((rows, cols), dtype=np.int32)
+    count = 0
+    links_u = []
+    links_v = []
+    for start, band in iter_bands(grid, band_rows):
+        free = band == 0
+        band_size = free.size
+        index = np.arange(band_size, dtype=np.int32).reshape(free.shape)
+        horizontal = free[:, :-1] & free[:, 1:]
+        vertical = free[:-1, :] & free[1:, :]
+        u = np.concatenate([index[:, :-1][horizontal], index[:-1, :][vertical]])
+        v = np.concatenate([index[:, 1:][horizontal], index[1:, :][vertical]])
+        del index, horizontal, vertical
+
+        # Etiquetas provisionales de la banda, a continuación de las de las bandas anteriores
+        free = free.ravel()
+        roots = union_roots(band_size, u, v)[free]
+        unique, local = np.unique(roots, return_inverse=True)
+        band_labels = np.zeros(band_size, dtype=np.int32)
+        band_labels[free] = local.astype(np.int32) + (count + 1)
+        labels[start:start + len(band)] = band_labels.reshape(band.shape)
+        count += len(unique)
+
+        # Aristas verticales entre la banda anterior y esta
+        if start > 0:
+            above, below = labels[start - 1], labels[start]
+            joined = (above != 0) & (below != 0)
+            links_u.append(above[joined])
+            links_v.append(below[joined])
+
+    if links_u:
+        # Etiqueta definitiva de cada provisional: la numeración de las raíces de las
+        # componentes que unen las bandas (la 0 de los obstáculos sigue siendo 0)
+        roots = union_roots(count + 1, np.concatenate(links_u), np.concatenate(links_v))
+        mapping = np.unique(roots, return_inverse=True)[1].astype(np.int32)
+        for start in range(0, rows, band_rows):
+            labels[start:start + band_rows] = mapping[labels[start:start + band_rows]]
+    return labels
+
+# Comprueba en O(1) si hay ruta entre dos celdas: ambas libres y en la misma componente.
+def connected(labels, start, goal):
+    label = labels[start[0]][start[1]]
+    return label != 0 and label == labels[goal[0]][goal[1]]
+
+# Función para reparar un mapa sin ruta entre start y goal quitando el menor número de
+# obstáculos posible (búsqueda 0-1: pasar por una celda libre cuesta 0 y por un obstáculo 1).
+# El borde exterior del mapa no se modifica. Devuelve la rejilla reparada (copia) y el número
+# de obstáculos eliminados.
+def repair_connectivity(grid, start, goal):
+    grid = np.array(grid, dtype=np.uint8)
+    rows, cols = grid.shape
+    interior = lambda cell: 0 < cell[0] < rows - 1 and 0 < cell[1] < cols - 1
+    if not (interior(start) and interior(goal)):
+        return grid, 0
+    grid[start] = 0
+    grid[goal] = 0
+    # Coste de entrar en cada celda: 0 libre, 1 obstáculo, 2 borde (no se puede atravesar).
+    # Como el borde nunca se expande, los vecinos ±1 y ±cols no se salen de la rejilla.
+    step_cost = (grid != 0).astype(np.uint8)
+    step_cost[0, :] = step_cost[-1, :] = step_cost[:, 0] = step_cost[:, -1] = 2
+    cells = step_cost.ravel().tolist()
+    size = rows * cols
+    offsets = (1, -1, cols, -cols)
+    start_index = start[0] * cols + start[1]
+    goal_index = goal[0] * cols + goal[1]
+    cost = [size] * size
+    came_from = [-1] * size
+    cost[start_index] = 0
+    queue = deque([start_index])
+    while queue:
+        current = queue.popleft()
+        if current == goal_index:
+            break
+        current_cost = cost[current]
+        for offset in offsets:
+            neighbor = current + offset
+            step = cells[neighbor]
+            if step < 2 and current_cost + step < cost[neighbor]:
+                cost[neighbor] = current_cost + step
+                came_from[neighbor] = current
+                if step:
+                    queue.append(neighbor)
+                else:
+                    queue.appendleft(neighbor)
+
+    removed = 0
+    current = goal_index
+    while current != start_index:
+        if cells[current]:
+            grid.flat[current] = 0
+            removed += 1
+        current = came_from[current]
+    return grid, removed
+
+# Hash del contenido de una rejilla 0/1 (independiente de si viene de CSV o de .ogm)
+def grid_digest(grid):
+    grid = np.asarray(grid) != 0
+    digest = hashlib.sha256(np.array(grid.shape, dtype=np.int64).tobytes())
+    digest.update(np.packbits(grid).tobytes())
+    return digest.hexdigest()
+
+# Fichero del índice de conectividad de un mapa
+def labels_path(map_file):
+    return os.path.splitext(map_file)[0] + '.labels'
+
+# Función para guardar las etiquetas (comprimidas) junto al hash del mapa.
+def write_labels(path, labels, digest):
+    with open(path, 'wb') as file:
+        np.savez_compressed(file, labels=np.asarray(labels, dtype=np.int32),
+                 digest=np.frombuffer(digest.encode(), dtype=np.uint8))
+
+# Función para leer las etiquetas guardadas. Devuelve None si no existen o si el hash no
+# corresponde al mapa indicado.
+def read_labels(path, digest):
+    try:
+        with np.load(path) as archive:
+            labels = archive['labels']
+            saved_digest = archive['digest'].tobytes().decode(errors='replace')
+    except (OSError, ValueError, KeyError):
+        return None
+    if saved_digest != digest:
+        return None
+    return labels
+
+# Función para obtener las etiquetas de un mapa: las del fichero .labels si son válidas y,
+# si no, calculadas en el momento (sin guardarlas).
+def load_labels(map_file, grid):
+    labels = read_labels(labels_path(map_file), grid_digest(grid))
+    if labels is None:
+        labels = label_components(grid)
+    return labels
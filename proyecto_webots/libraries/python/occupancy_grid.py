@@ -0,0 +1,393 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Rejilla de ocupación empaquetada en bits: un bit por celda en lugar de un entero de Python
+(listas de listas) o un float64 (genfromtxt), así que un mapa de 100 millones de celdas ocupa
+unos 12 MB.
+
+Cada fila se guarda en palabras uint64 (little endian): la columna c es el bit c % 64 de la
+palabra c // 64 de su fila, y los bits de relleno de la última palabra están siempre a 0.
+Con esta disposición:
+
+- Consultar o cambiar una celda es O(1).
+- Las búsquedas a lo largo de una fila (siguiente celda ocupada o libre) recorren 64 celdas
+  por palabra; las de columnas usan la rejilla traspuesta, que se calcula una vez y se
+  guarda hasta que la rejilla cambia.
+- Desplazar la rejilla una celda en cualquier dirección son desplazamientos de bits entre
+  palabras vecinas, con lo que la inflación (dilatación por el radio del robot) y las
+  máscaras de vecinos se calculan palabra a palabra.
+
+La conversión a y desde arrays uint8 se hace por bandas de BAND_ROWS filas para no
+desempaquetar nunca el mapa entero. np.asarray(rejilla) sigue funcionando (devuelve el array
+uint8 completo) para el código que necesita la rejilla desempaquetada.
+"""
+import math
+
+import numpy as np
+
+WORD = np.dtype('<u8')
+WORD_BITS = 64
+
+# Filas que se desempaquetan a la vez al convertir (múltiplo de 64 para trasponer por palabras)
+BAND_ROWS = 1024
+
+# Vecinos (fila, columna) en el orden de los bits de las máscaras de vecinos: el bit i de la
+# máscara corresponde a NEIGHBORS_8[i]. Los 4 primeros son los de 4-conectividad.
+NEIGHBORS_4 = ((0, 1), (0, -1), (1, 0), (-1, 0))
+NEIGHBORS_8 = NEIGHBORS_4 + ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+# Tabla para invertir el orden de los bits de un byte (np.packbits usa el bit más alto primero)
+REVERSE_BITS = np.array([int(f"{value:08b}"[::-1], 2) for value in range(256)], dtype=np.uint8)
+
+# Función para desplazar las columnas de un array de palabras (filas x palabras): el bit de la
+# columna c del resultado es el de la columna c + k del original (0 si queda fuera del array).
+# Con k negativo pueden quedar bits en el relleno, que hay que limpiar después.
+def shift_columns(words, k):
+    result = np.zeros_like(words)
+    count = words.shape[1]
+    quotient, rest = divmod(abs(k), WORD_BITS)
+    if quotient >= count:
+        return result
+    rest = np.uint64(rest)
+    carry = np.uint64(WORD_BITS) - rest
+    if k >= 0:
+        result[:, :count - quotient] = words[:, quotient:] >> rest
+        if rest:
+            result[:, :count - quotient - 1] |= words[:, quotient + 1:] << carry
+    else:
+        result[:, quotient:] = words[:, :count - quotient] << rest
+        if rest:
+            result[:, quotient + 1:] |= words[:, :count - quotient - 1] >> carry
+    return result
+
+# Función para contar los bits a 1 de un array de palabras.
+def popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    return int(np.unpackbits(np.ascontiguousarray(words).view(np.uint8)).sum(dtype=np.int64))
+
+# Función para recorrer una rejilla (OccupancyGrid, array o lista de listas) por bandas de
+# filas. Devuelve pares (primera fila, array uint8 de la banda).
+def iter_bands(grid, band_rows=BAND_ROWS):
+    if isinstance(grid, OccupancyGrid):
+        yield from grid.bands(band_rows)
+        return
+    rows = len(grid)
+    for start in range(0, rows, band_rows):
+        yield start, np.asarray(grid[start:start + band_rows], dtype=np.uint8)
+
+# Función para obtener una OccupancyGrid a partir de cualquier rejilla 0/1 (sin copiar si ya lo es).
+def as_occupancy_grid(grid):
+    if isinstance(grid, OccupancyGrid):
+        return grid
+    return OccupancyGrid.from_array(grid)
+
+class OccupancyGrid:
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.row_words = (cols + WORD_BITS - 1) // WORD_BITS
+        self.words = np.zeros((rows, self.row_words), dtype=WORD)
+        # Palabras de una fila con todas las columnas válidas a 1 (para limpiar el relleno)
+        self.valid = self.column_mask(0, cols)
+        self.transposed = None
+
+    # Rejilla a partir de un array o lista de listas 0/1 (cualquier valor distinto de 0 es obstáculo).
+    @classmethod
+    def from_array(cls, grid, band_rows=BAND_ROWS):
+        rows = len(grid)
+        result = cls(rows, len(grid[0]) if rows else 0)
+        for start, band in iter_bands(grid, band_rows):
+            result.set_rows(start, band)
+        return result
+
+    # Rejilla a partir de filas empaquetadas con np.packbits (ceil(columnas / 8) bytes por
+    # fila), como las de un .ogm con el flag de bits. 'packed' puede ser un memmap.
+    @classmethod
+    def from_packed(cls, packed, cols, bitorder='big', band_rows=BAND_ROWS):
+        result = cls(len(packed), cols)
+        size = (cols + 7) // 8
+        data = result.byte_view()
+        for start in range(0, result.rows, band_rows):
+            band = np.asarray(packed[start:start + band_rows], dtype=np.uint8)[:, :size]
+            if bitorder == 'big':
+                band = REVERSE_BITS[band]
+            data[start:start + len(band), :size] = band
+        if result.row_words:
+            result.words[:, -1] &= result.valid[-1]
+        return result
+
+    @property
+    def shape(self):
+        return (self.rows, self.cols)
+
+    @property
+    def size(self):
+        return self.rows * self.cols
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    # Vista de las palabras como bytes (filas x 8 * palabras), en el orden de np.packbits(bitorder='little')
+    def byte_view(self):
+        return self.words.view(np.uint8)
+
+    # Palabras de una fila con los bits de las columnas [start, stop) a 1.
+    def column_mask(self, start, stop):
+        bits = np.zeros(self.row_words * WORD_BITS, dtype=np.uint8)
+        bits[max(start, 0):max(min(stop, self.cols), 0)] = 1
+        return np.packbits(bits, bitorder='little').view(WORD)
+
+    def copy(self):
+        result = OccupancyGrid(self.rows, self.cols)
+        result.words[...] = self.words
+        return result
+
+    # Sustituye las filas desde 'start' por las de un array 0/1 (filas x columnas).
+    def set_rows(self, start, band):
+        band = np.asarray(band) != 0
+        if not self.row_words or not len(band):
+            return
+        packed = np.packbits(band, axis=1, bitorder='little')
+        self.byte_view()[start:start + len(band), :packed.shape[1]] = packed
+        self.transposed = None
+
+    # Array uint8 (0 libre, 1 obstáculo) de las filas [start, stop).
+    def band(self, start, stop):
+        start, stop = max(start, 0), min(stop, self.rows)
+        if stop <= start:
+            return np.zeros((0, self.cols), dtype=np.uint8)
+        return np.unpackbits(self.words[start:stop].view(np.uint8), axis=1, count=self.cols, bitorder='little')
+
+    def bands(self, band_rows=BAND_ROWS):
+        for start in range(0, self.rows, band_rows):
+            yield start, self.band(start, start + band_rows)
+
+    # Filas [start, stop) empaquetadas con np.packbits (ceil(columnas / 8) bytes por fila).
+    def packed_rows(self, start, stop, bitorder='big'):
+        band = self.byte_view()[start:stop, :(self.cols + 7) // 8]
+        return REVERSE_BITS[band] if bitorder == 'big' else band.copy()
+
+    def to_array(self):
+        return self.band(0, self.rows)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.to_array()
+        return array if dtype is None else array.astype(dtype)
+
+    def __len__(self):
+        return self.rows
+
+    # rejilla[fila, columna] es la celda (0 o 1), rejilla[fila] la fila como array uint8 y
+    # rejilla[a:b] las filas a..b-1, para que las funciones que recorren listas de listas
+    # o arrays acepten también una OccupancyGrid.
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.get(*key)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.rows)
+            if step != 1:
+                raise IndexError("OccupancyGrid solo admite cortes de filas consecutivas")
+            return self.band(start, stop)
+        row = key + self.rows if key < 0 else key
+        if not 0 <= row < self.rows:
+            raise IndexError(f"fila {key} fuera de la rejilla de {self.rows} filas")
+        return self.band(row, row + 1)[0]
+
+    def __setitem__(self, key, value):
+        self.set(*key, value)
+
+    def __iter__(self):
+        for _, band in self.bands():
+            yield from band
+
+    def __eq__(self, other):
+        return isinstance(other, OccupancyGrid) and self.shape == other.shape and np.array_equal(self.words, other.words)
+
+    def __or__(self, other):
+        result = self.copy()
+        result.words |= other.words
+        return result
+
+    def __and__(self, other):
+        result = self.copy()
+        result.words &= other.words
+        return result
+
+    def __invert__(self):
+        result = self.copy()
+        np.invert(result.words, out=result.words)
+        result.words &= result.valid
+        return result
+
+    def inside(self, row, col):
+        return 0 <= row < self.rows and 0 <= col < self.cols
+
+    # Celda (fila, columna): 1 si está ocupada, 0 si está libre. Los índices pueden ser enteros
+    # de NumPy (por ejemplo de np.nonzero), que se convierten a int para operar con los bits.
+    def get(self, row, col):
+        row, col = int(row), int(col)
+        if not self.inside(row, col):
+            raise IndexError(f"celda {(row, col)} fuera de la rejilla de {self.rows}x{self.cols}")
+        return (int(self.words[row, col >> 6]) >> (col & 63)) & 1
+
+    def set(self, row, col, value):
+        row, col = int(row), int(col)
+        if not self.inside(row, col):
+            raise IndexError(f"celda {(row, col)} fuera de la rejilla de {self.rows}x{self.cols}")
+        bit = np.uint64(1 << (col & 63))
+        if value:
+            self.words[row, col >> 6] |= bit
+        else:
+            self.words[row, col >> 6] &= ~bit
+        self.transposed = None
+
+    # Número de celdas ocupadas.
+    def count(self):
+        return popcount(self.words)
+
+    # Primera columna >= col de la fila con el valor buscado (ocupada o libre), o el número de
+    # columnas si no hay ninguna. Se buscan primero las palabras no nulas y después el bit.
+    def next_in_row(self, row, col, occupied=True):
+        col = max(col, 0)
+        if col >= self.cols:
+            return self.cols
+        first = col >> 6
+        chunk = self.words[row, first:].copy()
+        if not occupied:
+            np.invert(chunk, out=chunk)
+            chunk &= self.valid[first:]
+        chunk[0] &= np.uint64(~((1 << (col & 63)) - 1) & 0xFFFFFFFFFFFFFFFF)
+        nonzero = np.flatnonzero(chunk)
+        if not nonzero.size:
+            return self.cols
+        word = int(chunk[nonzero[0]])
+        return ((first + int(nonzero[0])) << 6) + (word & -word).bit_length() - 1
+
+    # Última columna <= col de la fila con el valor buscado, o -1 si no hay ninguna.
+    def prev_in_row(self, row, col, occupied=True):
+        col = min(col, self.cols - 1)
+        if col < 0:
+            return -1
+        last = col >> 6
+        chunk = self.words[row, :last + 1].copy()
+        if not occupied:
+            np.invert(chunk, out=chunk)
+        chunk[-1] &= np.uint64((2 << (col & 63)) - 1)
+        nonzero = np.flatnonzero(chunk)
+        if not nonzero.size:
+            return -1
+        index = int(nonzero[-1])
+        return (index << 6) + int(chunk[index]).bit_length() - 1
+
+    # Rejilla traspuesta (columnas x filas). Se traspone por bandas de filas múltiplo de 64,
+    # así que cada banda rellena palabras completas de la traspuesta.
+    def transpose(self, band_rows=BAND_ROWS):
+        band_rows = max(WORD_BITS, band_rows // WORD_BITS * WORD_BITS)
+        result = OccupancyGrid(self.cols, self.rows)
+        data = result.byte_view()
+        for start, band in self.bands(band_rows):
+            if not self.cols:
+                break
+            packed = np.packbits(band.T, axis=1, bitorder='little')
+            data[:, start // 8:start // 8 + packed.shape[1]] = packed
+        return result
+
+    # Traspuesta guardada para las búsquedas por columnas (se descarta al cambiar la rejilla).
+    def columns(self):
+        if self.transposed is None:
+            self.transposed = self.transpose()
+        return self.transposed
+
+    # Primera fila >= row de la columna con el valor buscado, o el número de filas si no hay ninguna.
+    def next_in_column(self, row, col, occupied=True):
+        return self.columns().next_in_row(col, row, occupied)
+
+    # Última fila <= row de la columna con el valor buscado, o -1 si no hay ninguna.
+    def prev_in_column(self, row, col, occupied=True):
+        return self.columns().prev_in_row(col, row, occupied)
+
+    # Rejilla desplazada: la celda (f, c) del resultado es la (f + dr, c + dc) de esta.
+    # Las celdas que caen fuera valen 'fill' (1 por defecto: fuera del mapa hay pared).
+    def shifted(self, dr, dc, fill=1):
+        result = OccupancyGrid(self.rows, self.cols)
+        first, last = max(0, -dr), min(self.rows, self.rows - dr)
+        if first < last:
+            result.words[first:last] = shift_columns(self.words[first + dr:last + dr], dc)
+        if fill:
+            outside = ~self.column_mask(-dc, self.cols - dc) & self.valid
+            result.words[first:last] |= outside
+            result.words[:first] = self.valid
+            result.words[max(last, first):] = self.valid
+        result.words &= self.valid
+        return result
+
+    # Máscara de vecinos ocupados de una celda: bit i a 1 si NEIGHBORS_8[i] está ocupado o
+    # fuera del mapa.
+    def neighbor_mask(self, row, col):
+        mask = 0
+        for bit, (dr, dc) in enumerate(NEIGHBORS_8):
+            if not self.inside(row + dr, col + dc) or self.get(row + dr, col + dc):
+                mask |= 1 << bit
+        return mask
+
+    # Máscaras de vecinos (como neighbor_mask) de todas las celdas de las filas [start, stop),
+    # como array uint8.
+    def neighbor_masks(self, start, stop):
+        start, stop = max(start, 0), min(stop, self.rows)
+        count = max(stop - start, 0)
+        block = np.ones((count + 2, self.cols + 2), dtype=np.uint8)
+        block[1:-1, 1:-1] = self.band(start, stop)
+        if start > 0:
+            block[0, 1:-1] = self.band(start - 1, start)[0]
+        if stop < self.rows:
+            block[-1, 1:-1] = self.band(stop, stop + 1)[0]
+        masks = np.zeros((count, self.cols), dtype=np.uint8)
+        for bit, (dr, dc) in enumerate(NEIGHBORS_8):
+            masks |= block[1 + dr:1 + dr + count, 1 + dc:1 + dc + self.cols] << bit
+        return masks
+
+    # Rejilla inflada: se marcan como ocupadas las celdas cuyo centro está a una distancia
+    # <= radius (en celdas) del centro de alguna celda ocupada. Para cada desplazamiento
+    # vertical dy se necesita la dilatación horizontal de semiancho floor(sqrt(r² - dy²)); las
+    # dilataciones horizontales se construyen de menor a mayor duplicando el alcance con
+    # desplazamientos de palabras y después cada fila es el OR de las filas vecinas dilatadas.
+    # Fuera del mapa no hay obstáculos que inflar.
+    def inflate(self, radius):
+        reach = int(math.floor(radius + 1e-9))
+        result = self.copy()
+        if reach <= 0 or not self.rows:
+            return result
+        spans = [int(math.floor(math.sqrt(max(radius * radius - dy * dy, 0.0)) + 1e-9)) for dy in range(reach + 1)]
+        horizontal = {}
+        words, width = self.words, 0
+        for span in sorted(set(spans)):
+            while width < span:
+                step = min(width + 1, span - width)
+                words = words | shift_columns(words, step) | shift_columns(words, -step)
+                width += step
+            horizontal[span] = words
+        for dy in range(-reach, reach + 1):
+            if abs(dy) >= self.rows:
+                continue
+            source = horizontal[spans[abs(dy)]]
+            if dy >= 0:
+                result.words[:self.rows - dy] |= source[dy:]
+            else:
+                result.words[-dy:] |= source[:self.rows + dy]
+        result.words &= self.valid
+        return result
+
+    # Array plano de ocupación con un borde de paredes para los planificadores (ver
+    # grid_astar.flatten_maze). Devuelve el bytearray y el ancho de cada fila aplanada.
+    def flatten(self):
+        width = self.cols + 2
+        flat = bytearray(b'\x01') * (width * (self.rows + 2))
+        view = np.frombuffer(flat, dtype=np.uint8).reshape(self.rows + 2, width)
+        for start, band in self.bands():
+            view[1 + start:1 + start + len(band), 1:-1] = band
+        return flat, width
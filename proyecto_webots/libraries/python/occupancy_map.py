@@ -0,0 +1,184 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Formato binario de mapas de ocupación (.ogm) para no tener que parsear el CSV en cada
+arranque. El fichero tiene una cabecera de 64 bytes seguida de la rejilla:
+
+    magic b'OGM1' | versión (uint16) | flags (uint16, bit 0 = empaquetado en bits)
+    | filas, columnas (uint32) | resolución [celdas/metro], origen x, origen y (float64)
+    | relleno hasta 64 bytes
+
+La rejilla va fila a fila, un byte por celda (0 libre, 1 obstáculo) o, con el flag de bits,
+ceil(columnas / 8) bytes por fila (np.packbits). La lectura usa numpy.memmap, así que un mapa
+de bytes se abre sin copiarlo a memoria.
+
+Uso como script para convertir entre CSV y .ogm:
+
+    python occupancy_map.py to-ogm map.csv [map.ogm] [--bits]
+    python occupancy_map.py to-csv map.ogm [map.csv]
+"""
+import argparse
+import os
+import struct
+
+import numpy as np
+
+from occupancy_grid import OccupancyGrid, iter_bands
+
+MAGIC = b'OGM1'
+VERSION = 1
+FLAG_BITS = 1
+HEADER = struct.Struct('<4sHHIIddd')
+HEADER_SIZE = 64
+
+# Resolución por defecto, igual que en el generador de mapas [celda/metro]
+RESOLUTION = 4.0
+
+# Filas que se escriben a la vez
+BAND_ROWS = 1024
+
+# Función para leer solo la cabecera de un mapa .ogm.
+def read_header(path):
+    with open(path, 'rb') as file:
+        data = file.read(HEADER_SIZE)
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: fichero demasiado corto para un mapa .ogm")
+    magic, version, flags, rows, cols, resolution, origin_x, origin_y = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: no es un mapa .ogm (versión {VERSION})")
+    return {
+        'rows': rows,
+        'cols': cols,
+        'bit_packed': bool(flags & FLAG_BITS),
+        'resolution': resolution,
+        'origin': (origin_x, origin_y),
+    }
+
+# Función para guardar una rejilla 0/1 (array, lista de listas u OccupancyGrid) en formato .ogm.
+# Se escribe por bandas de filas; una OccupancyGrid con el flag de bits se escribe desde sus
+# palabras sin desempaquetarla.
+def write_occupancy(path, grid, resolution=RESOLUTION, origin=(0.0, 0.0), bit_packed=False):
+    if not isinstance(grid, OccupancyGrid):
+        grid = np.asarray(grid)
+    rows, cols = grid.shape
+    header = HEADER.pack(MAGIC, VERSION, FLAG_BITS if bit_packed else 0, rows, cols,
+                         float(resolution), float(origin[0]), float(origin[1]))
+    with open(path, 'wb') as file:
+        file.write(header.ljust(HEADER_SIZE, b'\0'))
+        if bit_packed and isinstance(grid, OccupancyGrid):
+            for start in range(0, rows, BAND_ROWS):
+                file.write(grid.packed_rows(start, start + BAND_ROWS).tobytes())
+            return
+        for _, band in iter_bands(grid):
+            cells = (band != 0).astype(np.uint8)
+            if bit_packed:
+                cells = np.packbits(cells, axis=1)
+            file.write(np.ascontiguousarray(cells).tobytes())
+
+# Función para leer un mapa .ogm. Devuelve la rejilla uint8 (filas x columnas) y la cabecera.
+# Si el mapa está en bytes la rejilla es un memmap de solo lectura; si está en bits se
+# desempaqueta a partir del memmap de los bytes empaquetados.
+def read_occupancy(path):
+    info = read_header(path)
+    rows, cols = info['rows'], info['cols']
+    if rows == 0 or cols == 0:
+        return np.zeros((rows, cols), dtype=np.uint8), info
+    if info['bit_packed']:
+        packed = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=(rows, (cols + 7) // 8))
+        grid = np.unpackbits(packed, axis=1, count=cols)
+    else:
+        grid = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=(rows, cols))
+    return grid, info
+
+# Función para leer un mapa .ogm como OccupancyGrid (un bit por celda). Devuelve la rejilla y
+# la cabecera. Un mapa en bits se copia del memmap sin desempaquetarlo; uno en bytes se
+# empaqueta por bandas.
+def read_occupancy_grid(path):
+    info = read_header(path)
+    rows, cols = info['rows'], info['cols']
+    if rows == 0 or cols == 0:
+        return OccupancyGrid(rows, cols), info
+    if info['bit_packed']:
+        packed = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=(rows, (cols + 7) // 8))
+        return OccupancyGrid.from_packed(packed, cols), info
+    cells = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=(rows, cols))
+    return OccupancyGrid.from_array(cells), info
+
+# Función para cargar un CSV 0/1 como array uint8 sin pasar por genfromtxt.
+# Los dígitos se extraen directamente de los bytes del fichero; si el CSV tiene otros valores
+# se recurre a genfromtxt.
+def load_occupancy_csv(path):
+    with open(path, 'rb') as file:
+        data = np.frombuffer(file.read(), dtype=np.uint8)
+    rows = int(np.count_nonzero(data == ord('\n')))
+    if data.size and data[-1] != ord('\n'):
+        rows += 1
+    digits = data[(data >= ord('0')) & (data <= ord('9'))]
+    separators = int(np.count_nonzero(data == ord(',')))
+    if rows == 0 or digits.size != separators + rows or digits.size % rows:
+        return (np.genfromtxt(path, delimiter=',') != 0).astype(np.uint8)
+    return (digits != ord('0')).astype(np.uint8).reshape(rows, digits.size // rows)
+
+# Función para guardar una rejilla 0/1 en CSV con el mismo formato que csv.writer ("\r\n").
+# Se compone y escribe por bandas de filas.
+def write_occupancy_csv(path, grid):
+    if not isinstance(grid, OccupancyGrid):
+        grid = np.asarray(grid)
+    with open(path, 'wb') as file:
+        for _, band in iter_bands(grid):
+            rows, cols = band.shape
+            text = np.full((rows, 2 * cols + 1), ord(','), dtype=np.uint8)
+            text[:, 0:-1:2] = (band != 0) + ord('0')
+            text[:, -2] = ord('\r')
+            text[:, -1] = ord('\n')
+            file.write(text.tobytes())
+
+# Función para cargar un mapa en cualquiera de los dos formatos según su extensión.
+def load_occupancy(path):
+    if path.endswith('.ogm'):
+        return read_occupancy(path)[0]
+    return load_occupancy_csv(path)
+
+# Función para cargar un mapa en cualquiera de los dos formatos como OccupancyGrid.
+def load_occupancy_grid(path):
+    if path.endswith('.ogm'):
+        return read_occupancy_grid(path)[0]
+    return OccupancyGrid.from_array(load_occupancy_csv(path))
+
+# Convertidor de CSV a .ogm. Devuelve la ruta del fichero generado.
+def csv_to_occupancy(csv_path, ogm_path=None, bit_packed=False, resolution=RESOLUTION, origin=(0.0, 0.0)):
+    if ogm_path is None:
+        ogm_path = os.path.splitext(csv_path)[0] + '.ogm'
+    write_occupancy(ogm_path, load_occupancy_csv(csv_path), resolution, origin, bit_packed)
+    return ogm_path
+
+# Convertidor de .ogm a CSV. Devuelve la ruta del fichero generado.
+def occupancy_to_csv(ogm_path, csv_path=None):
+    if csv_path is None:
+        csv_path = os.path.splitext(ogm_path)[0] + '.csv'
+    write_occupancy_csv(csv_path, read_occupancy(ogm_path)[0])
+    return csv_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversión entre mapas CSV y .ogm")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    to_ogm = subparsers.add_parser("to-ogm", help="Convertir un CSV a .ogm")
+    to_ogm.add_argument("source")
+    to_ogm.add_argument("target", nargs="?", default=None)
+    to_ogm.add_argument("--bits", action="store_true", help="Empaquetar un bit por celda")
+    to_ogm.add_argument("--resolution", type=float, default=RESOLUTION, help="Celdas por metro")
+    to_csv = subparsers.add_parser("to-csv", help="Convertir un .ogm a CSV")
+    to_csv.add_argument("source")
+    to_csv.add_argument("target", nargs="?", default=None)
+    args = parser.parse_args()
+
+    if args.command == "to-ogm":
+        print(csv_to_occupancy(args.source, args.target, args.bits, args.resolution))
+    else:
+        print(occupancy_to_csv(args.source, args.target))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Autor: Fernando Vela Hidalgo (https://github.com/fervh)
+Asignatura: Simuladores de Robots
+Universidad: Universidad Carlos III de Madrid (UC3M)
+Fecha: Febrero 2024
+
+Instrumentación por paso de los controladores: tramos con nombre (lectura de sensores,
+decisión, impresión...), histogramas de su duración y contadores (transiciones de estado,
+replanificaciones, celdas alcanzadas...).
+
+Se activa con la variable de entorno CONTROLLER_PROFILE: '1' escribe los ficheros en el
+directorio actual con el prefijo 'profile' y cualquier otro valor se usa como prefijo.
+Sin la variable, make_profiler() devuelve un perfilador vacío cuyos métodos no hacen nada,
+así que la instrumentación queda en el código sin coste apreciable.
+
+Al salir del proceso (o con dump_all()) cada perfilador escribe:
+
+- <prefijo>_<controlador>.csv: una fila por tramo (número, total, media y máximo en ns e
+  histograma con cubetas de potencias de 2: la cubeta i cuenta duraciones de 2^(i-1) a 2^i ns)
+  y una por contador. El tramo 'tick' es el ciclo completo entre dos llamadas a tick(),
+  incluido robot.step(); los tramos anidados cuentan su tiempo también en el de fuera.
+- <prefijo>_<controlador>.bin: traza de cada medida. Cabecera b'PRF1' y número de
+  registros (uint32), seguida de registros de tres uint64 (paso, id del tramo, duración en
+  ns) en little endian. Los ids de los tramos son los de la columna 'id' del CSV.
+"""
+import atexit
+import csv
+import os
+import struct
+import sys
+from array import array
+from time import perf_counter_ns
+
+# Variable de entorno que activa la instrumentación
+PROFILE_ENV = 'CONTROLLER_PROFILE'
+
+# Prefijo de los ficheros con CONTROLLER_PROFILE=1
+DEFAULT_PREFIX = 'profile'
+
+# Número de cubetas de los histogramas (2^39 ns son unos 9 minutos)
+HISTOGRAM_BUCKETS = 40
+
+TRACE_MAGIC = b'PRF1'
+TRACE_HEADER = struct.Struct('<4sI')
+
+# Perfiladores activos, que se vuelcan al salir del proceso
+ACTIVE = []
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+# Perfilador desactivado: misma interfaz que Profiler, sin hacer nada
+class NullProfiler:
+    enabled = False
+
+    def span(self, name):
+        return NULL_SPAN
+
+    def count(self, name, amount=1):
+        pass
+
+    def tick(self):
+        pass
+
+    def dump(self):
+        pass
+
+class Span:
+    __slots__ = ('profiler', 'id', 'start')
+
+    def __init__(self, profiler, span_id):
+        self.profiler = profiler
+        self.id = span_id
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.id, perf_counter_ns() - self.start)
+        return False
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, name, prefix=DEFAULT_PREFIX):
+        self.name = name
+        self.prefix = prefix
+        self.names = []
+        self.spans = {}
+        self.samples = []
+        self.totals = []
+        self.maxima = []
+        self.histograms = []
+        self.counters = {}
+        # Registros (paso, id, duración) de la traza
+        self.trace = array('Q')
+        self.ticks = 0
+        self.last_tick = None
+        self.dumped = False
+        self.tick_id = self.register('tick')
+
+    def register(self, name):
+        self.names.append(name)
+        self.samples.append(0)
+        self.totals.append(0)
+        self.maxima.append(0)
+        self.histograms.append([0] * HISTOGRAM_BUCKETS)
+        return len(self.names) - 1
+
+    # Tramo con nombre para usar con 'with'. Se reutiliza el mismo objeto para cada nombre,
+    # así que un tramo no puede anidarse dentro de sí mismo.
+    def span(self, name):
+        span = self.spans.get(name)
+        if span is None:
+            span = self.spans[name] = Span(self, self.register(name))
+        return span
+
+    def record(self, span_id, duration):
+        self.samples[span_id] += 1
+        self.totals[span_id] += duration
+        if duration > self.maxima[span_id]:
+            self.maxima[span_id] = duration
+        self.histograms[span_id][min(duration.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.trace.extend((self.ticks, span_id, duration))
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Marca el comienzo de un paso del bucle de control
+    def tick(self):
+        now = perf_counter_ns()
+        if self.last_tick is not None:
+            self.record(self.tick_id, now - self.last_tick)
+        self.ticks += 1
+        self.last_tick = now
+
+    def dump(self):
+        if self.dumped:
+            return
+        self.dumped = True
+        base = f"{self.prefix}_{self.name}"
+        with open(base + '.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['tipo', 'nombre', 'id', 'n', 'total_ns', 'media_ns', 'max_ns'] +
+                            [f"h{i}" for i in range(HISTOGRAM_BUCKETS)])
+            for span_id, name in enumerate(self.names):
+                n = self.samples[span_id]
+                writer.writerow(['tramo', name, span_id, n, self.totals[span_id],
+                                 self.totals[span_id] // n if n else 0, self.maxima[span_id]] +
+                                self.histograms[span_id])
+            writer.writerow(['contador', 'ticks', '', self.ticks, '', '', ''])
+            for name, value in self.counters.items():
+                writer.writerow(['contador', name, '', value, '', '', ''])
+        trace = self.trace
+        if sys.byteorder != 'little':
+            trace = array('Q', trace)
+            trace.byteswap()
+        with open(base + '.bin', 'wb') as file:
+            file.write(TRACE_HEADER.pack(TRACE_MAGIC, len(self.trace) // 3))
+            trace.tofile(file)
+
+# Función para crear el perfilador de un controlador según CONTROLLER_PROFILE.
+def make_profiler(name):
+    value = os.environ.get(PROFILE_ENV, '')
+    if value in ('', '0'):
+        return NullProfiler()
+    profiler = Profiler(name, DEFAULT_PREFIX if value == '1' else value)
+    ACTIVE.append(profiler)
+    return profiler
+
+# Función para volcar todos los perfiladores activos (se llama también al salir).
+def dump_all():
+    while ACTIVE:
+        ACTIVE.pop(0).dump()
+
+atexit.register(dump_all)